@@ -3,6 +3,7 @@ import sys
 import time
 import socket
 import threading
+from datetime import datetime
 
 # Agregar rutas adicionales para buscar módulos
 sys.path.append('/Library/Frameworks/Python.framework/Versions/3.13/lib/python3.13/site-packages')
@@ -16,10 +17,26 @@ except ImportError:
     sys.exit(1)
 
 import numpy as np
-from flask import Flask, Response, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, abort, send_from_directory
 from waitress import serve
 from camera import Camera
-from detector import PersonDetector
+from camera_registry import CameraRegistry
+from capture_scheduler import AdaptiveScheduler
+from detector import PersonDetector, generate_suggestion
+from inference import InferenceWorker
+from inference_pool import InferencePool
+from streaming import FrameBroadcaster
+from encoder import JpegEncoder
+from motion import MotionGate
+from tracker import ObjectTracker
+from roi import RegionSelector
+from snapshots import SnapshotCell, Settings, result_snapshot
+from result_cache import ResultCache
+from history_store import HistoryStore
+from recorder import EventRecorder
+from events import ResultEvents
+from metrics import metrics
+import asgi
 
 # Configuración de la aplicación
 app = Flask(__name__)
@@ -29,105 +46,493 @@ app.config['TEMPLATES_AUTO_RELOAD'] = True
 
 # Configuración global
 CAMERA_INDEX = 0
+CAMERA_SOURCES = [CAMERA_INDEX]  # índices de cámara, rutas de video, URLs rtsp:// o http:// o carpetas de imágenes; con varias se detecta por lotes. Con un diccionario {nombre: fuente} cada cámara se publica con su nombre (/video_feed/<nombre>, /api/<nombre>/status)
+CAMERA_PRIORITIES = {}  # {cámara: peso} para repartir la inferencia cuando no alcanza para todas (por defecto 1.0)
+MOTION_PRIORITY = 1.0  # peso extra de las cámaras con movimiento al repartir la inferencia (1.0 = el doble que una quieta)
 TEST_MODE = False  # Cambiado a False para usar la cámara real
 CONFIDENCE_THRESHOLD = 0.8
-AUTO_CAPTURE_INTERVAL = 5  # segundos
+CANDIDATE_FLOOR = 0.1  # confianza mínima de las candidatas que se conservan para cambiar el umbral sin volver a detectar
+INFERENCE_BACKEND = 'torch'  # 'torch', 'torchscript', 'onnx' (requiere onnxruntime) o 'int8'
+FAST_PREPROCESS = True  # preprocesar con NumPy/OpenCV en lugar de PIL y el procesador de Hugging Face
+INFERENCE_SIZE = 512  # lado más corto (px) de la imagen que recibe el modelo (DETR usa 800 por defecto)
+MODEL_CACHE = True  # guardar una copia del modelo en models/cache para arrancar rápido y sin red
+AUTO_CAPTURE_INTERVAL = 5  # segundos (con ADAPTIVE_CAPTURE, intervalo máximo de una cámara en reposo)
+ADAPTIVE_CAPTURE = True  # ajustar el ritmo de detección según lo que tarda el modelo, la carga del sistema y la actividad de cada cámara
+CPU_BUDGET = 0.5  # fracción máxima del tiempo que la inferencia puede estar ocupada con la detección automática
+MIN_CAPTURE_INTERVAL = 0.5  # segundos mínimos entre detecciones automáticas de una cámara
+PERSON_HOLD = 10  # segundos que una cámara se analiza más seguido después de ver una persona
 SHOW_BOUNDING_BOXES = True
+STREAM_FPS = 30  # frames por segundo máximos del bucle de captura
+IDLE_CAPTURE_FPS = 5  # frames por segundo que se decodifican sin clientes de video (el resto se descarta sin decodificar; al menos RECORD_FPS si se graban clips)
+JPEG_QUALITY = 80  # calidad JPEG del stream (1-100)
+STREAM_SCALE = 1.0  # escala de la resolución del stream (1.0 = tamaño original)
+JPEG_BACKEND = 'auto'  # 'auto', 'turbojpeg', 'simplejpeg' u 'opencv'
+ADAPTIVE_STREAM = True  # bajar calidad/resolución a los clientes que se atrasan
+DETECTION_TIMEOUT = 30  # segundos de espera máxima para una detección manual
+MAX_BATCH_SIZE = 4  # frames máximos por pasada del modelo
+BATCH_MAX_WAIT = 0.2  # segundos máximos esperando a completar un lote
+INFERENCE_PROCESSES = 0  # 0 = inferencia en este proceso; N > 0 = pool de N procesos, cada uno con su modelo
+INFERENCE_THREADS = None  # hilos de PyTorch por proceso del pool (None = núcleos repartidos entre los procesos)
+MOTION_GATE = True  # omitir la detección automática si la escena no cambió
+MOTION_THRESHOLD = 0.02  # fracción de píxeles que deben cambiar para volver a detectar
+TRACKING = True  # mover las cajas en cada frame entre detecciones y asignarles un id estable
+ROI_MODE = 'off'  # 'off', 'static' (sólo CAMERA_ROIS) o 'dynamic' (recorta alrededor de las últimas detecciones y del movimiento)
+CAMERA_ROIS = {}  # {cámara (nombre o posición): [polígono, ...]} con puntos (x, y) en píxeles o en fracciones del frame, p. ej. {0: [[(0.2, 0), (0.6, 0), (0.6, 1), (0.2, 1)]]}
+ROI_FULL_FRAME_INTERVAL = 10  # segundos máximos entre pasadas sobre el frame completo en el modo dinámico
+HISTORY_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'history.db')  # None para desactivar
+HISTORY_RETENTION_DAYS = 30  # días que se conserva el historial persistente
+RECORDINGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'clips')  # None para no grabar clips
+RECORD_FORMAT = 'avi'  # 'avi' (MJPEG) o 'mp4'
+RECORD_FPS = 10  # frames por segundo de los clips
+RECORD_PRE_ROLL = 5  # segundos anteriores a la aparición de una persona que se incluyen en el clip
+RECORD_POST_ROLL = 5  # segundos que se sigue grabando después de dejar de ver personas
+RECORDINGS_QUOTA_MB = 2048  # espacio máximo de los clips; al superarlo se borran los más antiguos
+RESULT_CACHE_SIZE = 256  # resultados guardados por hash perceptual del frame (0 = sin caché)
+RESULT_CACHE_TTL = 30  # segundos que puede reutilizarse un resultado guardado
+SERVER_MODE = 'waitress'  # 'waitress' o 'asgi' (requiere starlette y uvicorn; para muchos clientes de video)
+WAITRESS_THREADS = 8  # hilos de Waitress; cada cliente de /video_feed ocupa uno mientras está conectado
 
 # Instancias globales
-camera = None
+registry = CameraRegistry()  # cámaras con nombre, cada una con su pipeline (captura, stream, seguimiento, resultado)
 detector = None
-last_result = {
-    'boxes': [],
-    'labels': [],
-    'scores': [],
-    'has_person': False,
-    'suggestion': 'Inicializando...'
-}
-detection_lock = threading.Lock()
+inference_worker = None
+scheduler = None  # AdaptiveScheduler (None con ADAPTIVE_CAPTURE = False)
+history_store = None
+recorder = None
+events = ResultEvents()  # canal de eventos para /api/events
+settings = None  # SnapshotCell con la configuración común (umbral, cajas, presupuesto) que se cambia en ejecución
+
+def current_settings(pipeline=None):
+    """
+    Configuración actual visible en la interfaz
+    :param pipeline: CameraPipeline cuya configuración propia se incluye (por defecto, la primera cámara)
+    :return: Diccionario con la configuración
+    """
+    pipeline = pipeline or registry[0]
+    common = settings.get()
+    camera_settings = pipeline.settings.get()
+    return {
+        'test_mode': TEST_MODE,
+        'confidence': common.confidence,
+        'auto_capture': pipeline.camera.auto_capture,
+        'interval': pipeline.camera.auto_capture_interval,
+        'show_boxes': camera_settings.show_boxes,
+        'priority': camera_settings.priority,
+        'cpu_budget': common.cpu_budget if scheduler is not None else None
+    }
+
+def camera_sources():
+    """
+    Cámaras configuradas con su nombre
+    :return: Lista de tuplas (nombre, fuente); sin nombres explícitos se usa la posición
+    """
+    if isinstance(CAMERA_SOURCES, dict):
+        return [(str(name), source) for name, source in CAMERA_SOURCES.items()]
+    return [(str(position), source) for position, source in enumerate(CAMERA_SOURCES)]
+
+def camera_option(options, pipeline, default=None):
+    """
+    Valor de una opción por cámara (CAMERA_ROIS, CAMERA_PRIORITIES), indicada por nombre o por posición
+    :param options: Diccionario {cámara: valor}
+    :param pipeline: CameraPipeline de la cámara
+    :param default: Valor si la cámara no aparece
+    :return: Valor de la opción
+    """
+    if pipeline.name in options:
+        return options[pipeline.name]
+    return options.get(pipeline.id, default)
+
+def detection_payload(snapshot):
+    """
+    Contenido de un resultado tal como lo recibe la interfaz
+    :param snapshot: ResultSnapshot publicado
+    :return: Diccionario con estado, sugerencia, objetos e historial
+    """
+    return {
+        'has_person': snapshot.has_person,
+        'suggestion': snapshot.suggestion,
+        'objects': snapshot.objects,
+        'history': detector.get_history()
+    }
 
 def initialize_system():
-    """Inicializa la cámara y el detector"""
-    global camera, detector
-    camera = Camera(camera_index=CAMERA_INDEX, test_mode=TEST_MODE)
-    detector = PersonDetector(confidence_threshold=CONFIDENCE_THRESHOLD)
-    
-    # Mostrar información sobre la cámara activa
-    if camera.test_mode:
-        print("\n📸 Modo de prueba: ✓ Activo (usando imágenes estáticas)")
+    """Inicializa las cámaras y el detector"""
+    global detector, inference_worker, scheduler, history_store, recorder, settings
+    
+    settings = SnapshotCell(Settings(0, CONFIDENCE_THRESHOLD, SHOW_BOUNDING_BOXES, CPU_BUDGET))
+    
+    # Historial persistente, escrito por su propio hilo
+    if HISTORY_DB:
+        history_store = HistoryStore(HISTORY_DB, retention_days=HISTORY_RETENTION_DAYS)
+        history_store.start()
+    
+    # Clips de los eventos con personas, también escritos por su propio hilo
+    if RECORDINGS_DIR:
+        recorder = EventRecorder(
+            RECORDINGS_DIR,
+            JpegEncoder(quality=JPEG_QUALITY, backend=JPEG_BACKEND),
+            fps=RECORD_FPS,
+            pre_roll=RECORD_PRE_ROLL,
+            post_roll=RECORD_POST_ROLL,
+            quota_mb=RECORDINGS_QUOTA_MB,
+            clip_format=RECORD_FORMAT
+        )
+        recorder.start()
+    
+    # Los frames casi idénticos a uno ya analizado reutilizan su resultado sin pasar por el modelo
+    result_cache = ResultCache(max_size=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL) if RESULT_CACHE_SIZE > 0 else None
+    
+    # El modelo se carga (y se precalienta) en segundo plano: el servidor atiende
+    # peticiones desde el primer momento y /api/status informa del progreso
+    if INFERENCE_PROCESSES > 0:
+        # Pool de procesos: cada uno con su modelo y sus núcleos, fuera del GIL del servidor
+        detector = InferencePool(
+            processes=INFERENCE_PROCESSES,
+            threads_per_process=INFERENCE_THREADS,
+            confidence_threshold=CONFIDENCE_THRESHOLD,
+            backend=INFERENCE_BACKEND,
+            fast_preprocess=FAST_PREPROCESS,
+            inference_size=INFERENCE_SIZE,
+            history_store=history_store,
+            slots=MAX_BATCH_SIZE,
+            model_cache=MODEL_CACHE,
+            background=True,
+            on_status=publish_model_status,
+            result_cache=result_cache,
+            candidate_floor=CANDIDATE_FLOOR,
+            on_inference=record_inference
+        )
     else:
-        # Intentar obtener información de la cámara
-        try:
-            if camera.camera:
-                # Obtener propiedades de la cámara si está disponible
-                print(f"\n📸 Modo de prueba: ✗ Inactivo ({camera.camera_info})")
-            else:
-                print("\n📸 Modo de prueba: ✗ Inactivo (No se pudo inicializar la cámara)")
-        except:
-            print("\n📸 Modo de prueba: ✗ Inactivo (Error al obtener información de la cámara)")
-    
-    # Iniciar la captura automática
-    camera.set_auto_capture(True, AUTO_CAPTURE_INTERVAL)
-
-def generate_frames():
-    """Generador para el streaming de video"""
-    global last_result
+        detector = PersonDetector(
+            confidence_threshold=CONFIDENCE_THRESHOLD,
+            backend=INFERENCE_BACKEND,
+            fast_preprocess=FAST_PREPROCESS,
+            inference_size=INFERENCE_SIZE,
+            history_store=history_store,
+            model_cache=MODEL_CACHE,
+            background=True,
+            on_status=publish_model_status,
+            result_cache=result_cache,
+            candidate_floor=CANDIDATE_FLOOR,
+            on_inference=record_inference
+        )
+    
+    registry.motion_weight = MOTION_PRIORITY
+    for name, source in camera_sources():
+        cam = Camera(camera_index=source, test_mode=TEST_MODE, name=name)
+        encoder = JpegEncoder(quality=JPEG_QUALITY, scale=STREAM_SCALE, backend=JPEG_BACKEND)
+        cam.encoder = encoder
+        gate = MotionGate(threshold=MOTION_THRESHOLD)
+        gate.enabled = MOTION_GATE
+        pipeline = registry.add(name, cam, FrameBroadcaster(encoder, adaptive=ADAPTIVE_STREAM), gate,
+                                ObjectTracker(), None, show_boxes=SHOW_BOUNDING_BOXES)
+        pipeline.region = RegionSelector(camera_option(CAMERA_ROIS, pipeline), mode=ROI_MODE,
+                                         full_frame_interval=ROI_FULL_FRAME_INTERVAL)
+        pipeline.configure(priority=float(camera_option(CAMERA_PRIORITIES, pipeline, 1.0)))
+        
+        # Mostrar información sobre la cámara activa
+        if cam.test_mode:
+            print(f"\n📸 Cámara {name} - Modo de prueba: ✓ Activo (usando imágenes estáticas)")
+        else:
+            # Intentar obtener información de la cámara
+            try:
+                if cam.camera:
+                    # Obtener propiedades de la cámara si está disponible
+                    print(f"\n📸 Cámara {name} - Modo de prueba: ✗ Inactivo ({cam.camera_info})")
+                else:
+                    print(f"\n📸 Cámara {name} - Modo de prueba: ✗ Inactivo (No se pudo inicializar la cámara)")
+            except:
+                print(f"\n📸 Cámara {name} - Modo de prueba: ✗ Inactivo (Error al obtener información de la cámara)")
+        
+        # Iniciar la captura automática y el hilo de lectura continua de la cámara
+        cam.set_auto_capture(True, AUTO_CAPTURE_INTERVAL)
+        cam.start()
+    
+    # La detección se ejecuta en su propio hilo para no congelar el streaming;
+    # todas las cámaras comparten el modelo y la cola: sus frames se agrupan en lotes,
+    # con el pool cada proceso atiende un lote distinto a la vez y, si no hay capacidad
+    # para todas, se reparte según la prioridad y el movimiento de cada cámara
+    inference_worker = InferenceWorker(
+        detect_objects_in_frames,
+        batch_size=min(MAX_BATCH_SIZE, len(registry)),
+        max_wait=BATCH_MAX_WAIT,
+        concurrency=max(1, INFERENCE_PROCESSES),
+        weight_fn=registry.weight
+    )
+    inference_worker.start()
+    
+    # Ritmo de la detección automática: dentro de CPU_BUDGET, más rápido en las cámaras
+    # con personas o movimiento y más lento en las que están quietas
+    if ADAPTIVE_CAPTURE:
+        scheduler = AdaptiveScheduler(
+            cpu_budget=CPU_BUDGET,
+            min_interval=MIN_CAPTURE_INTERVAL,
+            max_interval=AUTO_CAPTURE_INTERVAL,
+            workers=max(1, INFERENCE_PROCESSES),
+            person_hold=PERSON_HOLD
+        )
+    
+    register_metrics()
+    
+    # Estado inicial del canal de eventos
+    events.publish('settings', current_settings())
+    for pipeline in registry:
+        events.publish('detection', detection_payload(pipeline.result.get()), pipeline.id)
+    
+    # Un único hilo por cámara lee los frames y alimenta a todos los clientes de su stream
+    for pipeline in registry:
+        pipeline.thread = threading.Thread(target=capture_loop, args=(pipeline.id,),
+                                           name=f"capture-loop-{pipeline.name}", daemon=True)
+        pipeline.thread.start()
+
+def record_inference(seconds, frames):
+    """
+    Registra en el planificador lo que tardó el modelo en analizar unos frames
+    (sólo los que llegaron al modelo: los que responde la caché no consumen CPU)
+    :param seconds: Duración de la pasada
+    :param frames: Frames analizados
+    """
+    if scheduler is not None:
+        scheduler.record_detection(seconds, frames)
+
+def publish_model_status(status):
+    """
+    Publica el estado de carga del modelo en el canal de eventos
+    :param status: Diccionario devuelto por get_status() del detector
+    """
+    events.publish('model', status)
+    if status['state'] == 'ready':
+        print(f"🧠 Modelo listo ({status['backend']}, {status['load_seconds']} s)")
+
+def register_metrics():
+    """Registra las métricas que se leen al consultarlas (colas, clientes, frames perdidos)"""
+    metrics.register_callback('inference_queue_depth', inference_worker.pending_count)
+    metrics.register_callback('inference_dropped_frames_total', lambda: inference_worker.dropped_frames)
+    for pipeline in registry:
+        stream, cam, name = pipeline.stream, pipeline.camera, pipeline.name
+        metrics.register_callback('stream_clients', lambda stream=stream: stream.subscribers, camera=name)
+        metrics.register_callback(
+            'stream_skipped_frames_total',
+            lambda stream=stream: sum(client['skipped'] for client in stream.get_client_stats()),
+            camera=name)
+        metrics.register_callback('source_fps', lambda cam=cam: (cam.get_source_stats() or {}).get('fps', 0),
+                                  camera=name)
+        metrics.register_callback('source_skipped_frames_total',
+                                  lambda cam=cam: (cam.get_source_stats() or {}).get('skipped', 0),
+                                  camera=name)
+        metrics.register_callback('source_reconnects_total',
+                                  lambda cam=cam: (cam.get_source_stats() or {}).get('reconnects', 0),
+                                  camera=name)
+        if scheduler is not None:
+            metrics.register_callback('detection_interval_seconds',
+                                      lambda camera_id=pipeline.id: scheduler.get_stats(camera_id).get('interval', 0),
+                                      camera=name)
+        metrics.register_callback('inference_share',
+                                  lambda camera_id=pipeline.id: inference_worker.get_schedule()
+                                  .get(camera_id, {}).get('share', 0.0),
+                                  camera=name)
+    if scheduler is not None:
+        metrics.register_callback('inference_cpu_usage', lambda: scheduler.get_stats()['usage'])
+    if history_store is not None:
+        metrics.register_callback('history_queue_depth', history_store.queue.qsize)
+        metrics.register_callback('history_dropped_total', lambda: history_store.dropped)
+    if recorder is not None:
+        metrics.register_callback('recorder_queue_depth', recorder.queue.qsize)
+        metrics.register_callback('recorder_dropped_frames_total', lambda: recorder.dropped)
+        metrics.register_callback('recorder_clips_total', lambda: recorder.clips_written)
+    cache = detector.result_cache
+    if cache is not None:
+        metrics.register_callback('result_cache_hits_total', lambda: cache.hits)
+        metrics.register_callback('result_cache_misses_total', lambda: cache.misses)
+        metrics.register_callback('result_cache_size', lambda: len(cache.entries))
+
+def capture_loop(camera_id):
+    """
+    Bucle productor: único consumidor del hilo de captura de una cámara.
+    Anota cada frame una sola vez y lo difunde a todos los clientes.
+    :param camera_id: Posición de la cámara en el registro
+    """
+    pipeline = registry[camera_id]
+    camera = pipeline.camera
+    stream = pipeline.stream
+    motion_gate = pipeline.motion_gate
+    tracker = pipeline.tracker
+    frame_period = 1.0 / STREAM_FPS
+    idle_fps = max(IDLE_CAPTURE_FPS, RECORD_FPS) if recorder is not None else IDLE_CAPTURE_FPS
+    sequence = 0
     
     while True:
-        # Leer un frame de la cámara
-        success, frame = camera.read()
+        start_time = time.time()
+        
+        # Esperar el siguiente frame del hilo de captura (inmutable: se puede publicar, enviar
+        # al detector o grabar sin copiarlo, porque el hilo de captura no lo vuelve a escribir)
+        sequence, _, frame = camera.wait_for_newer(sequence, timeout=1.0)
+        success = frame is not None
         if not success:
-            print("Error: No se pudo leer de la cámara")
+            print(f"Error: No se pudo leer de la cámara {pipeline.name}")
             # Generar un frame en blanco
             frame = np.ones((480, 640, 3), dtype=np.uint8) * 255
             cv2.putText(frame, "Cámara no disponible", (150, 240), 
                       cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
         
         # Verificar si es hora de realizar una detección automática
-        if camera.should_capture():
-            detect_objects_in_frame(frame)
+        # (sólo se publica el frame; el hilo de inferencia lo procesa por su cuenta).
+        # El planificador fija el intervalo según el presupuesto y la actividad de la cámara.
+        # Si la escena no cambió se conserva el último resultado sin ejecutar el modelo.
+        interval = None
+        if scheduler is not None:
+            interval = scheduler.interval(camera_id, camera.auto_capture_interval,
+                                          pipeline.priority, pipeline.activity())
+        if (success and detector.is_ready() and camera.should_capture(interval)
+                and motion_gate.should_detect(frame)):
+            inference_worker.submit(frame, camera_id)
         
-        # Dibujar las cajas delimitadoras si están habilitadas
-        if SHOW_BOUNDING_BOXES and last_result['boxes']:
-            with detection_lock:
-                frame = camera.add_bounding_box(
-                    frame, 
-                    last_result['boxes'], 
-                    last_result['labels'], 
-                    last_result['scores']
-                )
+        # Pre-roll y clips de eventos (el grabador codifica sólo RECORD_FPS frames por segundo)
+        if success and recorder is not None:
+            recorder.add_frame(pipeline.name, frame)
         
-        # Codificar el frame a JPEG
-        ret, buffer = cv2.imencode('.jpg', frame)
-        frame_bytes = buffer.tobytes()
+        # Mover las cajas de la última detección hasta la posición actual de los objetos
+        if success and TRACKING:
+            tracker.step(frame)
         
+        # Sin clientes de video basta con decodificar los frames que necesitan la detección,
+        # el seguimiento y la grabación (los clips se escriben a RECORD_FPS fijos); la fuente
+        # descarta el resto antes de decodificarlos
+        watching = stream.has_subscribers()
+        target_fps = STREAM_FPS if watching else idle_fps
+        if camera.target_fps != target_fps:
+            camera.set_target_fps(target_fps)
+        
+        # Sin clientes conectados no vale la pena anotar ni codificar
+        if watching:
+            # Dibujar las cajas delimitadoras si están habilitadas (lectura sin lock de las instantáneas).
+            # El difusor codifica el frame cuando un cliente lo pide, quizá varios frames después:
+            # el buffer de la anotación no se reutiliza mientras el difusor o un cliente lo conserve
+            show_boxes = pipeline.settings.get().show_boxes
+            snapshot = pipeline.result.get()
+            if show_boxes and TRACKING:
+                detections, track_ids = tracker.get_detections()
+                if len(detections):
+                    frame = camera.add_bounding_box(frame, detections, track_ids)
+            elif show_boxes and len(snapshot.detections):
+                # Las cajas no cambian mientras no se publique otra versión del resultado:
+                # se reutilizan textos y colores
+                frame = camera.add_bounding_box(frame, snapshot.detections, cache=True)
+            
+            # Publicar el frame anotado; cada nivel de calidad se codifica una única vez
+            # para todos los clientes, cuando el primero lo necesita
+            stream.publish(frame)
+            metrics.inc('frames_published_total', camera=pipeline.name)
+        
+        # Limitar la velocidad del bucle a STREAM_FPS
+        elapsed = time.time() - start_time
+        if success and elapsed < frame_period:
+            time.sleep(frame_period - elapsed)
+
+def generate_frames(camera_id=0):
+    """
+    Generador para el streaming de video (suscriptor del bucle de captura)
+    :param camera_id: Posición de la cámara en el registro
+    """
+    for frame_bytes in registry[camera_id].stream.subscribe():
         # Enviar el frame como parte de la respuesta multipart
         yield (b'--frame\r\n'
               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
 
-def detect_objects_in_frame(frame):
-    """Detecta objetos en un frame y actualiza los resultados"""
-    global last_result
-    
-    # Realizar detección
-    boxes, labels, scores, has_person, suggestion = detector.detect(frame)
-    
-    # Actualizar resultados
-    with detection_lock:
-        last_result = {
-            'boxes': boxes,
-            'labels': labels,
-            'scores': scores,
-            'has_person': has_person,
-            'suggestion': suggestion
-        }
-    
-    print(f"Detección: {'✓ Persona detectada' if has_person else '✗ Ninguna persona'}")
-    if labels:
-        objects_str = ", ".join([f"{label} ({score:.2f})" for label, score in zip(labels, scores)])
-        print(f"Objetos detectados: {objects_str}")
-    else:
-        print("No se detectaron objetos")
+def detect_objects_in_frames(items):
+    """
+    Detecta objetos en un lote de frames y actualiza los resultados
+    (se ejecuta en el hilo de inferencia)
+    :param items: Lista de tuplas (camera_id, frame)
+    :return: Lista con el ResultSnapshot publicado para cada frame
+    """
+    # Recortar cada frame a su zona de interés (o dejarlo completo)
+    images, offsets, edges = [], [], []
+    for camera_id, frame in items:
+        pipeline = registry[camera_id]
+        image, offset, edge = pipeline.region.prepare(
+            frame, pipeline.result.get().detections.boxes, pipeline.motion_gate.get_motion_region(), INFERENCE_SIZE)
+        images.append(image)
+        offsets.append(offset)
+        edges.append(edge)
+    
+    # Realizar detección de todo el lote en una sola pasada del modelo
+    detections = detector.detect_batch(images, [camera_id for camera_id, _ in items], edges)
+    
+    results = []
+    for (camera_id, frame), offset, (detected, suggestion) in zip(items, offsets, detections):
+        # Llevar las cajas del recorte al frame completo (una operación sobre todo el array)
+        pipeline = registry[camera_id]
+        detected = detected.offset(*offset)
+        
+        # Publicar el resultado (los lectores pasan a ver la versión nueva entera) con el umbral
+        # vigente al publicarlo, no con el del momento en que se envió el frame: si la confianza
+        # cambió mientras el modelo trabajaba, este resultado no deshace el nuevo filtrado
+        snapshot = pipeline.result.update(
+            lambda _: threshold_snapshot(detected, suggestion, settings.get().confidence))
+        detected = snapshot.detections
+        has_person = snapshot.has_person
+        results.append(snapshot)
+        # Avisar a los clientes conectados a /api/events
+        events.publish('detection', detection_payload(snapshot), camera_id)
+        if recorder is not None:
+            recorder.update(pipeline.name, has_person)
+        if scheduler is not None:
+            scheduler.record_result(camera_id, has_person)
+        if TRACKING:
+            pipeline.tracker.update(detected, frame)
+        
+        prefix = f"[Cámara {pipeline.name}] " if len(registry) > 1 else ""
+        print(f"{prefix}Detección: {'✓ Persona detectada' if has_person else '✗ Ninguna persona'}")
+        if len(detected):
+            objects_str = ", ".join([f"{label} ({score:.2f})"
+                                     for label, score in zip(detected.labels, detected.scores.tolist())])
+            print(f"{prefix}Objetos detectados: {objects_str}")
+        else:
+            print(f"{prefix}No se detectaron objetos")
+    
+    return results
+
+def threshold_snapshot(detections, suggestion, threshold):
+    """
+    Crea la instantánea de un resultado filtrado con un umbral de confianza
+    :param detections: Detections con sus candidatas
+    :param suggestion: Sugerencia calculada para detections (se regenera si cambian las etiquetas)
+    :param threshold: Umbral de confianza
+    :return: ResultSnapshot
+    """
+    detected = detections.with_threshold(threshold)
+    if detected.unique_labels() != detections.unique_labels():
+        suggestion = generate_suggestion(detected.has_person, detected.unique_labels())
+    return result_snapshot(detected, suggestion)
+
+def refilter_results(threshold):
+    """
+    Aplica un nuevo umbral de confianza al último resultado de cada cámara a partir
+    de las candidatas guardadas, sin ejecutar el modelo
+    :param threshold: Nuevo umbral de confianza
+    """
+    for pipeline in registry:
+        # Se parte de la versión publicada en ese momento: una detección que termine a la vez
+        # no se pierde, se publica antes o después de esta
+        snapshot = pipeline.result.update(
+            lambda previous: threshold_snapshot(previous.detections, previous.suggestion, threshold))
+        events.publish('detection', detection_payload(snapshot), pipeline.id)
+        if TRACKING:
+            pipeline.tracker.refilter(snapshot.detections)
+
+def requested_camera(cam_id=None):
+    """
+    Obtiene la cámara indicada en la ruta (/api/<cam_id>/...) o en el parámetro ?camera=
+    :param cam_id: Nombre o posición de la cámara tomado de la ruta
+    :return: CameraPipeline (404 si no existe; por defecto, la primera cámara)
+    """
+    if cam_id is None:
+        cam_id = request.args.get('camera', 0)
+    pipeline = registry.get(cam_id)
+    if pipeline is None:
+        abort(404)
+    return pipeline
 
 @app.route('/')
 def index():
@@ -135,70 +540,256 @@ def index():
     return render_template('index.html')
 
 @app.route('/video_feed')
-def video_feed():
+@app.route('/video_feed/<cam_id>')
+def video_feed(cam_id=None):
     """Stream de video"""
-    return Response(generate_frames(),
+    pipeline = requested_camera(cam_id if cam_id is not None else 0)
+    return Response(generate_frames(pipeline.id),
                    mimetype='multipart/x-mixed-replace; boundary=frame')
 
+@app.route('/api/cameras', methods=['GET'])
+def api_cameras():
+    """API con las cámaras registradas y el reparto de la inferencia entre ellas"""
+    schedule = inference_worker.get_schedule()
+    return jsonify({'cameras': [{
+        'id': pipeline.id,
+        'name': pipeline.name,
+        'priority': pipeline.priority,
+        'weight': round(registry.weight(pipeline.id), 3),
+        'activity': round(pipeline.activity(), 3),
+        'detections': schedule.get(pipeline.id, {}).get('served', 0),
+        'share': schedule.get(pipeline.id, {}).get('share', 0.0),
+        'clients': pipeline.stream.subscribers
+    } for pipeline in registry]})
+
 @app.route('/api/detect', methods=['POST'])
-def api_detect():
+@app.route('/api/<cam_id>/detect', methods=['POST'])
+def api_detect(cam_id=None):
     """API para realizar detección manual"""
-    success, frame = camera.manual_capture()
-    if success:
-        detect_objects_in_frame(frame)
-        return jsonify({
-            'success': True, 
-            'has_person': last_result['has_person'],
-            'suggestion': last_result['suggestion'],
-            'objects': [{'label': label, 'score': score} 
-                      for label, score in zip(last_result['labels'], last_result['scores'])],
-            'history': detector.get_history()
-        })
-    return jsonify({'success': False, 'error': 'No se pudo capturar la imagen'})
+    pipeline = requested_camera(cam_id)
+    camera_id = pipeline.id
+    if not detector.is_ready():
+        return jsonify({'success': False, 'error': 'El modelo todavía se está cargando',
+                        'model': detector.get_status()}), 503
+    
+    # Reutilizar el último frame del hilo de captura en lugar de competir por la cámara
+    _, _, latest_frame = pipeline.camera.latest()
+    success, frame = pipeline.camera.manual_capture(latest_frame)
+    if not success:
+        return jsonify({'success': False, 'error': 'No se pudo capturar la imagen'})
+    
+    # Delegar en el hilo de inferencia y esperar su resultado
+    pipeline.motion_gate.mark_detected(frame)
+    ticket = inference_worker.submit(frame, camera_id)
+    try:
+        snapshot = inference_worker.wait_result(ticket, camera_id, timeout=DETECTION_TIMEOUT)
+    except RuntimeError as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    if snapshot is None:
+        return jsonify({'success': False, 'error': 'La detección no terminó a tiempo'}), 504
+    
+    response = detection_payload(snapshot)
+    response['success'] = True
+    return jsonify(response)
 
 @app.route('/api/status', methods=['GET'])
-def api_status():
-    """API para obtener el estado actual"""
-    with detection_lock:
-        return jsonify({
-            'has_person': last_result['has_person'],
-            'suggestion': last_result['suggestion'],
-            'objects': [{'label': label, 'score': score} 
-                      for label, score in zip(last_result['labels'], last_result['scores'])],
-            'history': detector.get_history(),
-            'settings': {
-                'test_mode': TEST_MODE,
-                'confidence': CONFIDENCE_THRESHOLD,
-                'auto_capture': camera.auto_capture,
-                'interval': camera.auto_capture_interval,
-                'show_boxes': SHOW_BOUNDING_BOXES
-            }
-        })
+@app.route('/api/<cam_id>/status', methods=['GET'])
+def api_status(cam_id=None):
+    """
+    API para obtener el estado actual: resultado, configuración y modelo.
+    Las estadísticas que cambian en cada frame están en /api/stats
+    """
+    pipeline = requested_camera(cam_id)
+    camera_id = pipeline.id
+    
+    # ETag débil: versiones del resultado, la configuración, el historial (común a todas
+    # las cámaras) y el modelo publicados, que cubren todo el contenido de la respuesta. Si el cliente ya tiene esta versión se
+    # responde 304 sin reconstruir el JSON.
+    snapshot = pipeline.result.get()
+    etag = (f"{camera_id}-{snapshot.version}-{settings.version}-{pipeline.settings.version}"
+            f"-{detector.history.version}-{events.get_version('model')}")
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        return response
+    
+    status = detection_payload(snapshot)
+    status.update({
+        'settings': current_settings(pipeline),
+        'model': detector.get_status(),
+        'camera': camera_id,
+        'name': pipeline.name,
+        'cameras': len(registry)
+    })
+    
+    response = jsonify(status)
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/stats', methods=['GET'])
+@app.route('/api/<cam_id>/stats', methods=['GET'])
+def api_stats(cam_id=None):
+    """API con las estadísticas de la cámara, que cambian en cada frame (sin ETag)"""
+    pipeline = requested_camera(cam_id)
+    camera_id = pipeline.id
+    response = jsonify({
+        'camera': camera_id,
+        'name': pipeline.name,
+        'scheduler': inference_worker.get_schedule().get(camera_id),
+        'capture': scheduler.get_stats(camera_id) if scheduler is not None else None,
+        'motion': pipeline.motion_gate.get_stats(),
+        'roi': pipeline.region.get_stats(),
+        'source': pipeline.camera.get_source_stats(),
+        'recording': recorder.get_stats(pipeline.name) if recorder is not None else None,
+        'cache': detector.get_cache_stats(),
+        'stream': {
+            'encoder': pipeline.stream.encoder.backend,
+            'clients': pipeline.stream.get_client_stats()
+        },
+        'tracks': pipeline.tracker.get_tracks() if TRACKING else [],
+        'person_count': (pipeline.tracker.person_count() if TRACKING
+                         else pipeline.result.get().detections.person_count),
+        'metrics': metrics.summary()
+    })
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Métricas de rendimiento en formato Prometheus"""
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/events')
+@app.route('/api/<cam_id>/events')
+def api_events(cam_id=None):
+    """Canal Server-Sent Events: envía sólo los cambios de resultados y configuración"""
+    camera_id = None
+    if cam_id is not None or 'camera' in request.args:
+        camera_id = requested_camera(cam_id).id
+    return Response(events.stream(camera_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def parse_time_arg(name):
+    """
+    Lee un instante de la petición, en segundos desde epoch o en formato ISO 8601
+    :param name: Nombre del parámetro
+    :return: Segundos desde epoch o None si no se indicó
+    """
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+@app.route('/api/history', methods=['GET'])
+def api_history():
+    """API para consultar el historial persistente de detecciones (paginado)"""
+    if history_store is None:
+        return jsonify({'success': False, 'error': 'El historial persistente está desactivado'}), 404
+    
+    has_person = request.args.get('has_person')
+    if has_person is not None:
+        has_person = has_person.lower() in ('1', 'true', 'yes', 'si', 'sí')
+    
+    try:
+        since = parse_time_arg('since')
+        until = parse_time_arg('until')
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Formato de fecha no válido'}), 400
+    
+    page = history_store.query(
+        since=since,
+        until=until,
+        has_person=has_person,
+        label=request.args.get('label'),
+        camera=requested_camera().id if 'camera' in request.args else None,
+        page=request.args.get('page', 1, type=int),
+        per_page=min(request.args.get('per_page', 50, type=int), 500)
+    )
+    page['success'] = True
+    return jsonify(page)
+
+@app.route('/api/recordings', methods=['GET'])
+def api_recordings():
+    """API para listar los clips grabados, del más reciente al más antiguo"""
+    if recorder is None:
+        return jsonify({'success': False, 'error': 'La grabación de clips está desactivada'}), 404
+    return jsonify({'success': True, 'items': recorder.list_clips(), 'stats': recorder.get_stats()})
+
+@app.route('/recordings/<path:name>')
+def recording_file(name):
+    """Descarga de un clip grabado"""
+    if recorder is None:
+        abort(404)
+    return send_from_directory(RECORDINGS_DIR, name, as_attachment=True)
+
+def apply_camera_settings(pipeline, data):
+    """
+    Aplica a una cámara la parte de la configuración que es propia de cada cámara
+    :param pipeline: CameraPipeline de la cámara
+    :param data: Diccionario recibido en la petición
+    :return: CameraSettings publicado (cada petición publica una versión nueva)
+    """
+    changes = {}
+    if 'auto_capture' in data:
+        pipeline.camera.set_auto_capture(data['auto_capture'],
+                                         data.get('interval', pipeline.camera.auto_capture_interval))
+    
+    if 'show_boxes' in data:
+        changes['show_boxes'] = bool(data['show_boxes'])
+    
+    if 'priority' in data:
+        changes['priority'] = max(0.01, float(data['priority']))
+    
+    if 'motion_gate' in data:
+        pipeline.motion_gate.enabled = bool(data['motion_gate'])
+    
+    if 'motion_threshold' in data:
+        pipeline.motion_gate.threshold = float(data['motion_threshold'])
+    
+    return pipeline.configure(**changes)
 
 @app.route('/api/settings', methods=['POST'])
 def api_settings():
-    """API para actualizar la configuración"""
-    global SHOW_BOUNDING_BOXES, CONFIDENCE_THRESHOLD
-    
+    """API para actualizar la configuración (de todas las cámaras)"""
     data = request.json
-    if 'auto_capture' in data:
-        camera.set_auto_capture(data['auto_capture'], 
-                               data.get('interval', camera.auto_capture_interval))
+    for pipeline in registry:
+        apply_camera_settings(pipeline, data)
     
+    changes = {}
     if 'show_boxes' in data:
-        SHOW_BOUNDING_BOXES = data['show_boxes']
+        changes['show_boxes'] = bool(data['show_boxes'])
+    
+    if 'cpu_budget' in data and scheduler is not None:
+        changes['cpu_budget'] = min(max(float(data['cpu_budget']), 0.01), 1.0)
+        scheduler.cpu_budget = changes['cpu_budget']
     
+    # El umbral es del modelo, compartido por todas las cámaras
     if 'confidence' in data:
-        CONFIDENCE_THRESHOLD = float(data['confidence'])
-        detector.confidence_threshold = CONFIDENCE_THRESHOLD
+        changes['confidence'] = float(data['confidence'])
+        detector.confidence_threshold = changes['confidence']
     
-    return jsonify({'success': True, 'settings': {
-        'test_mode': TEST_MODE,
-        'confidence': CONFIDENCE_THRESHOLD,
-        'auto_capture': camera.auto_capture,
-        'interval': camera.auto_capture_interval,
-        'show_boxes': SHOW_BOUNDING_BOXES
-    }})
+    published = settings.replace(**changes)
+    if 'confidence' in changes:
+        # La escena actual se vuelve a filtrar al instante (caja y estado) sin otra pasada del modelo
+        refilter_results(published.confidence)
+    
+    current = current_settings()
+    events.publish('settings', current)
+    return jsonify({'success': True, 'settings': current})
+
+@app.route('/api/<cam_id>/settings', methods=['POST'])
+def api_camera_settings(cam_id):
+    """API para actualizar la configuración de una sola cámara (el umbral de confianza es común)"""
+    pipeline = requested_camera(cam_id)
+    apply_camera_settings(pipeline, request.json)
+    
+    current = current_settings(pipeline)
+    events.publish('settings', current, pipeline.id)
+    return jsonify({'success': True, 'settings': current})
 
 def find_free_port():
     """Encuentra un puerto libre para usar"""
@@ -217,13 +808,30 @@ def main():
     print(f"\n🚀 Iniciando servidor en http://{host}:{port}")
     print("🔍 Detector de personas iniciado")
     print("📸 Modo de prueba:" + (" ✓ Activo" if TEST_MODE else " ✗ Inactivo"))
-    print(f"⚙️  Umbral de confianza: {CONFIDENCE_THRESHOLD}")
+    print(f"⚙️  Umbral de confianza: {settings.get().confidence}")
+    print(f"🧠 Backend de inferencia: {detector.backend.name if detector.backend else INFERENCE_BACKEND}"
+          + ("" if detector.is_ready() else " (cargando en segundo plano)"))
+    camera = registry[0].camera
     print("👁️  Auto-captura:" + (" ✓ Activa" if camera.auto_capture else " ✗ Inactiva"))
-    print(f"⏱️  Intervalo de captura: {camera.auto_capture_interval} segundos")
-    print("📦 Bounding boxes:" + (" ✓ Activas" if SHOW_BOUNDING_BOXES else " ✗ Inactivas"))
+    if scheduler is not None:
+        print(f"⏱️  Intervalo de captura: adaptativo, de {MIN_CAPTURE_INTERVAL} a {camera.auto_capture_interval} segundos"
+              f" (presupuesto de CPU: {int(scheduler.cpu_budget * 100)}%)")
+    else:
+        print(f"⏱️  Intervalo de captura: {camera.auto_capture_interval} segundos")
+    print(f"🎥 Cámaras: {', '.join(registry.names())}")
+    print("📦 Bounding boxes:" + (" ✓ Activas" if settings.get().show_boxes else " ✗ Inactivas"))
+    
+    if SERVER_MODE == 'asgi':
+        if asgi.is_available():
+            # Servir con uvicorn: los streams no ocupan hilos y las rutas de Flask corren en un pool
+            print("🌐 Servidor: ASGI (uvicorn)")
+            asgi.serve_asgi(asgi.create_asgi_app(app, registry, events), host, port)
+            return
+        print("⚠️  El modo ASGI requiere starlette y uvicorn; usando Waitress")
     
     # Servir con Waitress
-    serve(app, host=host, port=port)
+    print(f"🌐 Servidor: Waitress ({WAITRESS_THREADS} hilos)")
+    serve(app, host=host, port=port, threads=WAITRESS_THREADS)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,87 @@
+# Servidor ASGI opcional (starlette + uvicorn; a2wsgi es opcional): los streams de video
+# y de eventos se atienden con generadores asíncronos, así que un cliente conectado no
+# ocupa un hilo. El resto de rutas se delega en la aplicación Flask, que corre en un pool
+# de hilos para que las llamadas a la cámara y al modelo nunca bloqueen el event loop.
+try:
+    from starlette.applications import Starlette
+    from starlette.responses import Response, StreamingResponse
+    from starlette.routing import Mount, Route
+except ImportError:
+    Starlette = None
+
+try:
+    import uvicorn
+except ImportError:
+    uvicorn = None
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:
+    try:
+        from starlette.middleware.wsgi import WSGIMiddleware
+    except ImportError:
+        WSGIMiddleware = None
+
+
+def is_available():
+    """
+    Indica si están instaladas las dependencias del modo ASGI
+    :return: True si se puede usar el servidor ASGI
+    """
+    return Starlette is not None and uvicorn is not None and WSGIMiddleware is not None
+
+
+def create_asgi_app(flask_app, registry, events):
+    """
+    Crea la aplicación ASGI
+    :param flask_app: Aplicación Flask que atiende las rutas que no son streams
+    :param registry: CameraRegistry con el stream de cada cámara
+    :param events: ResultEvents del canal /api/events
+    :return: Aplicación Starlette
+    """
+    if not is_available():
+        raise ImportError("El modo ASGI requiere starlette y uvicorn (pip install starlette uvicorn)")
+
+    async def multipart_frames(stream):
+        """Generador asíncrono del stream MJPEG de una cámara"""
+        async for frame_bytes in stream.subscribe_async():
+            yield (b'--frame\r\n'
+                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+
+    async def video_feed(request):
+        """Stream de video"""
+        pipeline = registry.get(request.path_params.get('cam_id', 0))
+        if pipeline is None:
+            return Response(status_code=404)
+        return StreamingResponse(multipart_frames(pipeline.stream),
+                                 media_type='multipart/x-mixed-replace; boundary=frame')
+
+    async def api_events(request):
+        """Canal Server-Sent Events: envía sólo los cambios de resultados y configuración"""
+        camera_id = None
+        cam_id = request.path_params.get('cam_id', request.query_params.get('camera'))
+        if cam_id is not None:
+            pipeline = registry.get(cam_id)
+            if pipeline is None:
+                return Response(status_code=404)
+            camera_id = pipeline.id
+        return StreamingResponse(events.stream_async(camera_id), media_type='text/event-stream',
+                                 headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    return Starlette(routes=[
+        Route('/video_feed', video_feed),
+        Route('/video_feed/{cam_id}', video_feed),
+        Route('/api/events', api_events),
+        Route('/api/{cam_id}/events', api_events),
+        Mount('/', app=WSGIMiddleware(flask_app))
+    ])
+
+
+def serve_asgi(asgi_app, host, port):
+    """
+    Sirve la aplicación ASGI con uvicorn (bloquea hasta que se detiene el servidor)
+    :param asgi_app: Aplicación creada con create_asgi_app
+    :param host: Dirección en la que escuchar
+    :param port: Puerto en el que escuchar
+    """
+    uvicorn.run(asgi_app, host=host, port=port, log_level='warning')
@@ -0,0 +1,184 @@
+import os
+import inspect
+import torch
+
+# onnxruntime es opcional: sólo se necesita para el backend 'onnx'
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+BACKENDS = ('torch', 'torchscript', 'onnx', 'int8')
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "cache")
+
+
+class DetectionHead(torch.nn.Module):
+    """Envuelve el modelo de Hugging Face para que devuelva sólo tensores (logits, cajas)"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values, pixel_mask):
+        outputs = self.model(pixel_values=pixel_values, pixel_mask=pixel_mask)
+        return outputs.logits, outputs.pred_boxes
+
+
+class TorchBackend:
+    name = 'torch'
+
+    def __init__(self, model, device):
+        """
+        Ejecuta el modelo original en PyTorch (fp32, modo eager)
+        :param model: Modelo de detección de Hugging Face ya cargado
+        :param device: Dispositivo donde se ejecuta ('cpu' o 'cuda')
+        """
+        self.device = device
+        self.module = DetectionHead(model).to(device).eval()
+
+    def __call__(self, pixel_values, pixel_mask):
+        """
+        Ejecuta la inferencia
+        :param pixel_values: Tensor (N, 3, H, W) con las imágenes normalizadas
+        :param pixel_mask: Tensor (N, H, W) con la máscara de relleno
+        :return: Tupla (logits, pred_boxes) como tensores de PyTorch
+        """
+        with torch.no_grad():
+            return self.module(pixel_values.to(self.device), pixel_mask.to(self.device))
+
+
+class QuantizedBackend(TorchBackend):
+    name = 'int8'
+
+    def __init__(self, model, device):
+        """
+        Cuantiza dinámicamente a int8 las capas lineales (sólo CPU)
+        :param model: Modelo de detección de Hugging Face ya cargado
+        :param device: Se ignora; la cuantización dinámica sólo funciona en CPU
+        """
+        quantized = torch.quantization.quantize_dynamic(
+            model.cpu().eval(), {torch.nn.Linear}, dtype=torch.qint8)
+        super().__init__(quantized, 'cpu')
+
+
+class TorchScriptBackend(TorchBackend):
+    name = 'torchscript'
+
+    def __init__(self, model, device, example_inputs, path):
+        """
+        Ejecuta el modelo trazado con TorchScript, guardándolo en disco para reutilizarlo
+        :param model: Modelo de detección de Hugging Face ya cargado
+        :param device: Dispositivo donde se ejecuta ('cpu' o 'cuda')
+        :param example_inputs: Tupla (pixel_values, pixel_mask) de ejemplo para trazar
+        :param path: Ruta del archivo .pt exportado
+        """
+        self.device = device
+        if os.path.exists(path):
+            print(f"Cargando modelo TorchScript desde {path}")
+            self.module = torch.jit.load(path, map_location=device)
+        else:
+            print(f"Exportando modelo a TorchScript en {path}...")
+            head = DetectionHead(model).to(device).eval()
+            inputs = tuple(tensor.to(device) for tensor in example_inputs)
+            with torch.no_grad():
+                traced = torch.jit.trace(head, inputs, strict=False)
+            traced = torch.jit.freeze(traced)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            traced.save(path)
+            self.module = traced
+        self.module.eval()
+
+
+class OnnxBackend:
+    name = 'onnx'
+
+    def __init__(self, model, example_inputs, path, num_threads=None):
+        """
+        Ejecuta el modelo exportado a ONNX con onnxruntime en CPU
+        :param model: Modelo de detección de Hugging Face ya cargado
+        :param example_inputs: Tupla (pixel_values, pixel_mask) de ejemplo para exportar
+        :param path: Ruta del archivo .onnx exportado
+        :param num_threads: Hilos de onnxruntime (None para usar su valor por defecto)
+        """
+        if onnxruntime is None:
+            raise ImportError("El backend 'onnx' requiere instalar onnxruntime")
+
+        if not os.path.exists(path):
+            print(f"Exportando modelo a ONNX en {path}...")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            head = DetectionHead(model).cpu().eval()
+            # Las versiones recientes de PyTorch exportan con dynamo por defecto
+            export_kwargs = {}
+            if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+                export_kwargs['dynamo'] = False
+            with torch.no_grad():
+                torch.onnx.export(
+                    head,
+                    tuple(tensor.cpu() for tensor in example_inputs),
+                    path,
+                    input_names=['pixel_values', 'pixel_mask'],
+                    output_names=['logits', 'pred_boxes'],
+                    dynamic_axes={
+                        'pixel_values': {0: 'batch', 2: 'height', 3: 'width'},
+                        'pixel_mask': {0: 'batch', 1: 'height', 2: 'width'},
+                        'logits': {0: 'batch'},
+                        'pred_boxes': {0: 'batch'}
+                    },
+                    opset_version=17,
+                    **export_kwargs
+                )
+        else:
+            print(f"Cargando modelo ONNX desde {path}")
+
+        options = onnxruntime.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(
+            path, sess_options=options, providers=['CPUExecutionProvider'])
+
+    def __call__(self, pixel_values, pixel_mask):
+        """
+        Ejecuta la inferencia
+        :param pixel_values: Tensor (N, 3, H, W) con las imágenes normalizadas
+        :param pixel_mask: Tensor (N, H, W) con la máscara de relleno
+        :return: Tupla (logits, pred_boxes) como tensores de PyTorch
+        """
+        logits, pred_boxes = self.session.run(None, {
+            'pixel_values': pixel_values.cpu().numpy(),
+            'pixel_mask': pixel_mask.cpu().numpy().astype('int64')
+        })
+        return torch.from_numpy(logits), torch.from_numpy(pred_boxes)
+
+
+def cache_path(model_name, backend_name, extension):
+    """
+    Construye la ruta del archivo exportado para un modelo y backend
+    :param model_name: Nombre o ruta del modelo
+    :param backend_name: Nombre del backend
+    :param extension: Extensión del archivo (sin punto)
+    :return: Ruta dentro de models/cache
+    """
+    safe_name = model_name.strip('/').replace('/', '_')
+    return os.path.join(CACHE_DIR, f"{safe_name}.{backend_name}.{extension}")
+
+
+def create_backend(name, model, device, model_name, example_inputs):
+    """
+    Crea el backend de inferencia indicado
+    :param name: Uno de BACKENDS ('torch', 'torchscript', 'onnx' o 'int8')
+    :param model: Modelo de detección de Hugging Face ya cargado
+    :param device: Dispositivo preferido ('cpu' o 'cuda')
+    :param model_name: Nombre del modelo (para nombrar los archivos exportados)
+    :param example_inputs: Tupla (pixel_values, pixel_mask) de ejemplo para exportar
+    :return: Objeto invocable con (pixel_values, pixel_mask) que devuelve (logits, pred_boxes)
+    """
+    if name == 'torch':
+        return TorchBackend(model, device)
+    if name == 'int8':
+        return QuantizedBackend(model, device)
+    if name == 'torchscript':
+        return TorchScriptBackend(model, device, example_inputs,
+                                  cache_path(model_name, name, 'pt'))
+    if name == 'onnx':
+        return OnnxBackend(model, example_inputs, cache_path(model_name, name, 'onnx'))
+    raise ValueError(f"Backend desconocido: {name} (opciones: {', '.join(BACKENDS)})")
@@ -0,0 +1,365 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import threading
+import subprocess
+import urllib.request
+from datetime import datetime
+
+import cv2
+
+from metrics import Metrics
+
+# resource sólo existe en sistemas tipo Unix
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def git_commit():
+    """
+    Obtiene el commit actual del repositorio para poder comparar informes
+    :return: Diccionario con el hash del commit y si hay cambios sin guardar
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=directory,
+                                         stderr=subprocess.DEVNULL, text=True).strip()
+        dirty = bool(subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                             cwd=directory, stderr=subprocess.DEVNULL, text=True).strip())
+        return {'commit': commit, 'dirty': dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+
+
+def peak_rss_mb():
+    """
+    Memoria residente máxima del proceso
+    :return: Megabytes o None si no se puede medir en esta plataforma
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa en KB y macOS en bytes
+    return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+
+
+def parse_resolution(value):
+    """
+    Convierte 'ANCHOxALTO' en una tupla
+    :param value: Cadena como '640x480' (o 'native' para no redimensionar)
+    :return: Tupla (ancho, alto) o None
+    """
+    if value == 'native':
+        return None
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+
+def base_report(mode, args):
+    """
+    Datos comunes de todos los informes
+    :param mode: Modo del benchmark
+    :param args: Argumentos de la línea de comandos
+    :return: Diccionario del informe
+    """
+    report = {
+        'mode': mode,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'config': {key: value for key, value in vars(args).items() if key != 'func'}
+    }
+    report.update(git_commit())
+    return report
+
+
+def run_pipeline(args):
+    """
+    Mide captura → detección → anotación → codificación con cada combinación
+    de resolución, tamaño de lote e hilos
+    :param args: Argumentos de la línea de comandos
+    :return: Diccionario del informe
+    """
+    import torch
+    from camera import Camera
+    from detector import PersonDetector
+    from encoder import JpegEncoder
+
+    detector = PersonDetector(
+        model_name=args.model,
+        confidence_threshold=args.confidence,
+        backend=args.backend,
+        fast_preprocess=not args.slow_preprocess,
+        inference_size=args.inference_size
+    )
+    if detector.backend is None:
+        raise SystemExit("No se pudo cargar el modelo")
+    encoder = JpegEncoder(quality=args.jpeg_quality, backend=args.jpeg_backend)
+
+    report = base_report('pipeline', args)
+    report.update({'backend': detector.backend.name, 'encoder': encoder.backend, 'runs': []})
+
+    for resolution in args.resolution:
+        for batch_size in args.batch_size:
+            for threads in args.threads:
+                torch.set_num_threads(threads)
+                # Sin hilo de captura: cada frame se lee en orden y el resultado es reproducible
+                camera = Camera(camera_index=args.source, test_mode=args.source == 'test', test_fps=0,
+                                realtime=False)
+                run = pipeline_run(camera, detector, encoder, parse_resolution(resolution),
+                                   batch_size, args.frames, args.warmup)
+                camera.release()
+                run.update({'resolution': resolution, 'batch_size': batch_size, 'threads': threads,
+                            'source': 'test' if camera.test_mode else args.source})
+                report['runs'].append(run)
+                print(f"📊 {resolution} lote={batch_size} hilos={threads}: {run['fps']} fps "
+                      f"(modelo p50 {run['stages'].get('forward', {}).get('p50', '-')} ms)")
+
+    report['peak_rss_mb'] = peak_rss_mb()
+    return report
+
+
+def pipeline_run(camera, detector, encoder, size, batch_size, frames, warmup):
+    """
+    Ejecuta una pasada del pipeline
+    :param camera: Camera en modo de prueba o leyendo un video
+    :param detector: PersonDetector ya cargado
+    :param encoder: JpegEncoder
+    :param size: Resolución (ancho, alto) a la que se llevan los frames, o None
+    :param batch_size: Frames por llamada al detector
+    :param frames: Frames a medir
+    :param warmup: Lotes iniciales que no se miden
+    :return: Diccionario con fps y percentiles por etapa (en milisegundos)
+    """
+    stats = Metrics(window=max(frames, 1))
+    processed = 0
+    batch_index = 0
+    start_time = None
+
+    while processed < frames:
+        # Al terminar el calentamiento se descartan sus medidas antes de leer el primer lote medido
+        measuring = batch_index >= warmup
+        if measuring and start_time is None:
+            start_time = time.perf_counter()
+            stats = Metrics(window=max(frames, 1))
+
+        batch = []
+        for _ in range(batch_size):
+            grab_start = time.perf_counter()
+            success, frame = camera.read()
+            if not success:
+                break
+            if size is not None and (frame.shape[1], frame.shape[0]) != size:
+                frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+            else:
+                frame = frame.copy()
+            stats.observe('grab', time.perf_counter() - grab_start)
+            batch.append(frame)
+        if not batch:
+            break  # fin del video
+
+        detect_start = time.perf_counter()
+        detections = detector.detect_batch(batch)
+        stats.observe('detect', time.perf_counter() - detect_start)
+        for stage, seconds in detector.last_timings.items():
+            stats.observe(stage, seconds)
+
+        for frame, (detected, _) in zip(batch, detections):
+            annotate_start = time.perf_counter()
+            annotated = camera.add_bounding_box(frame, detected)
+            stats.observe('annotate', time.perf_counter() - annotate_start)
+            encode_start = time.perf_counter()
+            encoder.encode(annotated)
+            stats.observe('encode', time.perf_counter() - encode_start)
+
+        batch_index += 1
+        if measuring:
+            processed += len(batch)
+        if len(batch) < batch_size:
+            break
+
+    elapsed = time.perf_counter() - start_time if start_time is not None else 0.0
+    stages = {}
+    for (name, _), histogram in stats.histograms.items():
+        values = histogram.quantiles((0.5, 0.95, 0.99))
+        stages[name] = {f"p{int(q * 100)}": round(value * 1000, 2) for q, value in values.items()}
+        stages[name]['mean'] = round(histogram.sum / histogram.count * 1000, 2)
+    return {
+        'frames': processed,
+        'seconds': round(elapsed, 3),
+        'fps': round(processed / elapsed, 2) if elapsed > 0 else 0.0,
+        'stages': stages
+    }
+
+
+def stream_client(url, stop_event, stats, client_id):
+    """
+    Cliente de /video_feed: lee el stream MJPEG y cuenta frames y bytes
+    :param url: URL del stream
+    :param stop_event: threading.Event que indica el final de la prueba
+    :param stats: Metrics donde se registran los resultados
+    :param client_id: Número del cliente
+    """
+    boundary = b'--frame'
+    try:
+        with urllib.request.urlopen(url, timeout=10) as response:
+            last_frame = time.perf_counter()
+            tail = b''  # final del bloque anterior, por si el separador quedó partido entre dos lecturas
+            while not stop_event.is_set():
+                chunk = response.read1(65536) if hasattr(response, 'read1') else response.read(65536)
+                if not chunk:
+                    break
+                stats.inc('stream_bytes', len(chunk))
+                data = tail + chunk
+                frames = data.count(boundary)
+                # Menos bytes que el separador: nunca se cuenta dos veces el mismo
+                tail = data[-(len(boundary) - 1):]
+                if frames:
+                    now = time.perf_counter()
+                    stats.inc('stream_frames', frames)
+                    stats.observe('frame_interval', (now - last_frame) / frames)
+                    last_frame = now
+    except Exception as e:
+        stats.inc('stream_errors')
+        print(f"Cliente de video {client_id}: {e}")
+
+
+def status_client(url, stop_event, stats, client_id):
+    """
+    Cliente de /api/status: lo consulta sin pausa y mide la latencia
+    :param url: URL del estado
+    :param stop_event: threading.Event que indica el final de la prueba
+    :param stats: Metrics donde se registran los resultados
+    :param client_id: Número del cliente
+    """
+    while not stop_event.is_set():
+        start_time = time.perf_counter()
+        try:
+            with urllib.request.urlopen(url, timeout=10) as response:
+                response.read()
+            stats.observe('status_latency', time.perf_counter() - start_time)
+        except Exception as e:
+            stats.inc('status_errors')
+            print(f"Cliente de estado {client_id}: {e}")
+            time.sleep(0.5)
+
+
+def run_load(args):
+    """
+    Abre clientes concurrentes de /video_feed y /api/status contra un servidor en marcha
+    :param args: Argumentos de la línea de comandos
+    :return: Diccionario del informe
+    """
+    base_url = args.url.rstrip('/')
+    stats = Metrics(window=1000000)
+    stop_event = threading.Event()
+    threads = []
+    for client_id in range(args.stream_clients):
+        threads.append(threading.Thread(target=stream_client, daemon=True,
+                                        args=(f"{base_url}/video_feed", stop_event, stats, client_id)))
+    for client_id in range(args.status_clients):
+        threads.append(threading.Thread(target=status_client, daemon=True,
+                                        args=(f"{base_url}/api/status", stop_event, stats, client_id)))
+
+    print(f"🚦 {args.stream_clients} clientes de video y {args.status_clients} de estado "
+          f"contra {base_url} durante {args.duration} s")
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop_event.set()
+    elapsed = time.perf_counter() - start_time
+    for thread in threads:
+        thread.join(2.0)
+
+    counters = {name: value for (name, _), value in stats.counters.items()}
+    latency = {}
+    for (name, _), histogram in stats.histograms.items():
+        latency[name] = {f"p{int(q * 100)}": round(value * 1000, 2)
+                         for q, value in histogram.quantiles((0.5, 0.95, 0.99)).items()}
+        latency[name]['count'] = histogram.count
+
+    frames = counters.get('stream_frames', 0)
+    report = base_report('load', args)
+    report.update({
+        'seconds': round(elapsed, 2),
+        'stream': {
+            'clients': args.stream_clients,
+            'frames': frames,
+            'fps_per_client': round(frames / elapsed / args.stream_clients, 2) if args.stream_clients else 0.0,
+            'bytes_per_second': round(counters.get('stream_bytes', 0) / elapsed),
+            'frame_interval_ms': latency.get('frame_interval', {}),
+            'errors': counters.get('stream_errors', 0)
+        },
+        'status': {
+            'clients': args.status_clients,
+            'requests_per_second': round(latency.get('status_latency', {}).get('count', 0) / elapsed, 2),
+            'latency_ms': latency.get('status_latency', {}),
+            'errors': counters.get('status_errors', 0)
+        },
+        'peak_rss_mb': peak_rss_mb()
+    })
+    print(f"📊 Video: {report['stream']['fps_per_client']} fps por cliente; "
+          f"estado: {report['status']['requests_per_second']} peticiones/s "
+          f"(p95 {report['status']['latency_ms'].get('p95', '-')} ms)")
+    return report
+
+
+def build_parser():
+    """Argumentos de la línea de comandos"""
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline captura → detección → codificación")
+    subparsers = parser.add_subparsers(dest='mode', required=True)
+
+    pipeline = subparsers.add_parser('pipeline', help="Mide el pipeline completo sin servidor")
+    pipeline.add_argument('--source', default='test', help="'test' (imágenes de prueba), ruta de un video, URL rtsp:// o carpeta de imágenes")
+    pipeline.add_argument('--frames', type=int, default=50, help="Frames medidos por combinación")
+    pipeline.add_argument('--warmup', type=int, default=2, help="Lotes iniciales que no se miden")
+    pipeline.add_argument('--resolution', nargs='+', default=['640x480'],
+                          help="Resoluciones ANCHOxALTO (o 'native')")
+    pipeline.add_argument('--batch-size', nargs='+', type=int, default=[1], help="Tamaños de lote")
+    pipeline.add_argument('--threads', nargs='+', type=int, default=[os.cpu_count() or 1],
+                          help="Hilos de PyTorch")
+    pipeline.add_argument('--model', default="facebook/detr-resnet-50", help="Nombre o ruta del modelo")
+    pipeline.add_argument('--backend', default='torch', help="'torch', 'torchscript', 'onnx' o 'int8'")
+    pipeline.add_argument('--inference-size', type=int, default=512, help="Lado más corto de la entrada del modelo")
+    pipeline.add_argument('--slow-preprocess', action='store_true',
+                          help="Usar el procesador de Hugging Face en lugar del preprocesado rápido")
+    pipeline.add_argument('--confidence', type=float, default=0.8, help="Umbral de confianza")
+    pipeline.add_argument('--jpeg-quality', type=int, default=80, help="Calidad JPEG")
+    pipeline.add_argument('--jpeg-backend', default='auto', help="'auto', 'turbojpeg', 'simplejpeg' u 'opencv'")
+    pipeline.set_defaults(func=run_pipeline)
+
+    load = subparsers.add_parser('load', help="Genera carga contra un servidor en marcha")
+    load.add_argument('--url', required=True,
+                      help="Dirección del servidor (app.py elige un puerto libre y lo muestra al arrancar)")
+    load.add_argument('--stream-clients', type=int, default=10, help="Clientes de /video_feed")
+    load.add_argument('--status-clients', type=int, default=2, help="Clientes de /api/status")
+    load.add_argument('--duration', type=float, default=30.0, help="Duración de la prueba en segundos")
+    load.set_defaults(func=run_load)
+
+    for subparser in (pipeline, load):
+        subparser.add_argument('--output', help="Archivo donde guardar el informe JSON")
+    return parser
+
+
+def main():
+    """Función principal"""
+    args = build_parser().parse_args()
+    report = args.func(args)
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+        print(f"💾 Informe guardado en {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
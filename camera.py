@@ -1,27 +1,54 @@
 import cv2
 import time
 import os
+import threading
 import numpy as np
 from datetime import datetime
+from encoder import JpegEncoder
+from metrics import metrics
+from sources import open_source, ImageDirectorySource, StreamSource
+from overlay import OverlayRenderer
 
 class Camera:
-    def __init__(self, camera_index=0, test_mode=False):
+    def __init__(self, camera_index=0, test_mode=False, ring_size=8, test_fps=30, target_fps=None,
+                 realtime=True, name=None):
         """
         Inicializa la cámara
-        :param camera_index: Índice de la cámara (0 para la cámara integrada)
+        :param camera_index: Índice de la cámara (0 para la cámara integrada), ruta de un video,
+                             URL rtsp:// o http:// de una cámara IP, o carpeta de imágenes
         :param test_mode: Si es True, usará imágenes de prueba en lugar de la cámara real
+        :param ring_size: Número de frames que guarda el buffer circular del hilo de captura
+        :param test_fps: Frames por segundo que genera el hilo de captura en modo de prueba
+        :param target_fps: Frames por segundo que se decodifican (None para todos los de la fuente)
+        :param realtime: Si es False, los videos se leen lo más rápido posible en lugar de a su fps
+        :param name: Nombre de la cámara en las métricas (por defecto, la fuente); CameraRegistry
+                     le asigna el nombre con el que se registra
         """
         self.camera_index = camera_index
+        self.name = str(name if name is not None else camera_index)
         self.test_mode = test_mode
-        self.cap = None
+        self.source = None
         self.camera = None
-        self.test_images = []
-        self.test_image_index = 0
+        self.target_fps = target_fps
+        self.realtime = realtime
         self.frame = None
         self.last_frame_time = 0
         self.auto_capture = False
         self.auto_capture_interval = 5  # segundos
         self.camera_info = "No inicializada"
+        self.encoder = JpegEncoder()
+        self.overlay = OverlayRenderer()
+        
+        # Hilo de captura continua y buffer circular de (secuencia, instante, frame)
+        self.ring_size = ring_size
+        self.ring = [None] * ring_size
+        self.ring_meta = [(0, 0.0)] * ring_size
+        self.sequence = 0
+        self.grab_ok = False
+        self.grabbing = False
+        self.grab_thread = None
+        self.test_fps = test_fps
+        self.frame_condition = threading.Condition()
         
         # Cargar imágenes de prueba si está en modo de prueba
         if self.test_mode:
@@ -30,36 +57,39 @@ class Camera:
             self._init_camera()
     
     def _init_camera(self):
-        """Inicializa la conexión con la cámara"""
+        """Abre la fuente de video: cámara local, archivo de video, stream RTSP/HTTP o carpeta de imágenes"""
         try:
-            print("Intentando abrir la cámara...")
-            self.cap = cv2.VideoCapture(self.camera_index)
+            print(f"Intentando abrir la fuente {self.camera_index}...")
+            self.source = open_source(self.camera_index, target_fps=self.target_fps, fps=self.test_fps,
+                                      realtime=self.realtime)
             
-            # Verificar si la cámara se abrió correctamente
-            if not self.cap.isOpened():
+            # Verificar si la fuente se abrió correctamente
+            if not self.source.open():
+                if isinstance(self.source, StreamSource):
+                    # Una cámara IP puede tardar en estar disponible: se reintenta al leer
+                    self.camera_info = f"Reconectando con {self.camera_index}"
+                    print(f"No se pudo conectar con {self.camera_index}, se reintentará")
+                    return
                 print("Error: No se pudo abrir la cámara")
                 self.camera_info = "Error: No se pudo abrir la cámara"
                 self._fallback_to_test_mode()
                 return
             
-            # La cámara está abierta, obtener propiedades
-            width = self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)
-            height = self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
-            fps = self.cap.get(cv2.CAP_PROP_FPS)
-            
+            # La fuente está abierta, obtener propiedades
             self.camera = {
                 "index": self.camera_index,
-                "width": width,
-                "height": height,
-                "fps": fps
+                "kind": self.source.kind,
+                "width": self.source.width,
+                "height": self.source.height,
+                "fps": self.source.fps
             }
             
-            self.camera_info = f"Cámara {self.camera_index}: {width}x{height} @ {fps}fps"
+            self.camera_info = self.source.info
             print(f"Cámara inicializada: {self.camera_info}")
             
             # Verificar si podemos leer un frame (para confirmar que funciona)
-            ret, test_frame = self.cap.read()
-            if not ret:
+            ret, test_frame = self.source.read()
+            if not ret and not isinstance(self.source, StreamSource):
                 print("Advertencia: No se pudo leer un frame de la cámara, verificando permisos...")
                 self._fallback_to_test_mode()
                 return
@@ -74,14 +104,14 @@ class Camera:
     def _fallback_to_test_mode(self):
         """Cambia al modo de prueba cuando falla la cámara"""
         print("Cambiando a modo de prueba debido a problemas con la cámara")
-        if self.cap:
-            self.cap.release()
-            self.cap = None
+        if self.source:
+            self.source.release()
+            self.source = None
         self.test_mode = True
         self._load_test_images()
     
     def _load_test_images(self):
-        """Carga imágenes de prueba para el modo demo"""
+        """Prepara las imágenes de prueba para el modo demo (se leen a medida que se necesitan)"""
         test_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "test_images")
         os.makedirs(test_dir, exist_ok=True)
         
@@ -93,18 +123,14 @@ class Camera:
                         1, (0, 0, 255), 2, cv2.LINE_AA)
             cv2.imwrite(os.path.join(test_dir, "test_image.jpg"), img)
         
-        # Cargar imágenes de prueba
-        for file in os.listdir(test_dir):
-            if file.lower().endswith(('.png', '.jpg', '.jpeg')):
-                img_path = os.path.join(test_dir, file)
-                self.test_images.append(cv2.imread(img_path))
+        # Imagen que se muestra si la carpeta no tiene imágenes válidas
+        placeholder = np.ones((480, 640, 3), dtype=np.uint8) * 200
+        cv2.putText(placeholder, "NO SE ENCONTRARON IMÁGENES", (100, 240), cv2.FONT_HERSHEY_SIMPLEX, 
+                   0.8, (0, 0, 255), 2, cv2.LINE_AA)
         
-        # Si no se encontraron imágenes, crear una imagen de prueba
-        if not self.test_images:
-            img = np.ones((480, 640, 3), dtype=np.uint8) * 200
-            cv2.putText(img, "NO SE ENCONTRARON IMÁGENES", (100, 240), cv2.FONT_HERSHEY_SIMPLEX, 
-                       0.8, (0, 0, 255), 2, cv2.LINE_AA)
-            self.test_images.append(img)
+        self.source = ImageDirectorySource(test_dir, fps=self.test_fps, placeholder=placeholder)
+        self.source.open()
+        self.camera_info = f"Modo de prueba: {self.source.info}"
     
     def __del__(self):
         """Destructor: libera los recursos de la cámara"""
@@ -112,29 +138,146 @@ class Camera:
     
     def release(self):
         """Libera los recursos de la cámara"""
-        if self.cap and not self.test_mode:
-            self.cap.release()
-            self.cap = None
+        source = self.source
+        if source:
+            source.interrupt()
+        self.stop()
+        if source:
+            source.release()
     
-    def read(self):
+    def start(self):
+        """
+        Arranca el hilo que lee continuamente la cámara y guarda los frames en el buffer circular.
+        A partir de ese momento read(), latest() y wait_for_newer() nunca bloquean esperando al dispositivo.
+        """
+        with self.frame_condition:
+            if self.grabbing:
+                return
+            self.grabbing = True
+        self.grab_thread = threading.Thread(target=self._grab_loop, name=f"camera-grab-{self.name}",
+                                            daemon=True)
+        self.grab_thread.start()
+    
+    def stop(self, timeout=2.0):
+        """
+        Detiene el hilo de captura
+        :param timeout: Tiempo máximo en segundos para esperar a que termine
+        """
+        with self.frame_condition:
+            self.grabbing = False
+            self.frame_condition.notify_all()
+        thread = self.grab_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+        self.grab_thread = None
+    
+    def _grab_loop(self):
+        """Bucle del hilo de captura: vacía el dispositivo sin pausa en el buffer circular"""
+        while self.grabbing:
+            start_time = time.time()
+            slot = self.sequence % self.ring_size
+            
+            # Cada frame se lee en un array nuevo: los frames publicados no se vuelven a escribir,
+            # así que los lectores los usan sin copiarlos (el slot sólo guarda la referencia)
+            ok, image = self._read_source()
+            if not ok or image is None:
+                metrics.inc('grab_errors_total', camera=self.name)
+                with self.frame_condition:
+                    self.grab_ok = False
+                # Evitar un bucle ocupado mientras la cámara no responde
+                # (las fuentes de red ya esperan lo suyo antes de reconectar)
+                if not isinstance(self.source, StreamSource):
+                    time.sleep(0.1 if self.test_mode else 1.0)
+                continue
+            
+            with self.frame_condition:
+                self.ring[slot] = image
+                self.sequence += 1
+                self.ring_meta[slot] = (self.sequence, time.time())
+                self.grab_ok = True
+                self.frame_condition.notify_all()
+            metrics.observe('pipeline_stage_seconds', time.time() - start_time, stage='grab')
+            metrics.inc('frames_grabbed_total', camera=self.name)
+    
+    def _latest_entry(self):
+        """Entrada más reciente del buffer circular (llamar con frame_condition tomado)"""
+        if self.sequence == 0:
+            return 0, 0.0, None
+        slot = (self.sequence - 1) % self.ring_size
+        sequence, timestamp = self.ring_meta[slot]
+        return sequence, timestamp, self.ring[slot]
+    
+    def latest(self):
+        """
+        Obtiene el frame más reciente sin bloquear.
+        La imagen no se copia pero es inmutable: el hilo de captura nunca vuelve a escribir en
+        un frame publicado, así que se puede conservar el tiempo que haga falta (codificarla más
+        tarde, encolarla para el detector, grabarla). Nadie debe modificarla: para dibujar
+        encima hay que hacerlo sobre una copia (p. ej. con add_bounding_box).
+        :return: Tupla (secuencia, instante, imagen); (0, 0.0, None) si aún no hay frames
+        """
+        with self.frame_condition:
+            return self._latest_entry()
+    
+    def wait_for_newer(self, sequence, timeout=None):
+        """
+        Espera a que haya un frame más nuevo que el indicado
+        :param sequence: Último número de secuencia que ya tiene el consumidor
+        :param timeout: Tiempo máximo de espera en segundos (None para esperar indefinidamente)
+        :return: Tupla (secuencia, instante, imagen); si no llegó nada, la imagen es None.
+            Como en latest(), la imagen es inmutable y no se debe modificar
+        """
+        with self.frame_condition:
+            self.frame_condition.wait_for(
+                lambda: self.sequence > sequence or not self.grabbing, timeout)
+            if self.sequence > sequence:
+                return self._latest_entry()
+            return sequence, 0.0, None
+    
+    def _read_source(self, buffer=None):
         """
-        Lee un frame de la cámara o una imagen de prueba
+        Lee el siguiente frame directamente de la fuente.
+        Los archivos y las imágenes de prueba se entregan a su propio ritmo; si se pidió un
+        ritmo menor con set_target_fps, los frames sobrantes se descartan sin decodificar.
+        :param buffer: Array opcional donde escribir el frame para evitar reservar memoria
         :return: Tupla (éxito, imagen)
         """
-        if self.test_mode:
-            if not self.test_images:
-                return False, None
-            # Rotar entre las imágenes de prueba
-            self.frame = self.test_images[self.test_image_index].copy()
-            self.test_image_index = (self.test_image_index + 1) % len(self.test_images)
-            return True, self.frame
-        
-        if self.cap is None:
+        if self.source is None:
             self._init_camera()
-            if self.cap is None:
+            if self.source is None:
                 return False, None
+        return self.source.read(buffer)
+    
+    def set_target_fps(self, fps):
+        """
+        Indica cuántos frames por segundo se necesitan realmente (p. ej. el ritmo de detección
+        cuando nadie está viendo el video); el resto se descarta antes de decodificarlo
+        :param fps: Frames por segundo (None para todos los de la fuente)
+        """
+        self.target_fps = fps
+        if self.source is not None:
+            self.source.set_target_fps(fps)
+    
+    def get_source_stats(self):
+        """
+        Obtiene la contabilidad de la fuente de video
+        :return: Diccionario con fps nominal, pedido y medido, frames leídos, descartados y reconexiones
+        """
+        source = self.source
+        return source.get_stats() if source is not None else None
+    
+    def read(self):
+        """
+        Lee un frame de la cámara o una imagen de prueba.
+        Si el hilo de captura está activo devuelve el frame más reciente sin bloquear.
+        :return: Tupla (éxito, imagen)
+        """
+        if self.grabbing:
+            with self.frame_condition:
+                _, _, self.frame = self._latest_entry()
+                return self.grab_ok and self.frame is not None, self.frame
         
-        ret, self.frame = self.cap.read()
+        ret, self.frame = self._read_source()
         return ret, self.frame
     
     def get_jpeg(self):
@@ -149,11 +292,10 @@ class Camera:
                 blank = np.ones((480, 640, 3), dtype=np.uint8) * 255
                 cv2.putText(blank, "Cámara no disponible", (150, 240), 
                            cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-                _, buffer = cv2.imencode('.jpg', blank)
-                return buffer.tobytes()
+                return self.encoder.encode(blank)
         else:
-            # Usar el frame almacenado
-            frame = self.frame
+            # Usar una copia del frame almacenado (se dibuja encima y self.frame se conserva)
+            frame = self.frame.copy()
         
         # Generar timestamp
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -165,8 +307,7 @@ class Camera:
             cv2.putText(frame, "MODO DEMO", (frame.shape[1] - 150, 30), 
                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
         
-        _, buffer = cv2.imencode('.jpg', frame)
-        return buffer.tobytes()
+        return self.encoder.encode(frame)
     
     def set_auto_capture(self, enabled, interval=5):
         """
@@ -177,56 +318,50 @@ class Camera:
         self.auto_capture = enabled
         self.auto_capture_interval = interval
     
-    def should_capture(self):
+    def should_capture(self, interval=None):
         """
         Determina si es momento de hacer una captura automática
+        :param interval: Intervalo en segundos a usar en lugar de auto_capture_interval (p. ej. el del planificador)
         :return: True si debe capturar, False en caso contrario
         """
         if not self.auto_capture:
             return False
         
         current_time = time.time()
-        if current_time - self.last_frame_time >= self.auto_capture_interval:
+        if current_time - self.last_frame_time >= (interval if interval is not None else self.auto_capture_interval):
             self.last_frame_time = current_time
             return True
         return False
     
-    def manual_capture(self):
+    def manual_capture(self, frame=None):
         """
         Realiza una captura manual
+        :param frame: Frame ya leído para reutilizar (si es None se lee uno nuevo)
         :return: La imagen capturada
         """
+        if frame is not None:
+            self.last_frame_time = time.time()
+            return True, frame
+        
         success, frame = self.read()
         if success:
             self.last_frame_time = time.time()
         return success, frame
     
-    def add_bounding_box(self, frame, boxes, labels, scores):
+    def add_bounding_box(self, frame, detections, track_ids=None, cache=False):
         """
-        Añade cajas delimitadoras a la imagen
-        :param frame: Imagen a modificar
-        :param boxes: Lista de cajas [x1, y1, x2, y2]
-        :param labels: Lista de etiquetas
-        :param scores: Lista de puntuaciones de confianza
+        Añade cajas delimitadoras a la imagen (sobre una copia en un buffer reutilizable;
+        el frame original no se modifica)
+        :param frame: Imagen a anotar
+        :param detections: Detections con las cajas, clases y confianzas
+        :param track_ids: Lista opcional de identificadores de seguimiento para cada caja
+        :param cache: Si es True, mientras se dibuje el mismo resultado se reutilizan los textos y colores ya preparados
         :return: Imagen con cajas delimitadoras
         """
         if frame is None:
             return None
         
-        img = frame.copy()
-        for box, label, score in zip(boxes, labels, scores):
-            x1, y1, x2, y2 = box
-            x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-            
-            # Color basado en la etiqueta (rojo para personas, verde para otros)
-            color = (0, 255, 0) if label.lower() == 'person' else (0, 165, 255)
-            
-            # Dibujar rectángulo
-            cv2.rectangle(img, (x1, y1), (x2, y2), color, 2)
-            
-            # Añadir etiqueta y puntuación
-            text = f"{label}: {score:.2f}"
-            cv2.putText(img, text, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 
-                       0.5, color, 2)
-        
-        return img
\ No newline at end of file
+        start_time = time.perf_counter()
+        img = self.overlay.render(frame, detections, track_ids, cache)
+        metrics.observe('pipeline_stage_seconds', time.perf_counter() - start_time, stage='annotate')
+        return img
@@ -0,0 +1,136 @@
+import threading
+from results import Detections
+from snapshots import SnapshotCell, CameraSettings, result_snapshot
+
+
+class CameraPipeline:
+    def __init__(self, camera_id, name, camera, stream, motion_gate, tracker, region, priority=1.0,
+                 show_boxes=True):
+        """
+        Todo lo que pertenece a una cámara: captura, stream, detector de movimiento, seguimiento,
+        zona de interés, último resultado y configuración propia. El modelo y la cola de
+        inferencia se comparten entre todas las cámaras.
+        El resultado y la configuración son instantáneas inmutables con versión (SnapshotCell):
+        se leen sin locks desde cualquier hilo y cada cambio publica una versión nueva.
+        :param camera_id: Posición de la cámara (identificador interno: cola de inferencia, eventos, historial)
+        :param name: Nombre de la cámara en las rutas (/video_feed/<nombre>, /api/<nombre>/status)
+        :param camera: Instancia de Camera
+        :param stream: FrameBroadcaster de la cámara
+        :param motion_gate: MotionGate de la cámara
+        :param tracker: ObjectTracker de la cámara
+        :param region: RegionSelector de la cámara
+        :param priority: Peso de la cámara al repartir la capacidad de inferencia
+        :param show_boxes: Si se dibujan las cajas en el stream de esta cámara
+        """
+        self.id = camera_id
+        self.name = name
+        self.camera = camera
+        self.stream = stream
+        self.motion_gate = motion_gate
+        self.tracker = tracker
+        self.region = region
+        self.settings = SnapshotCell(CameraSettings(0, show_boxes, priority))
+        self.result = SnapshotCell(result_snapshot(Detections(), 'Inicializando...'))
+        self.thread = None
+
+    @property
+    def priority(self):
+        return self.settings.current.priority
+
+    @property
+    def show_boxes(self):
+        return self.settings.current.show_boxes
+
+    def configure(self, **changes):
+        """
+        Publica una versión nueva de la configuración de la cámara
+        :param changes: Campos de CameraSettings que cambian (show_boxes, priority)
+        :return: CameraSettings publicado
+        """
+        return self.settings.replace(**changes)
+
+    def activity(self):
+        """
+        Actividad reciente de la escena según el detector de movimiento
+        :return: Valor entre 0.0 (quieta) y 1.0 (cambios por encima del umbral de movimiento)
+        """
+        gate = self.motion_gate
+        if not gate.enabled or gate.threshold <= 0:
+            return 0.0
+        return min(1.0, gate.last_change / gate.threshold)
+
+
+class CameraRegistry:
+    def __init__(self, motion_weight=1.0):
+        """
+        Registro de las cámaras con nombre. Cada cámara tiene su propio pipeline y el
+        planificador de inferencia les reparte la capacidad según su peso.
+        :param motion_weight: Peso extra de una cámara con movimiento (1.0 = el doble que quieta)
+        """
+        self.motion_weight = motion_weight
+        self.pipelines = []
+        self.by_name = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, camera, stream, motion_gate, tracker, region, priority=1.0, show_boxes=True):
+        """
+        Registra una cámara
+        :param name: Nombre único de la cámara
+        :return: CameraPipeline creado
+        """
+        name = str(name)
+        with self.lock:
+            if name in self.by_name:
+                raise ValueError(f"Ya existe una cámara llamada '{name}'")
+            # Las métricas de la captura usan el mismo nombre que las del resto del pipeline
+            camera.name = name
+            pipeline = CameraPipeline(len(self.pipelines), name, camera, stream, motion_gate, tracker, region,
+                                      priority=priority, show_boxes=show_boxes)
+            self.pipelines.append(pipeline)
+            self.by_name[name] = pipeline
+            return pipeline
+
+    def get(self, key):
+        """
+        Busca una cámara por nombre o por posición
+        :param key: Nombre o posición (entero o texto numérico)
+        :return: CameraPipeline o None si no existe
+        """
+        pipeline = self.by_name.get(str(key))
+        if pipeline is not None:
+            return pipeline
+        try:
+            camera_id = int(key)
+        except (TypeError, ValueError):
+            return None
+        if 0 <= camera_id < len(self.pipelines):
+            return self.pipelines[camera_id]
+        return None
+
+    def __getitem__(self, camera_id):
+        return self.pipelines[camera_id]
+
+    def __iter__(self):
+        return iter(list(self.pipelines))
+
+    def __len__(self):
+        return len(self.pipelines)
+
+    def names(self):
+        """
+        Nombres de las cámaras registradas, en orden
+        :return: Lista de nombres
+        """
+        return [pipeline.name for pipeline in self.pipelines]
+
+    def weight(self, camera_id):
+        """
+        Peso de una cámara en el planificador de inferencia: su prioridad, aumentada
+        mientras hay movimiento en la escena
+        :param camera_id: Posición de la cámara
+        :return: Peso (> 0)
+        """
+        if not 0 <= camera_id < len(self.pipelines):
+            return 1.0
+        pipeline = self.pipelines[camera_id]
+        return max(0.01, pipeline.priority * (1.0 + self.motion_weight * pipeline.activity()))
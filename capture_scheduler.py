@@ -0,0 +1,141 @@
+import os
+import time
+import threading
+from collections import deque
+
+
+def system_load():
+    """
+    Carga media del sistema en el último minuto, relativa al número de núcleos
+    :return: Fracción (1.0 = todos los núcleos ocupados) o None si el sistema no la ofrece
+    """
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return None
+
+
+class AdaptiveScheduler:
+    def __init__(self, cpu_budget=0.5, min_interval=0.5, max_interval=5.0, workers=1, person_hold=10.0,
+                 smoothing=0.2, window=30.0):
+        """
+        Decide cada cuánto se analiza cada cámara en lugar de usar un intervalo fijo.
+        Una cámara quieta se analiza cada max_interval segundos y una con una persona vista
+        hace poco o con movimiento, cada min_interval. Además se mide lo que tarda la detección
+        y el ritmo nunca supera lo que cabe en cpu_budget (menos si el sistema ya está cargado),
+        repartido entre las cámaras según su prioridad.
+        :param cpu_budget: Fracción máxima del tiempo que la inferencia puede estar ocupada (0.0-1.0)
+        :param min_interval: Segundos mínimos entre detecciones de una cámara
+        :param max_interval: Segundos entre detecciones de una cámara en reposo (por defecto; ver interval())
+        :param workers: Lotes que se procesan a la vez (hilos del InferenceWorker)
+        :param person_hold: Segundos que una cámara se considera activa después de ver una persona
+        :param smoothing: Peso de cada medida nueva en la media móvil de la latencia
+        :param window: Segundos sobre los que se mide el uso real de la inferencia
+        """
+        self.cpu_budget = cpu_budget
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.workers = max(1, workers)
+        self.person_hold = person_hold
+        self.smoothing = smoothing
+        self.window = window
+        self.frame_seconds = None  # media móvil del coste de analizar un frame
+        self.busy = deque()  # (instante, segundos ocupados) de las últimas pasadas del modelo
+        self.last_person = {}  # {cámara: instante en que se vio una persona}
+        self.cameras = {}  # {cámara: (prioridad, intervalo)} de la última consulta
+        self.load = None
+        self.load_time = 0.0
+        self.lock = threading.Lock()
+
+    def record_detection(self, seconds, frames=1):
+        """
+        Registra lo que tardó una pasada del modelo
+        :param seconds: Duración de la pasada
+        :param frames: Frames analizados en la pasada
+        """
+        now = time.time()
+        per_frame = seconds / max(1, frames)
+        with self.lock:
+            if self.frame_seconds is None:
+                self.frame_seconds = per_frame
+            else:
+                self.frame_seconds += self.smoothing * (per_frame - self.frame_seconds)
+            self.busy.append((now, seconds))
+            while self.busy and now - self.busy[0][0] > self.window:
+                self.busy.popleft()
+
+    def record_result(self, camera, has_person):
+        """
+        Registra el resultado de una detección de una cámara
+        :param camera: Identificador de la cámara
+        :param has_person: Si se detectaron personas
+        """
+        if has_person:
+            with self.lock:
+                self.last_person[camera] = time.time()
+
+    def _effective_budget(self):
+        """Presupuesto reducido en proporción a la sobrecarga del sistema (llamar con el lock tomado)"""
+        now = time.time()
+        if now - self.load_time >= 1.0:
+            self.load = system_load()
+            self.load_time = now
+        if self.load is not None and self.load > 1.0:
+            return self.cpu_budget / self.load
+        return self.cpu_budget
+
+    def _is_active(self, camera, now):
+        """Indica si se vio una persona en la cámara hace menos de person_hold segundos"""
+        return now - self.last_person.get(camera, 0.0) < self.person_hold
+
+    def interval(self, camera, max_interval=None, priority=1.0, activity=0.0):
+        """
+        Calcula cuántos segundos deben pasar entre dos detecciones automáticas de una cámara
+        :param camera: Identificador de la cámara
+        :param max_interval: Intervalo de la cámara en reposo; por defecto, el del constructor
+        :param priority: Prioridad de la cámara
+        :param activity: Movimiento reciente en la escena (0.0 quieta - 1.0 con cambios)
+        :return: Intervalo en segundos
+        """
+        max_interval = max(max_interval if max_interval is not None else self.max_interval, self.min_interval)
+        now = time.time()
+        with self.lock:
+            if self._is_active(camera, now):
+                activity = 1.0
+            activity = min(max(activity, 0.0), 1.0)
+            # Entre el intervalo de reposo y el mínimo según la actividad (interpolación geométrica)
+            interval = max_interval * (self.min_interval / max_interval) ** activity
+            if self.frame_seconds is not None:
+                # Nunca más rápido de lo que permite la parte del presupuesto que le corresponde
+                # a la cámara por su prioridad (aunque eso alargue el intervalo de reposo)
+                rate = self._effective_budget() * self.workers / max(self.frame_seconds, 1e-3)
+                total_priority = priority + sum(other_priority for other, (other_priority, _)
+                                                in self.cameras.items() if other != camera)
+                interval = max(interval, total_priority / max(rate * priority, 1e-6))
+            self.cameras[camera] = (priority, interval)
+            return interval
+
+    def get_stats(self, camera=None):
+        """
+        Obtiene el estado del planificador
+        :param camera: Si se indica, incluye el intervalo y el ritmo actuales de esa cámara
+        :return: Diccionario con presupuesto, uso medido, coste por frame y carga del sistema
+        """
+        now = time.time()
+        with self.lock:
+            busy = sum(seconds for started, seconds in self.busy if now - started <= self.window)
+            stats = {
+                'cpu_budget': self.cpu_budget,
+                'effective_budget': round(self._effective_budget(), 3),
+                'usage': round(busy / (self.window * self.workers), 3),
+                'frame_ms': round(self.frame_seconds * 1000, 1) if self.frame_seconds is not None else None,
+                'system_load': round(self.load, 2) if self.load is not None else None
+            }
+            if camera is not None and camera in self.cameras:
+                _, interval = self.cameras[camera]
+                stats.update({
+                    'interval': round(interval, 2),
+                    'rate': round(1.0 / interval, 3),
+                    'person_recent': self._is_active(camera, now)
+                })
+            return stats
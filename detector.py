@@ -1,46 +1,219 @@
 import os
 import time
-import torch
+import random
+import threading
 import numpy as np
 from PIL import Image
-from transformers import AutoImageProcessor, AutoModelForObjectDetection
+from history_store import DetectionHistory
+from metrics import metrics
+from results import Detections, LabelTable, post_process
+
+# torch, transformers y los backends se importan al cargar el modelo: así el servidor
+# puede arrancar sin esperar a estas importaciones, que tardan varios segundos
+
+MODEL_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "cache")
 
 class PersonDetector:
-    def __init__(self, model_name="facebook/detr-resnet-50", confidence_threshold=0.8):
+    def __init__(self, model_name="facebook/detr-resnet-50", confidence_threshold=0.8, backend="torch",
+                 fast_preprocess=True, inference_size=800, history_store=None, background=False,
+                 model_cache=True, warmup_runs=2, load_timeout=600, on_status=None, result_cache=None,
+                 candidate_floor=0.1, on_inference=None):
         """
         Inicializa el detector de personas y objetos
         :param model_name: Nombre o ruta del modelo a usar
         :param confidence_threshold: Umbral de confianza para detecciones (0.0-1.0)
+        :param backend: Motor de inferencia ('torch', 'torchscript', 'onnx' o 'int8')
+        :param fast_preprocess: Si es True, preprocesa con NumPy/OpenCV en lugar de PIL y el procesador de Hugging Face
+        :param inference_size: Lado más corto (en píxeles) de la imagen que recibe el modelo en el modo rápido
+        :param history_store: HistoryStore opcional donde se registran todas las detecciones
+        :param background: Si es True, el modelo se carga en un hilo aparte y el constructor vuelve enseguida
+        :param model_cache: Si es True, guarda una copia del modelo en models/cache para no volver a descargarlo
+        :param warmup_runs: Pasadas sobre un frame sintético antes de aceptar detecciones
+        :param load_timeout: Segundos que una detección espera a que termine la carga
+        :param on_status: Función opcional que recibe get_status() cada vez que cambia el estado de carga
+        :param result_cache: ResultCache opcional para no repetir el modelo con frames casi idénticos
+        :param candidate_floor: Confianza mínima de las candidatas que se conservan para poder cambiar
+                                el umbral sin repetir la detección
+        :param on_inference: Función opcional que recibe (segundos, frames) cada vez que el modelo
+                             analiza frames (no se llama por los que responde la caché)
         """
         self.model_name = model_name
         self.confidence_threshold = confidence_threshold
+        self.candidate_floor = candidate_floor
+        self.backend_name = backend
+        self.fast_preprocess = fast_preprocess
+        self.inference_size = inference_size
         self.model = None
         self.processor = None
-        self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
-        self.history = []  # Historial de detecciones
+        self.backend = None
+        self.preprocessor = None
+        self.labels = None  # LabelTable con los nombres de las clases y cuáles son personas
+        self.inference_lock = threading.Lock()
+        self.device = None
+        self.model_cache = model_cache
+        self.warmup_runs = warmup_runs
+        self.load_timeout = load_timeout
+        self.on_status = on_status
+        self.on_inference = on_inference
+        self.ready = threading.Event()
+        self.state = 'loading'
+        self.load_error = None
+        self.load_source = None
+        self.load_seconds = None
         self.max_history = 3
+        self.history = DetectionHistory(self.max_history, history_store)  # Historial de detecciones
         self.retry_count = 0
         self.max_retries = 3
         self.last_error_time = 0
         self.retry_wait = 5  # segundos
-        self._load_model()
+        self.last_timings = {}  # duración de cada etapa de la última detección (segundos)
+        self.result_cache = result_cache
+        if background:
+            threading.Thread(target=self._load_model, name="model-loader", daemon=True).start()
+        else:
+            self._load_model()
+    
+    def _set_state(self, state, error=None):
+        """Actualiza el estado de carga y avisa a on_status"""
+        self.state = state
+        self.load_error = error
+        if state in ('ready', 'error'):
+            self.ready.set()
+        else:
+            self.ready.clear()
+        if self.on_status:
+            self.on_status(self.get_status())
+    
+    def is_ready(self):
+        """
+        Indica si el modelo está cargado y precalentado
+        :return: True si ya se pueden hacer detecciones
+        """
+        return self.state == 'ready'
+    
+    def get_status(self):
+        """
+        Obtiene el estado de carga del modelo
+        :return: Diccionario con el estado ('loading', 'warming_up', 'ready' o 'error'),
+                 el origen del modelo, el tiempo de carga y el último error
+        """
+        return {
+            'state': self.state,
+            'backend': self.backend.name if self.backend else self.backend_name,
+            'source': self.load_source,
+            'load_seconds': self.load_seconds,
+            'error': self.load_error
+        }
+    
+    def _cache_dir(self):
+        """
+        Carpeta de la copia local del modelo
+        :return: Ruta dentro de models/cache, o None si no se usa la caché
+        """
+        if not self.model_cache or os.path.isdir(self.model_name):
+            return None  # los modelos que ya están en disco no necesitan copia
+        safe_name = self.model_name.strip('/').replace('/', '_')
+        return os.path.join(MODEL_CACHE_DIR, f"{safe_name}.pretrained")
+    
+    def _from_pretrained(self):
+        """
+        Carga el procesador y el modelo, desde la copia local si existe
+        :return: Tupla (procesador, modelo)
+        """
+        from transformers import AutoImageProcessor, AutoModelForObjectDetection
+        
+        cache_dir = self._cache_dir()
+        if cache_dir and os.path.isdir(cache_dir):
+            try:
+                processor = AutoImageProcessor.from_pretrained(cache_dir, local_files_only=True)
+                model = AutoModelForObjectDetection.from_pretrained(cache_dir, local_files_only=True)
+                self.load_source = 'cache'
+                return processor, model
+            except Exception as e:
+                print(f"No se pudo usar la copia local del modelo ({e}); cargando desde {self.model_name}")
+        
+        processor = AutoImageProcessor.from_pretrained(self.model_name)
+        model = AutoModelForObjectDetection.from_pretrained(self.model_name)
+        self.load_source = 'local' if os.path.isdir(self.model_name) else 'hub'
+        if cache_dir:
+            try:
+                # Guardar una copia para arrancar sin red y sin resolver el hub la próxima vez
+                processor.save_pretrained(cache_dir)
+                model.save_pretrained(cache_dir)
+            except Exception as e:
+                print(f"No se pudo guardar la copia local del modelo: {e}")
+        return processor, model
+    
+    def _warmup(self):
+        """Ejecuta el modelo sobre un frame sintético para que la primera detección no pague la preparación"""
+        sample = np.zeros((480, 640, 3), dtype=np.uint8)
+        with self.inference_lock:
+            for _ in range(self.warmup_runs):
+                pixel_values, pixel_mask = self._prepare_inputs([sample])
+                self.backend(pixel_values, pixel_mask)
     
     def _load_model(self):
-        """Carga el modelo de detección desde Hugging Face"""
+        """Carga el modelo de detección desde Hugging Face (o desde la copia local)"""
+        start_time = time.time()
+        self._set_state('loading')
         try:
+            import torch
+            from preprocessing import FramePreprocessor
+            
+            self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
             print(f"Cargando modelo de detección desde {self.model_name}...")
             print(f"Usando dispositivo: {self.device}")
             
-            self.processor = AutoImageProcessor.from_pretrained(self.model_name)
-            self.model = AutoModelForObjectDetection.from_pretrained(self.model_name)
+            self.processor, self.model = self._from_pretrained()
             
             # Mover modelo a GPU si está disponible
             self.model.to(self.device)
-            print("Modelo cargado correctamente")
+            self.model.eval()
+            self.labels = LabelTable(self.model.config.id2label)
+            
+            # Preprocesamiento rápido con las mismas medias/desviaciones que el procesador
+            if self.fast_preprocess:
+                self.preprocessor = FramePreprocessor(
+                    shortest_edge=self.inference_size,
+                    image_mean=self.processor.image_mean,
+                    image_std=self.processor.image_std
+                )
+            self.backend = self._create_backend()
+            
+            if self.warmup_runs:
+                self._set_state('warming_up')
+                self._warmup()
+            self.load_seconds = round(time.time() - start_time, 2)
+            print(f"Modelo cargado correctamente (backend: {self.backend.name}, "
+                  f"origen: {self.load_source}, {self.load_seconds} s)")
+            self._set_state('ready')
         except Exception as e:
             print(f"Error al cargar el modelo: {e}")
             self.model = None
             self.processor = None
+            self.backend = None
+            self._set_state('error', str(e))
+    
+    def _create_backend(self):
+        """
+        Crea el backend de inferencia configurado, volviendo a PyTorch si falla
+        :return: Backend invocable con (pixel_values, pixel_mask)
+        """
+        from backends import create_backend, TorchBackend
+        
+        if self.backend_name == 'torch':
+            return TorchBackend(self.model, self.device)
+        
+        try:
+            # Entrada de ejemplo con el tamaño típico de la cámara para exportar el modelo
+            sample = np.zeros((480, 640, 3), dtype=np.uint8)
+            example_inputs = tuple(tensor.clone() for tensor in self._prepare_inputs([sample]))
+            return create_backend(self.backend_name, self.model, self.device,
+                                  self.model_name, example_inputs)
+        except Exception as e:
+            print(f"Error al preparar el backend '{self.backend_name}': {e}")
+            print("Usando el backend de PyTorch")
+            return TorchBackend(self.model, self.device)
     
     def _can_retry(self):
         """Determina si se puede reintentar después de un error"""
@@ -53,137 +226,233 @@ class PersonDetector:
             return False
         return True
 
+    def _prepare_inputs(self, images, shortest_edges=None):
+        """
+        Convierte frames BGR en las entradas del modelo
+        :param images: Lista de imágenes de OpenCV (numpy arrays en formato BGR)
+        :param shortest_edges: Lista opcional con el lado más corto de cada imagen (sólo en el modo rápido)
+        :return: Tupla (pixel_values, pixel_mask) como tensores de PyTorch
+        """
+        if self.preprocessor is not None:
+            return self.preprocessor(images, shortest_edges)
+        
+        # Convertir imágenes de BGR (OpenCV) a RGB (PIL) y usar el procesador de Hugging Face
+        # (el procesador rellena las imágenes a un tamaño común)
+        images_rgb = [cv2_to_pil(image) for image in images]
+        inputs = self.processor(images=images_rgb, return_tensors="pt")
+        return inputs['pixel_values'], inputs['pixel_mask']
+
     def detect(self, image):
         """
         Detecta personas y objetos en una imagen
         :param image: Imagen de OpenCV (numpy array en formato BGR)
-        :return: Tupla (boxes, labels, scores, has_person, suggestions)
+        :return: Tupla (Detections, sugerencia)
+        """
+        return self.detect_batch([image])[0]
+    
+    def detect_batch(self, images, sources=None, shortest_edges=None):
+        """
+        Detecta personas y objetos en varias imágenes con una sola pasada del modelo
+        :param images: Lista de imágenes de OpenCV (numpy arrays en formato BGR)
+        :param sources: Lista opcional con la cámara de cada imagen (para el historial)
+        :param shortest_edges: Lista opcional con el lado más corto con el que se analiza cada imagen
+        :return: Lista de tuplas (Detections, sugerencia), una por imagen
         """
         # Valores por defecto en caso de error
-        empty_result = ([], [], [], False, "No se pudieron realizar detecciones.")
+        empty_result = (Detections(labels=self.labels), "No se pudieron realizar detecciones.")
+        if not images:
+            return []
+        
+        # Si el modelo se está cargando en segundo plano, esperar a que termine
+        if not self.ready.wait(self.load_timeout):
+            return [empty_result] * len(images)
         
         # Verificar si el modelo está cargado
-        if self.model is None or self.processor is None:
+        if self.backend is None or self.processor is None:
             if self._can_retry():
                 print("Reintentando cargar el modelo...")
                 self._load_model()
                 self.retry_count += 1
                 self.last_error_time = time.time()
-            if self.model is None or self.processor is None:
-                return empty_result
+            if self.backend is None or self.processor is None:
+                return [empty_result] * len(images)
         
         try:
-            # Convertir imagen de BGR (OpenCV) a RGB (PIL)
-            image_rgb = cv2_to_pil(image)
-            
-            # Preprocesar la imagen
-            inputs = self.processor(images=image_rgb, return_tensors="pt")
-            inputs = {k: v.to(self.device) for k, v in inputs.items()}
-            
-            # Realizar la inferencia
-            with torch.no_grad():
-                outputs = self.model(**inputs)
-            
-            # Postprocesar los resultados
-            target_sizes = torch.tensor([image_rgb.size[::-1]])
-            results = self.processor.post_process_object_detection(
-                outputs, threshold=self.confidence_threshold, target_sizes=target_sizes)[0]
-            
-            # Extraer cajas, puntuaciones y etiquetas
-            boxes = results["boxes"].cpu().numpy()
-            scores = results["scores"].cpu().numpy()
-            labels = results["labels"].cpu().numpy()
-            
-            # Convertir etiquetas numéricas a texto
-            label_names = [self.model.config.id2label[label.item()] for label in labels]
-            
-            # Verificar si hay personas
-            has_person = any(label.lower() == "person" for label in label_names)
-            
-            # Crear una sugerencia humorística si no hay personas
-            suggestion = self._generate_suggestion(has_person, label_names)
-            
-            # Actualizar historial
-            detection_entry = {
-                'timestamp': time.strftime("%H:%M:%S"),
-                'has_person': has_person,
-                'objects': [f"{label} ({score:.2f})" for label, score in zip(label_names, scores)]
-            }
-            self._update_history(detection_entry)
+            # Se guardan todas las candidatas por encima de candidate_floor, así la caché sirve para
+            # cualquier umbral y un cambio de umbral sólo vuelve a filtrarlas.
+            # Los frames casi idénticos a uno reciente reutilizan su resultado sin pasar por el modelo
+            self.last_timings = {}
+            threshold = self.confidence_threshold
+            floor = min(self.candidate_floor, threshold)
+            if self.result_cache is not None:
+                batch_candidates = self.result_cache.get_or_compute(
+                    images, shortest_edges, floor,
+                    lambda missing, edges: self._infer_timed(missing, edges, floor))
+            else:
+                batch_candidates = self._infer_timed(images, shortest_edges, floor)
             
-            return boxes.tolist(), label_names, scores.tolist(), has_person, suggestion
+            sources = sources or [0] * len(images)
+            return [self._build_result(candidates.with_threshold(threshold), source)
+                    for candidates, source in zip(batch_candidates, sources)]
             
         except Exception as e:
             print(f"Error al detectar objetos: {e}")
+            metrics.inc('detection_errors_total')
             self.retry_count += 1
             self.last_error_time = time.time()
-            return empty_result
+            return [empty_result] * len(images)
     
-    def _generate_suggestion(self, has_person, detected_objects):
+    def _infer_timed(self, images, shortest_edges, threshold):
+        """Ejecuta el modelo (como _infer) e informa de su duración a on_inference"""
+        start_time = time.perf_counter()
+        batch_detections = self._infer(images, shortest_edges, threshold)
+        if self.on_inference:
+            self.on_inference(time.perf_counter() - start_time, len(images))
+        return batch_detections
+    
+    def detect_candidates(self, images, shortest_edges=None, threshold=None):
+        """
+        Ejecuta el modelo y devuelve las detecciones tal cual, sin sugerencia, historial ni caché
+        (lo usan los procesos de InferencePool: el resultado se completa en el proceso principal)
+        :param images: Lista de imágenes de OpenCV (numpy arrays en formato BGR)
+        :param shortest_edges: Lista opcional con el lado más corto con el que se analiza cada imagen
+        :param threshold: Umbral de confianza (por defecto, confidence_threshold)
+        :return: Lista de Detections, una por imagen
         """
-        Genera sugerencias humorísticas basadas en detecciones
-        :param has_person: Si hay personas detectadas
-        :param detected_objects: Lista de objetos detectados
-        :return: Sugerencia humorística
+        threshold = self.confidence_threshold if threshold is None else threshold
+        return self._infer(images, shortest_edges, threshold)
+    
+    def _infer(self, images, shortest_edges, threshold):
         """
-        if has_person:
-            return "¡Humano detectado! ¡Sistema de monitoreo funcionando correctamente!"
+        Ejecuta el modelo sobre un lote de imágenes
+        :param images: Lista de imágenes de OpenCV (numpy arrays en formato BGR)
+        :param shortest_edges: Lista opcional con el lado más corto con el que se analiza cada imagen
+        :param threshold: Umbral de confianza
+        :return: Lista de Detections, una por imagen
+        """
+        # Preprocesar e inferir; los buffers del preprocesador se reutilizan entre llamadas
+        with self.inference_lock:
+            start_time = time.perf_counter()
+            pixel_values, pixel_mask = self._prepare_inputs(images, shortest_edges)
+            preprocess_time = time.perf_counter()
+            logits, pred_boxes = self.backend(pixel_values, pixel_mask)
+            forward_time = time.perf_counter()
         
-        if not detected_objects:
-            suggestions = [
-                "No veo a nadie. ¿Se habrán ido todos a tomar café?",
-                "La habitación está vacía. Momento perfecto para practicar tu baile.",
-                "Parece que estoy solo. Tal vez debería aprender a meditar."
-            ]
-        else:
-            object_types = list(set(detected_objects))  # Eliminar duplicados
-            
-            if 'cat' in object_types or 'dog' in object_types:
-                suggestions = [
-                    "¡Veo una mascota! ¿Quién es el animalito bueno?",
-                    "Una mascota detectada. ¡Los humanos no están pero dejaron un supervisor peludo!"
-                ]
-            elif any(item in object_types for item in ['cup', 'bottle']):
-                suggestions = [
-                    "¿Hora del café? Detecto bebidas, pero no humanos.",
-                    "Veo tazas... ¿los humanos volverán pronto por su café?"
-                ]
-            elif any(item in object_types for item in ['chair', 'couch', 'bed']):
-                suggestions = [
-                    "Muebles vacíos detectados. ¿Se habrán cansado de sentarse?",
-                    "Hay muebles pero nadie los usa. ¿Están en huelga los humanos?"
-                ]
-            elif any(item in object_types for item in ['laptop', 'cell phone', 'keyboard']):
-                suggestions = [
-                    "Veo tecnología pero no humanos. ¿La IA ya nos reemplazó?",
-                    "Dispositivos abandonados. ¿Tal vez fueron a cargar sus baterías biológicas?"
-                ]
-            else:
-                suggestions = [
-                    f"Veo {', '.join(object_types)}, pero ningún humano a la vista.",
-                    "Interesante colección de objetos, pero sin rastro de sus dueños."
-                ]
+        # Postprocesar todo el lote a la vez con NumPy (cajas en coordenadas del frame original)
+        target_sizes = [image.shape[:2] for image in images]
+        batch_detections = post_process(to_numpy(logits), to_numpy(pred_boxes), target_sizes,
+                                        threshold, self.labels)
         
-        # Seleccionar una sugerencia aleatoria
-        import random
-        return random.choice(suggestions)
+        self.last_timings = {
+            'preprocess': preprocess_time - start_time,
+            'forward': forward_time - preprocess_time,
+            'postprocess': time.perf_counter() - forward_time
+        }
+        record_timings(self.last_timings, len(images))
+        return batch_detections
     
-    def _update_history(self, entry):
+    def get_cache_stats(self):
         """
-        Actualiza el historial de detecciones
-        :param entry: Entrada nueva para el historial
+        Obtiene los contadores de la caché de resultados
+        :return: Diccionario de ResultCache.get_stats() o None si no hay caché
         """
-        self.history.append(entry)
-        # Limitar el tamaño del historial
-        if len(self.history) > self.max_history:
-            self.history.pop(0)  # Eliminar la entrada más antigua
+        return self.result_cache.get_stats() if self.result_cache is not None else None
+    
+    def _build_result(self, detections, source=0):
+        """
+        Completa el resultado de una imagen con la sugerencia y lo registra en el historial
+        :param detections: Detections de la imagen
+        :param source: Cámara de la que proviene la imagen (para el historial)
+        :return: Tupla (Detections, sugerencia)
+        """
+        # Verificar si hay personas (máscara precalculada por clase)
+        has_person = detections.has_person
+        
+        # Crear una sugerencia humorística si no hay personas
+        suggestion = generate_suggestion(has_person, detections.unique_labels())
+        
+        # Actualizar historial
+        self.history.record(has_person, detections.labels, detections.scores.tolist(), suggestion, camera=source)
+        
+        return detections, suggestion
     
     def get_history(self):
         """
         Obtiene el historial de detecciones
         :return: Lista de detecciones recientes
         """
-        return self.history
+        return self.history.get_recent()
+
+
+def generate_suggestion(has_person, detected_objects):
+    """
+    Genera sugerencias humorísticas basadas en detecciones
+    :param has_person: Si hay personas detectadas
+    :param detected_objects: Lista de objetos detectados
+    :return: Sugerencia humorística
+    """
+    if has_person:
+        return "¡Humano detectado! ¡Sistema de monitoreo funcionando correctamente!"
+    
+    if not detected_objects:
+        suggestions = [
+            "No veo a nadie. ¿Se habrán ido todos a tomar café?",
+            "La habitación está vacía. Momento perfecto para practicar tu baile.",
+            "Parece que estoy solo. Tal vez debería aprender a meditar."
+        ]
+    else:
+        object_types = list(set(detected_objects))  # Eliminar duplicados
+        
+        if 'cat' in object_types or 'dog' in object_types:
+            suggestions = [
+                "¡Veo una mascota! ¿Quién es el animalito bueno?",
+                "Una mascota detectada. ¡Los humanos no están pero dejaron un supervisor peludo!"
+            ]
+        elif any(item in object_types for item in ['cup', 'bottle']):
+            suggestions = [
+                "¿Hora del café? Detecto bebidas, pero no humanos.",
+                "Veo tazas... ¿los humanos volverán pronto por su café?"
+            ]
+        elif any(item in object_types for item in ['chair', 'couch', 'bed']):
+            suggestions = [
+                "Muebles vacíos detectados. ¿Se habrán cansado de sentarse?",
+                "Hay muebles pero nadie los usa. ¿Están en huelga los humanos?"
+            ]
+        elif any(item in object_types for item in ['laptop', 'cell phone', 'keyboard']):
+            suggestions = [
+                "Veo tecnología pero no humanos. ¿La IA ya nos reemplazó?",
+                "Dispositivos abandonados. ¿Tal vez fueron a cargar sus baterías biológicas?"
+            ]
+        else:
+            suggestions = [
+                f"Veo {', '.join(object_types)}, pero ningún humano a la vista.",
+                "Interesante colección de objetos, pero sin rastro de sus dueños."
+            ]
+    
+    # Seleccionar una sugerencia aleatoria
+    return random.choice(suggestions)
+
+
+def record_timings(timings, frames):
+    """
+    Registra en las métricas la duración de las etapas de una detección
+    :param timings: Diccionario {etapa: segundos}
+    :param frames: Frames analizados en la detección
+    """
+    for stage, seconds in timings.items():
+        metrics.observe('pipeline_stage_seconds', seconds, stage=stage)
+    metrics.inc('detections_total', frames)
+
+
+def to_numpy(tensor):
+    """
+    Convierte una salida del backend (tensor de PyTorch o array) en array de NumPy
+    :param tensor: Tensor o array
+    :return: numpy array
+    """
+    if hasattr(tensor, 'detach'):
+        return tensor.detach().cpu().numpy()
+    return np.asarray(tensor)
 
 
 def cv2_to_pil(cv2_img):
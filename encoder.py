@@ -0,0 +1,92 @@
+import time
+import cv2
+from metrics import metrics
+
+# Codificadores JPEG opcionales, más rápidos que cv2.imencode
+try:
+    from turbojpeg import TurboJPEG
+except ImportError:
+    TurboJPEG = None
+
+try:
+    import simplejpeg
+except ImportError:
+    simplejpeg = None
+
+ENCODER_BACKENDS = ('auto', 'turbojpeg', 'simplejpeg', 'opencv')
+
+
+class JpegEncoder:
+    def __init__(self, quality=80, scale=1.0, backend='auto'):
+        """
+        Codificador JPEG con calidad y resolución configurables
+        :param quality: Calidad JPEG por defecto (1-100)
+        :param scale: Factor de escala por defecto de la resolución (1.0 = tamaño original)
+        :param backend: 'auto', 'turbojpeg' (PyTurboJPEG), 'simplejpeg' u 'opencv'
+        """
+        self.quality = quality
+        self.scale = scale
+        self.turbo = None
+        self.backend = self._select_backend(backend)
+
+    def _select_backend(self, backend):
+        """
+        Elige el codificador disponible, volviendo a OpenCV si el pedido no está instalado
+        :param backend: Nombre del codificador pedido
+        :return: Nombre del codificador que se usará
+        """
+        if backend not in ENCODER_BACKENDS:
+            raise ValueError(f"Codificador desconocido: {backend} (opciones: {', '.join(ENCODER_BACKENDS)})")
+
+        if backend in ('auto', 'turbojpeg') and TurboJPEG is not None:
+            try:
+                self.turbo = TurboJPEG()
+                return 'turbojpeg'
+            except Exception as e:
+                # PyTurboJPEG instalado pero sin la biblioteca libjpeg-turbo
+                print(f"No se pudo inicializar libjpeg-turbo: {e}")
+        if backend in ('auto', 'turbojpeg', 'simplejpeg') and simplejpeg is not None:
+            return 'simplejpeg'
+        if backend not in ('auto', 'opencv'):
+            print(f"Codificador '{backend}' no disponible, usando OpenCV")
+        return 'opencv'
+
+    def encode(self, frame, quality=None, scale=None):
+        """
+        Codifica un frame BGR a JPEG
+        :param frame: Imagen de OpenCV (numpy array en formato BGR)
+        :param quality: Calidad JPEG (por defecto, la del codificador)
+        :param scale: Factor de escala de la resolución (por defecto, el del codificador)
+        :return: Bytes de la imagen en formato JPEG, o None si falla
+        """
+        start_time = time.perf_counter()
+        try:
+            return self._encode(frame, int(quality or self.quality), scale or self.scale)
+        finally:
+            metrics.observe('pipeline_stage_seconds', time.perf_counter() - start_time, stage='encode')
+            metrics.inc('frames_encoded_total')
+
+    def _encode(self, frame, quality, scale):
+        """
+        Codifica un frame con la calidad y escala indicadas
+        :param frame: Imagen BGR
+        :param quality: Calidad JPEG
+        :param scale: Factor de escala
+        :return: Bytes JPEG o None si falla
+        """
+        if scale != 1.0:
+            height, width = frame.shape[:2]
+            size = (max(1, int(width * scale)), max(1, int(height * scale)))
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+        if self.backend == 'turbojpeg':
+            return self.turbo.encode(frame, quality=quality)
+        if self.backend == 'simplejpeg':
+            if not frame.flags['C_CONTIGUOUS']:
+                frame = frame.copy()
+            return simplejpeg.encode_jpeg(frame, quality=quality, colorspace='BGR')
+
+        ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ret:
+            return None
+        return buffer.tobytes()
@@ -0,0 +1,151 @@
+import json
+import asyncio
+import threading
+from collections import deque
+
+from streaming import AsyncNotifier
+
+
+class ResultEvents:
+    def __init__(self, backlog=100):
+        """
+        Canal de eventos para empujar a los clientes los resultados nuevos.
+        Cada evento sólo lleva los campos que cambiaron respecto al anterior del mismo tipo y cámara.
+        :param backlog: Número de eventos recientes que se conservan para clientes que se atrasan
+        """
+        self.condition = threading.Condition()
+        self.version = 0
+        self.events = deque(maxlen=backlog)  # (versión, tipo, datos)
+        self.state = {}  # (tipo, cámara) -> último contenido completo
+        self.versions = {}  # (tipo, cámara) -> versión de su último cambio
+        self.async_notifier = AsyncNotifier()  # avisos para los clientes del servidor ASGI
+
+    def publish(self, event_type, payload, camera=None):
+        """
+        Publica un contenido nuevo; si no cambió nada no se emite ningún evento
+        :param event_type: Tipo de evento ('detection', 'settings', ...)
+        :param payload: Diccionario con el contenido completo
+        :param camera: Cámara a la que se refiere el evento (None si es global)
+        :return: Versión del contenido tras publicar
+        """
+        key = (event_type, camera)
+        with self.condition:
+            previous = self.state.get(key)
+            delta = {name: value for name, value in payload.items()
+                     if previous is None or previous.get(name) != value}
+            if previous is not None and not delta:
+                return self.versions[key]
+
+            self.version += 1
+            self.state[key] = dict(payload)
+            self.versions[key] = self.version
+            if camera is not None:
+                delta['camera'] = camera
+            self.events.append((self.version, event_type, delta))
+            self.condition.notify_all()
+            version = self.version
+        self.async_notifier.notify()
+        return version
+
+    def get_version(self, event_type, camera=None):
+        """
+        Obtiene la versión del último cambio de un contenido
+        :param event_type: Tipo de evento
+        :param camera: Cámara (None si es global)
+        :return: Número de versión (0 si nunca se publicó)
+        """
+        with self.condition:
+            return self.versions.get((event_type, camera), 0)
+
+    def snapshot(self):
+        """
+        Obtiene el estado completo actual
+        :return: Tupla (versión actual, lista de eventos con el contenido completo)
+        """
+        with self.condition:
+            return self.version, self._snapshot()
+
+    def _snapshot(self):
+        """Estado completo actual como lista de eventos (llamar con condition tomado)"""
+        events = []
+        for (event_type, camera), payload in self.state.items():
+            data = dict(payload)
+            if camera is not None:
+                data['camera'] = camera
+            events.append((self.versions[(event_type, camera)], event_type, data))
+        events.sort(key=lambda event: event[0])
+        return events
+
+    def wait(self, last_version, timeout=None):
+        """
+        Espera eventos posteriores a una versión
+        :param last_version: Última versión que ya tiene el cliente
+        :param timeout: Tiempo máximo de espera en segundos
+        :return: Lista de eventos (versión, tipo, datos); vacía si no hubo cambios
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.version > last_version, timeout)
+            if self.version <= last_version:
+                return []
+            # Si el cliente se atrasó más que el backlog, recibe el estado completo
+            if not self.events or self.events[0][0] > last_version + 1:
+                return [event for event in self._snapshot() if event[0] > last_version]
+            return [event for event in self.events if event[0] > last_version]
+
+    @staticmethod
+    def _format(events, last_version, camera=None):
+        """
+        Convierte eventos al formato text/event-stream
+        :param events: Lista de eventos (versión, tipo, datos)
+        :param last_version: Última versión enviada al cliente
+        :param camera: Si se indica, se omiten los eventos de otras cámaras
+        :return: Tupla (última versión tras estos eventos, lista de mensajes)
+        """
+        messages = []
+        for version, event_type, data in events:
+            last_version = max(last_version, version)
+            if camera is not None and data.get('camera', camera) != camera:
+                continue
+            messages.append(f"id: {version}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n")
+        return last_version, messages
+
+    def stream(self, camera=None, keepalive=15.0):
+        """
+        Generador de mensajes Server-Sent Events
+        :param camera: Si se indica, sólo se envían los eventos de esa cámara y los globales
+        :param keepalive: Segundos sin eventos tras los que se envía un comentario para mantener la conexión
+        :return: Generador de cadenas en formato text/event-stream
+        """
+        # Al conectarse, el cliente recibe el estado completo; después, sólo los cambios
+        last_version, events = self.snapshot()
+        yield "retry: 3000\n\n"
+        while True:
+            last_version, messages = self._format(events, last_version, camera)
+            yield from messages
+            events = self.wait(last_version, keepalive)
+            if not events:
+                yield ": keep-alive\n\n"
+
+    async def stream_async(self, camera=None, keepalive=15.0):
+        """
+        Versión asíncrona de stream para servidores ASGI (la espera no ocupa ningún hilo)
+        :param camera: Si se indica, sólo se envían los eventos de esa cámara y los globales
+        :param keepalive: Segundos sin eventos tras los que se envía un comentario para mantener la conexión
+        :return: Generador asíncrono de cadenas en formato text/event-stream
+        """
+        last_version, events = self.snapshot()
+        yield "retry: 3000\n\n"
+        while True:
+            last_version, messages = self._format(events, last_version, camera)
+            for message in messages:
+                yield message
+            while True:
+                # Tomar el evento antes de comprobar para no perder un aviso intermedio
+                notified = self.async_notifier.current()
+                events = self.wait(last_version, 0)
+                if events:
+                    break
+                try:
+                    await asyncio.wait_for(notified.wait(), keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
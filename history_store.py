@@ -0,0 +1,294 @@
+import os
+import time
+import queue
+import sqlite3
+import threading
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS detections (
+    id INTEGER PRIMARY KEY,
+    timestamp REAL NOT NULL,
+    camera INTEGER NOT NULL DEFAULT 0,
+    has_person INTEGER NOT NULL,
+    suggestion TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_detections_timestamp ON detections (timestamp);
+CREATE INDEX IF NOT EXISTS idx_detections_person ON detections (has_person, timestamp);
+CREATE TABLE IF NOT EXISTS detection_objects (
+    detection_id INTEGER NOT NULL,
+    label TEXT NOT NULL,
+    score REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_objects_label ON detection_objects (label, detection_id);
+CREATE INDEX IF NOT EXISTS idx_objects_detection ON detection_objects (detection_id);
+"""
+
+
+class HistoryStore:
+    def __init__(self, path, retention_days=30, batch_size=200, flush_interval=1.0,
+                 compact_interval=3600, max_queue=10000):
+        """
+        Registro persistente de detecciones en SQLite (modo WAL).
+        Las escrituras se encolan y un hilo propio las guarda por lotes, de modo que
+        ni el hilo de inferencia ni las peticiones web esperan al disco.
+        :param path: Ruta del archivo de base de datos
+        :param retention_days: Días que se conservan las detecciones (None para no borrar nunca)
+        :param batch_size: Detecciones máximas por transacción
+        :param flush_interval: Segundos máximos que una detección espera en la cola
+        :param compact_interval: Segundos entre limpiezas de detecciones antiguas
+        :param max_queue: Tamaño máximo de la cola; si se llena se descartan detecciones
+        """
+        self.path = path
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.compact_interval = compact_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.written = 0
+        self.running = False
+        self.thread = None
+        self.local = threading.local()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # auto_vacuum sólo tiene efecto si se fija antes de crear las tablas y de activar WAL
+        connection = sqlite3.connect(path, timeout=10)
+        connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        connection.executescript(SCHEMA)
+        connection.commit()
+        connection.close()
+
+    def _connect(self):
+        """
+        Obtiene la conexión del hilo actual (SQLite no comparte conexiones entre hilos)
+        :return: Conexión sqlite3
+        """
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    def start(self):
+        """Arranca el hilo de escritura"""
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._writer_loop, name="history-writer", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=5.0):
+        """
+        Detiene el hilo de escritura tras guardar lo pendiente
+        :param timeout: Tiempo máximo en segundos para esperar a que termine
+        """
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def append(self, timestamp, camera, has_person, labels, scores, suggestion=None):
+        """
+        Encola una detección para guardarla (no bloquea)
+        :param timestamp: Momento de la detección (time.time())
+        :param camera: Identificador de la cámara
+        :param has_person: Si se detectaron personas
+        :param labels: Lista de etiquetas detectadas
+        :param scores: Lista de puntuaciones de confianza
+        :param suggestion: Sugerencia mostrada al usuario
+        """
+        try:
+            self.queue.put_nowait((timestamp, camera, bool(has_person),
+                                   list(labels), [float(score) for score in scores], suggestion))
+        except queue.Full:
+            self.dropped += 1
+
+    def _writer_loop(self):
+        """Bucle del hilo de escritura: agrupa las detecciones en transacciones"""
+        last_compact = 0
+        while self.running or not self.queue.empty():
+            batch = []
+            try:
+                batch.append(self.queue.get(timeout=self.flush_interval))
+                while len(batch) < self.batch_size:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except sqlite3.Error as e:
+                    print(f"Error al guardar el historial: {e}")
+
+            if self.retention_days is not None and time.time() - last_compact >= self.compact_interval:
+                try:
+                    self.compact()
+                except sqlite3.Error as e:
+                    print(f"Error al compactar el historial: {e}")
+                last_compact = time.time()
+
+    def _write_batch(self, batch):
+        """
+        Guarda un lote de detecciones en una única transacción
+        :param batch: Lista de tuplas encoladas por append
+        """
+        connection = self._connect()
+        with connection:
+            for timestamp, camera, has_person, labels, scores, suggestion in batch:
+                cursor = connection.execute(
+                    "INSERT INTO detections (timestamp, camera, has_person, suggestion) VALUES (?, ?, ?, ?)",
+                    (timestamp, camera, int(has_person), suggestion))
+                detection_id = cursor.lastrowid
+                connection.executemany(
+                    "INSERT INTO detection_objects (detection_id, label, score) VALUES (?, ?, ?)",
+                    [(detection_id, label, score) for label, score in zip(labels, scores)])
+        self.written += len(batch)
+
+    def compact(self):
+        """Borra las detecciones más antiguas que el periodo de retención y libera espacio"""
+        if self.retention_days is None:
+            return
+        cutoff = time.time() - self.retention_days * 86400
+        connection = self._connect()
+        with connection:
+            connection.execute(
+                "DELETE FROM detection_objects WHERE detection_id IN "
+                "(SELECT id FROM detections WHERE timestamp < ?)", (cutoff,))
+            deleted = connection.execute("DELETE FROM detections WHERE timestamp < ?", (cutoff,)).rowcount
+        if deleted:
+            connection.execute("PRAGMA incremental_vacuum")
+            connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def query(self, since=None, until=None, has_person=None, label=None, camera=None, page=1, per_page=50):
+        """
+        Consulta paginada del historial, de la detección más reciente a la más antigua
+        :param since: Instante mínimo (time.time()) o None
+        :param until: Instante máximo (time.time()) o None
+        :param has_person: Filtrar por presencia de personas (True/False) o None
+        :param label: Sólo detecciones que incluyan esta etiqueta, o None
+        :param camera: Sólo detecciones de esta cámara, o None
+        :param page: Número de página (desde 1)
+        :param per_page: Resultados por página
+        :return: Diccionario con 'items', 'total', 'page' y 'per_page'
+        """
+        conditions, params = [], []
+        if since is not None:
+            conditions.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("timestamp <= ?")
+            params.append(until)
+        if has_person is not None:
+            conditions.append("has_person = ?")
+            params.append(int(has_person))
+        if camera is not None:
+            conditions.append("camera = ?")
+            params.append(camera)
+        if label is not None:
+            conditions.append("id IN (SELECT detection_id FROM detection_objects WHERE label = ?)")
+            params.append(label)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        page = max(1, page)
+        per_page = max(1, per_page)
+        connection = self._connect()
+        total = connection.execute(f"SELECT COUNT(*) FROM detections {where}", params).fetchone()[0]
+        rows = connection.execute(
+            f"SELECT id, timestamp, camera, has_person, suggestion FROM detections {where} "
+            f"ORDER BY timestamp DESC LIMIT ? OFFSET ?",
+            params + [per_page, (page - 1) * per_page]).fetchall()
+
+        # Objetos de todas las detecciones de la página en una sola consulta
+        objects = {row[0]: [] for row in rows}
+        if rows:
+            placeholders = ",".join("?" * len(rows))
+            for detection_id, object_label, score in connection.execute(
+                    f"SELECT detection_id, label, score FROM detection_objects "
+                    f"WHERE detection_id IN ({placeholders})", list(objects)):
+                objects[detection_id].append({'label': object_label, 'score': score})
+
+        items = [{
+            'id': detection_id,
+            'timestamp': timestamp,
+            'time': datetime.fromtimestamp(timestamp).isoformat(timespec='seconds'),
+            'camera': camera_id,
+            'has_person': bool(person),
+            'suggestion': suggestion,
+            'objects': objects[detection_id]
+        } for detection_id, timestamp, camera_id, person, suggestion in rows]
+
+        return {'items': items, 'total': total, 'page': page, 'per_page': per_page}
+
+    def get_stats(self):
+        """
+        Obtiene los contadores del registro
+        :return: Diccionario con detecciones guardadas, pendientes y descartadas
+        """
+        return {
+            'written': self.written,
+            'pending': self.queue.qsize(),
+            'dropped': self.dropped
+        }
+
+
+class DetectionHistory:
+    def __init__(self, max_recent=3, store=None):
+        """
+        Historial de detecciones: las más recientes en memoria (acotadas) para la interfaz
+        y, opcionalmente, todas en un HistoryStore persistente.
+        Las recientes son una tupla inmutable con versión que se reemplaza en cada registro:
+        se leen sin lock y su versión para la interfaz se arma una sola vez por cambio.
+        :param max_recent: Número de detecciones recientes que se conservan en memoria
+        :param store: HistoryStore opcional donde se registran todas las detecciones
+        """
+        self.max_recent = max_recent
+        self.recent = (0, ())  # (versión, detecciones)
+        self.formatted = (0, [])  # (versión, lista para la interfaz)
+        self.store = store
+        self.lock = threading.Lock()
+
+    @property
+    def version(self):
+        return self.recent[0]
+
+    def record(self, has_person, labels, scores, suggestion=None, camera=0, timestamp=None):
+        """
+        Registra una detección
+        :param has_person: Si se detectaron personas
+        :param labels: Lista de etiquetas detectadas
+        :param scores: Lista de puntuaciones de confianza
+        :param suggestion: Sugerencia mostrada al usuario
+        :param camera: Identificador de la cámara
+        :param timestamp: Momento de la detección (por defecto, ahora)
+        """
+        timestamp = timestamp or time.time()
+        # El texto para la interfaz se arma al consultarlo, no en cada detección
+        entry = (timestamp, camera, has_person, tuple(labels), tuple(scores))
+        with self.lock:
+            version, recent = self.recent
+            self.recent = (version + 1, (recent + (entry,))[-self.max_recent:] if self.max_recent > 0 else ())
+        if self.store is not None:
+            self.store.append(timestamp, camera, has_person, labels, scores, suggestion)
+
+    def get_recent(self):
+        """
+        Obtiene las detecciones recientes (la lista se comparte entre lectores: no modificarla)
+        :return: Lista de detecciones, de la más antigua a la más reciente
+        """
+        version, recent = self.recent
+        formatted_version, formatted = self.formatted
+        if formatted_version == version:
+            return formatted
+        formatted = [{
+            'timestamp': time.strftime("%H:%M:%S", time.localtime(timestamp)),
+            'camera': camera,
+            'has_person': has_person,
+            'objects': [f"{label} ({score:.2f})" for label, score in zip(labels, scores)]
+        } for timestamp, camera, has_person, labels, scores in recent]
+        self.formatted = (version, formatted)
+        return formatted
@@ -0,0 +1,208 @@
+import threading
+import time
+from metrics import metrics
+
+
+class InferenceWorker:
+    def __init__(self, detect_fn, batch_size=1, max_wait=0.0, on_error=None, concurrency=1, weight_fn=None):
+        """
+        Inicializa el hilo de inferencia en segundo plano
+        :param detect_fn: Función que recibe una lista de tuplas (fuente, frame) y devuelve
+                          una lista con el resultado de cada una, en el mismo orden
+        :param batch_size: Número máximo de frames que se agrupan en un mismo lote
+        :param max_wait: Segundos máximos que se espera a completar un lote desde el primer frame
+        :param on_error: Función opcional que recibe la excepción si la detección falla
+        :param concurrency: Lotes que se pueden procesar a la vez (uno por hilo); nunca hay
+                            dos frames de la misma fuente en curso al mismo tiempo
+        :param weight_fn: Función opcional que recibe una fuente y devuelve su peso; si se indica,
+                          cuando hay más fuentes esperando que sitio en el lote se reparte la
+                          capacidad en proporción a los pesos (si no, se atiende a las más antiguas)
+        """
+        self.detect_fn = detect_fn
+        self.batch_size = max(1, batch_size)
+        self.max_wait = max_wait
+        self.on_error = on_error
+        self.concurrency = max(1, concurrency)
+        self.weight_fn = weight_fn
+        self.condition = threading.Condition()
+        self.threads = []
+        self.running = False
+        # Slots acotados: por cada fuente sólo se guarda su frame más reciente pendiente
+        self.pending = {}
+        self.in_flight = set()  # fuentes con un frame en proceso
+        self.first_pending_time = None
+        self.next_ticket = 0
+        self.done_tickets = {}
+        self.last_results = {}
+        self.last_errors = {}  # excepción de la última detección de cada fuente (None si terminó bien)
+        self.dropped_frames = 0
+        self.batches = 0
+        # Planificación justa (start-time fair queueing): cada fuente avanza su tiempo virtual
+        # en 1 / peso por frame atendido y siempre se atiende primero la más atrasada
+        self.virtual_time = 0.0
+        self.finish_times = {}
+        self.served = {}
+
+    def start(self):
+        """Arranca los hilos de inferencia si no están en marcha"""
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        for index in range(self.concurrency):
+            name = "inference-worker" if self.concurrency == 1 else f"inference-worker-{index}"
+            thread = threading.Thread(target=self._run, name=name, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, timeout=None):
+        """
+        Detiene los hilos de inferencia
+        :param timeout: Tiempo máximo en segundos para esperar a cada hilo
+        """
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+
+    def submit(self, frame, source=0):
+        """
+        Publica un frame para analizar sin bloquear al llamador.
+        Si la fuente ya tenía un frame pendiente se descarta en favor del nuevo.
+        :param frame: Imagen de OpenCV (numpy array en formato BGR)
+        :param source: Identificador de la cámara de la que proviene el frame
+        :return: Número de ticket para esperar el resultado con wait_result
+        """
+        with self.condition:
+            if source in self.pending:
+                self.dropped_frames += 1
+            elif not self.pending:
+                self.first_pending_time = time.time()
+            self.next_ticket += 1
+            self.pending[source] = (self.next_ticket, frame, time.time())
+            self.condition.notify_all()
+            return self.next_ticket
+
+    def wait_result(self, ticket, source=0, timeout=None):
+        """
+        Espera el resultado de un frame publicado.
+        Si el frame fue reemplazado por otro más reciente, devuelve el resultado de éste.
+        :param ticket: Ticket devuelto por submit
+        :param source: Identificador de la cámara usado en submit
+        :param timeout: Tiempo máximo de espera en segundos (None para esperar indefinidamente)
+        :return: Resultado de la detección o None si no hubo resultado a tiempo
+        :raises RuntimeError: Si la detección falló (la causa queda en __cause__)
+        """
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.done_tickets.get(source, 0) >= ticket or not self.running, timeout)
+            if self.done_tickets.get(source, 0) < ticket:
+                return None
+            error = self.last_errors.get(source)
+            if error is not None:
+                raise RuntimeError(f"La detección falló: {error}") from error
+            return self.last_results.get(source)
+
+    def pending_count(self):
+        """
+        Obtiene el número de frames esperando a ser analizados
+        :return: Cantidad de fuentes con un frame en su slot
+        """
+        with self.condition:
+            return len(self.pending)
+
+    def get_schedule(self):
+        """
+        Obtiene el reparto de la inferencia entre las fuentes
+        :return: Diccionario {fuente: {'served': frames analizados, 'share': fracción del total, 'weight': peso}}
+        """
+        with self.condition:
+            total = sum(self.served.values())
+            return {source: {
+                'served': served,
+                'share': round(served / total, 3) if total else 0.0,
+                'weight': round(self.weight_fn(source), 3) if self.weight_fn is not None else 1.0
+            } for source, served in self.served.items()}
+
+    def _ready_sources(self):
+        """Fuentes con un frame pendiente que no tienen otro en proceso"""
+        return [source for source in self.pending if source not in self.in_flight]
+
+    def _batch_ready(self):
+        """Indica si ya se puede lanzar un lote (lleno o con el plazo vencido)"""
+        ready = self._ready_sources()
+        if not ready:
+            return False
+        if len(ready) >= self.batch_size:
+            return True
+        return time.time() - self.first_pending_time >= self.max_wait
+
+    def _start_time(self, source):
+        """Tiempo virtual en el que empezaría el siguiente frame de una fuente"""
+        return max(self.finish_times.get(source, 0.0), self.virtual_time)
+
+    def _take_batch(self):
+        """
+        Extrae del slot los frames de las fuentes a las que les toca, hasta completar un lote
+        (las más antiguas o, con weight_fn, las más atrasadas respecto a su parte)
+        :return: Lista de tuplas (ticket, fuente, frame)
+        """
+        if self.weight_fn is None:
+            key = lambda source: self.pending[source][0]
+        else:
+            key = lambda source: (self._start_time(source), self.pending[source][0])
+        ordered = sorted(self._ready_sources(), key=key)
+        now = time.time()
+        batch = []
+        for source in ordered[:self.batch_size]:
+            ticket, frame, submitted = self.pending.pop(source)
+            metrics.observe('inference_wait_seconds', now - submitted)
+            batch.append((ticket, source, frame))
+            self.in_flight.add(source)
+            self.served[source] = self.served.get(source, 0) + 1
+            if self.weight_fn is not None:
+                start = self._start_time(source)
+                self.virtual_time = max(self.virtual_time, start)
+                self.finish_times[source] = start + 1.0 / max(self.weight_fn(source), 1e-6)
+        self.first_pending_time = time.time() if self.pending else None
+        return batch
+
+    def _run(self):
+        """Bucle principal de cada hilo: agrupa los frames pendientes y ejecuta la detección"""
+        while True:
+            with self.condition:
+                while self.running and not self._batch_ready():
+                    if self._ready_sources():
+                        remaining = self.first_pending_time + self.max_wait - time.time()
+                        self.condition.wait(max(remaining, 0.001))
+                    else:
+                        self.condition.wait()
+                if not self.running:
+                    return
+                batch = self._take_batch()
+
+            results = [None] * len(batch)
+            error = None
+            start_time = time.perf_counter()
+            try:
+                results = self.detect_fn([(source, frame) for _, source, frame in batch])
+            except Exception as e:
+                error = e
+                print(f"Error en el hilo de inferencia: {e}")
+                metrics.inc('detection_errors_total')
+                if self.on_error:
+                    self.on_error(e)
+            metrics.observe('inference_batch_seconds', time.perf_counter() - start_time)
+            metrics.observe('inference_batch_size', len(batch))
+
+            with self.condition:
+                self.batches += 1
+                for _, source, _ in batch:
+                    self.in_flight.discard(source)
+                for (ticket, source, _), result in zip(batch, results):
+                    self.done_tickets[source] = ticket
+                    self.last_results[source] = result
+                    self.last_errors[source] = error
+                self.condition.notify_all()
@@ -0,0 +1,456 @@
+import os
+import time
+import queue
+import atexit
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+from types import SimpleNamespace
+import numpy as np
+from history_store import DetectionHistory
+from detector import record_timings, generate_suggestion
+from results import Detections, LabelTable, DETECTION_DTYPE
+from metrics import metrics
+
+
+def _worker_main(worker_id, connection, shm_name, options, cpus, threads):
+    """
+    Proceso de inferencia: carga su propio modelo y atiende las peticiones del despachador.
+    Los frames llegan por memoria compartida y se leen sin copiarlos.
+    :param worker_id: Número del proceso dentro del pool
+    :param connection: Extremo del Pipe por el que llegan las peticiones
+    :param shm_name: Nombre del bloque de memoria compartida de este proceso
+    :param options: Argumentos para construir el PersonDetector
+    :param cpus: Núcleos a los que se fija el proceso (None para no fijarlo)
+    :param threads: Hilos de PyTorch del proceso
+    """
+    import torch
+    from detector import PersonDetector
+
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+    torch.set_num_threads(threads)
+
+    detector = PersonDetector(**options)
+    backend_name = detector.backend.name if detector.backend else None
+    id2label = detector.labels.id2label() if detector.labels is not None else None
+    connection.send(('ready', backend_name, id2label))
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        while True:
+            try:
+                request = connection.recv()
+            except EOFError:
+                break
+            if request is None:
+                break
+
+            frames, confidence_threshold, shortest_edges = request
+            images = []
+            for kind, value, shape in frames:
+                if kind == 'shm':
+                    # Vista directa sobre la memoria compartida (sin copia)
+                    images.append(np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=value))
+                else:
+                    images.append(value)
+            # Sólo el modelo: la sugerencia y el historial se preparan en el proceso principal
+            detector.last_timings = {}
+            try:
+                arrays = [detections.array for detections in
+                          detector.detect_candidates(images, shortest_edges, confidence_threshold)]
+            except Exception as e:
+                print(f"Error al detectar objetos en el proceso de inferencia {worker_id}: {e}")
+                arrays = [np.empty(0, dtype=DETECTION_DTYPE) for _ in images]
+            del images  # liberar las vistas antes de la siguiente petición
+            # Sólo viajan los arrays estructurados; la tabla de clases ya la tiene el proceso principal
+            connection.send(('result', arrays, detector.last_timings))
+    finally:
+        shm.close()
+        print(f"Proceso de inferencia {worker_id} detenido")
+
+
+class PoolWorker:
+    def __init__(self, worker_id, slots, slot_bytes):
+        """
+        Datos del despachador sobre un proceso del pool
+        :param worker_id: Número del proceso dentro del pool
+        :param slots: Frames que caben a la vez en su memoria compartida
+        :param slot_bytes: Tamaño de cada slot en bytes
+        """
+        self.id = worker_id
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        self.process = None
+        self.connection = None
+        self.backend_name = None
+        self.requests = 0
+        self.busy_time = 0.0
+
+    def close(self):
+        """Libera la memoria compartida del proceso"""
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class InferencePool:
+    def __init__(self, processes=2, threads_per_process=None, model_name="facebook/detr-resnet-50",
+                 confidence_threshold=0.8, backend="torch", fast_preprocess=True, inference_size=800,
+                 history_store=None, slots=4, slot_bytes=1920 * 1080 * 3, start_timeout=600,
+                 model_cache=True, background=False, on_status=None, result_cache=None, candidate_floor=0.1,
+                 on_inference=None):
+        """
+        Pool de procesos de inferencia con la misma interfaz que PersonDetector.
+        Cada proceso tiene su propio modelo y su propio GIL; los frames se le pasan por
+        memoria compartida y un despachador reparte cada petición al primer proceso libre.
+        El historial de detecciones se mantiene en el proceso principal.
+        :param processes: Número de procesos de inferencia
+        :param threads_per_process: Hilos de PyTorch por proceso (por defecto, los núcleos repartidos entre los procesos)
+        :param model_name: Nombre o ruta del modelo a usar
+        :param confidence_threshold: Umbral de confianza para detecciones (0.0-1.0)
+        :param backend: Motor de inferencia de cada proceso ('torch', 'torchscript', 'onnx' o 'int8')
+        :param fast_preprocess: Si es True, preprocesa con NumPy/OpenCV
+        :param inference_size: Lado más corto (en píxeles) de la imagen que recibe el modelo
+        :param history_store: HistoryStore opcional donde se registran todas las detecciones
+        :param slots: Frames por petición que caben en la memoria compartida de cada proceso
+        :param slot_bytes: Tamaño máximo en bytes de un frame en memoria compartida
+                           (los frames más grandes se envían copiados por el Pipe)
+        :param start_timeout: Segundos máximos de espera a que un proceso cargue su modelo
+        :param model_cache: Si es True, los procesos usan la copia local del modelo en models/cache
+        :param background: Si es True, los procesos arrancan en un hilo aparte y el constructor vuelve enseguida
+        :param on_status: Función opcional que recibe get_status() cada vez que cambia el estado de carga
+        :param result_cache: ResultCache opcional (en el proceso principal, antes de enviar los frames)
+        :param candidate_floor: Confianza mínima de las candidatas que se conservan para poder cambiar
+                                el umbral sin repetir la detección
+        :param on_inference: Función opcional que recibe (segundos, frames) cada vez que un proceso
+                             analiza frames (no se llama por los que responde la caché)
+        """
+        self.processes = max(1, processes)
+        self.result_cache = result_cache
+        self.model_name = model_name
+        self.confidence_threshold = confidence_threshold
+        self.candidate_floor = candidate_floor
+        self.start_timeout = start_timeout
+        self.options = {
+            'model_name': model_name,
+            'confidence_threshold': confidence_threshold,
+            'backend': backend,
+            'fast_preprocess': fast_preprocess,
+            'inference_size': inference_size,
+            'model_cache': model_cache
+        }
+        self.max_history = 3
+        self.history = DetectionHistory(self.max_history, history_store)  # Historial de detecciones
+        self.labels = None  # LabelTable que envía el primer proceso al cargar su modelo
+        self.context = multiprocessing.get_context('spawn')  # PyTorch no admite fork con hilos activos
+        self.workers = [PoolWorker(worker_id, slots, slot_bytes) for worker_id in range(self.processes)]
+        self.idle = queue.Queue()
+        self.cpu_sets, self.threads = self._plan_cpus(threads_per_process)
+        self.backend = None
+        self.running = False
+        self.lock = threading.Lock()
+        self.on_status = on_status
+        self.on_inference = on_inference
+        self.ready = threading.Event()
+        self.state = 'loading'
+        self.load_seconds = None
+        if background:
+            threading.Thread(target=self.start, name="inference-pool-start", daemon=True).start()
+        else:
+            self.start()
+
+    def _plan_cpus(self, threads_per_process):
+        """
+        Reparte los núcleos disponibles entre los procesos
+        :param threads_per_process: Hilos por proceso pedidos (None para calcularlos)
+        :return: Tupla (lista de conjuntos de núcleos por proceso, hilos por proceso)
+        """
+        if hasattr(os, 'sched_getaffinity'):
+            cpus = sorted(os.sched_getaffinity(0))
+        else:
+            cpus = list(range(os.cpu_count() or 1))
+        per_process = max(1, len(cpus) // self.processes)
+        if len(cpus) >= self.processes:
+            cpu_sets = [set(cpus[i * per_process:(i + 1) * per_process]) for i in range(self.processes)]
+        else:
+            cpu_sets = [None] * self.processes  # menos núcleos que procesos: no se fija ninguno
+        return cpu_sets, threads_per_process or per_process
+
+    def start(self):
+        """Arranca los procesos y espera a que todos tengan el modelo cargado"""
+        if self.running:
+            return
+        start_time = time.time()
+        print(f"Iniciando {self.processes} procesos de inferencia ({self.threads} hilos cada uno)...")
+        for worker in self.workers:
+            self._spawn(worker)
+        for worker in self.workers:
+            if self._wait_ready(worker):
+                self.idle.put(worker)
+        self.running = True
+        atexit.register(self.stop)
+        self.load_seconds = round(time.time() - start_time, 2)
+        self._update_state()
+        self.ready.set()
+
+    def _update_state(self):
+        """
+        Actualiza el backend y el estado del pool según los procesos que ya cargaron su modelo:
+        basta con uno para atender peticiones; los demás aparecen en 'degraded' de get_status()
+        """
+        names = {worker.backend_name for worker in self.workers if worker.backend_name is not None}
+        if names:
+            self.backend = SimpleNamespace(name=f"{'/'.join(sorted(names))} x{self.processes} procesos")
+        self.state = 'ready' if names else 'error'
+        if self.on_status:
+            self.on_status(self.get_status())
+
+    def is_ready(self):
+        """
+        Indica si todos los procesos tienen su modelo cargado
+        :return: True si ya se pueden hacer detecciones
+        """
+        return self.state == 'ready'
+
+    def get_status(self):
+        """
+        Obtiene el estado de carga del pool
+        :return: Diccionario con el estado ('loading', 'ready' o 'error'), el backend, el tiempo de carga
+                 y los procesos que todavía no tienen el modelo (cargando o sin poder cargarlo)
+        """
+        return {
+            'state': self.state,
+            'backend': self.backend.name if self.backend else self.options['backend'],
+            'source': 'pool',
+            'load_seconds': self.load_seconds,
+            'degraded': [worker.id for worker in self.workers if worker.backend_name is None],
+            'error': None if self.state != 'error' else "Ningún proceso pudo cargar el modelo"
+        }
+
+    def _spawn(self, worker):
+        """Lanza (o relanza) el proceso de un worker"""
+        worker.backend_name = None  # hasta que el proceso nuevo avise de que cargó el modelo
+        parent_connection, child_connection = self.context.Pipe()
+        worker.connection = parent_connection
+        worker.process = self.context.Process(
+            target=_worker_main,
+            args=(worker.id, child_connection, worker.shm.name, self.options,
+                  self.cpu_sets[worker.id], self.threads),
+            name=f"inference-process-{worker.id}",
+            daemon=True
+        )
+        worker.process.start()
+        child_connection.close()
+
+    def _wait_ready(self, worker):
+        """
+        Espera el aviso de que el proceso cargó su modelo.
+        Si no llega a tiempo, el proceso no recibe peticiones hasta que llegue (de lo contrario
+        el aviso tardío se leería como la respuesta a una detección): un hilo lo sigue esperando
+        y lo marca como libre cuando llega
+        :return: True si el proceso ya está listo y el llamador debe marcarlo como libre
+        """
+        if worker.connection.poll(self.start_timeout):
+            if self._receive_ready(worker):
+                return True
+            print(f"El proceso de inferencia {worker.id} no pudo cargar el modelo")
+            return False
+        print(f"El proceso de inferencia {worker.id} no respondió a tiempo")
+        threading.Thread(target=self._wait_late_ready, args=(worker,),
+                         name=f"inference-process-{worker.id}-ready", daemon=True).start()
+        return False
+
+    def _wait_late_ready(self, worker):
+        """Espera sin límite el aviso de un proceso que tardó en cargar su modelo y lo marca como libre"""
+        connection = worker.connection
+        try:
+            connection.poll(None)
+        except (EOFError, OSError):
+            return
+        if connection is not worker.connection or not self._receive_ready(worker):
+            return  # el proceso se relanzó o terminó sin cargar el modelo
+        print(f"El proceso de inferencia {worker.id} cargó su modelo con retraso")
+        self.idle.put(worker)
+        if self.running:
+            self._update_state()
+
+    def _receive_ready(self, worker):
+        """
+        Lee el aviso de modelo cargado de un proceso (backend y tabla de clases)
+        :return: True si el proceso cargó el modelo; False si no pudo o terminó antes de avisar
+        """
+        try:
+            _, worker.backend_name, id2label = worker.connection.recv()
+        except (EOFError, OSError):
+            return False
+        if id2label and self.labels is None:
+            self.labels = LabelTable(id2label)
+        return worker.backend_name is not None
+
+    def stop(self, timeout=5.0):
+        """
+        Detiene los procesos y libera la memoria compartida
+        :param timeout: Tiempo máximo en segundos para esperar a cada proceso
+        """
+        with self.lock:
+            if not self.running:
+                return
+            self.running = False
+        for worker in self.workers:
+            try:
+                worker.connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            worker.process.join(timeout)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.close()
+
+    def detect(self, image):
+        """
+        Detecta personas y objetos en una imagen
+        :param image: Imagen de OpenCV (numpy array en formato BGR)
+        :return: Tupla (Detections, sugerencia)
+        """
+        return self.detect_batch([image])[0]
+
+    def detect_batch(self, images, sources=None, shortest_edges=None):
+        """
+        Detecta personas y objetos en varias imágenes en el primer proceso libre.
+        Se puede llamar desde varios hilos a la vez: cada llamada ocupa un proceso.
+        :param images: Lista de imágenes de OpenCV (numpy arrays en formato BGR)
+        :param sources: Lista opcional con la cámara de cada imagen (para el historial)
+        :param shortest_edges: Lista opcional con el lado más corto con el que se analiza cada imagen
+        :return: Lista de tuplas (Detections, sugerencia), una por imagen
+        """
+        empty_result = (Detections(labels=self.labels), "No se pudieron realizar detecciones.")
+        if not images:
+            return []
+        # Si los procesos se están iniciando en segundo plano, esperar a que terminen
+        self.ready.wait(self.start_timeout)
+        if not self.running:
+            return [empty_result] * len(images)
+
+        # Los procesos devuelven todas las candidatas por encima de candidate_floor y el umbral
+        # se aplica aquí; los frames casi idénticos a uno reciente no llegan a enviarse
+        threshold = self.confidence_threshold
+        floor = min(self.candidate_floor, threshold)
+        try:
+            if self.result_cache is not None:
+                batch_candidates = self.result_cache.get_or_compute(
+                    images, shortest_edges, floor,
+                    lambda missing, edges: self._dispatch(missing, edges, floor))
+            else:
+                batch_candidates = self._dispatch(images, shortest_edges, floor)
+        except (EOFError, BrokenPipeError, OSError):
+            return [empty_result] * len(images)
+
+        sources = sources or [0] * len(images)
+        results = []
+        for candidates, source in zip(batch_candidates, sources):
+            detections = candidates.with_threshold(threshold)
+            suggestion = generate_suggestion(detections.has_person, detections.unique_labels())
+            self.history.record(detections.has_person, detections.labels, detections.scores.tolist(),
+                                suggestion, camera=source)
+            results.append((detections, suggestion))
+        return results
+
+    def _dispatch(self, images, shortest_edges, threshold):
+        """
+        Envía un lote al primer proceso libre, relanzándolo si deja de responder
+        :param images: Lista de imágenes BGR
+        :param shortest_edges: Lista opcional con el lado más corto de cada imagen
+        :param threshold: Umbral de confianza
+        :return: Lista de Detections, una por imagen
+        """
+        worker = self.idle.get()
+        start_time = time.time()
+        available = True
+        try:
+            results = self._request(worker, images, shortest_edges, threshold)
+            if self.on_inference:
+                self.on_inference(time.time() - start_time, len(images))
+            return results
+        except (EOFError, BrokenPipeError, OSError) as e:
+            print(f"Error en el proceso de inferencia {worker.id}: {e}. Reiniciándolo...")
+            metrics.inc('detection_errors_total')
+            available = self._restart(worker)
+            raise
+        finally:
+            worker.busy_time += time.time() - start_time
+            worker.requests += 1
+            if available:
+                self.idle.put(worker)
+
+    def _request(self, worker, images, shortest_edges, threshold):
+        """
+        Copia los frames a la memoria compartida del proceso y espera su resultado
+        :param worker: PoolWorker libre
+        :param images: Lista de imágenes BGR
+        :param shortest_edges: Lista opcional con el lado más corto de cada imagen
+        :param threshold: Umbral de confianza
+        :return: Lista de Detections, una por imagen
+        """
+        frames = []
+        for index, image in enumerate(images):
+            image = np.ascontiguousarray(image, dtype=np.uint8)
+            if index < worker.slots and image.nbytes <= worker.slot_bytes:
+                offset = index * worker.slot_bytes
+                target = np.ndarray(image.shape, dtype=np.uint8, buffer=worker.shm.buf, offset=offset)
+                target[...] = image
+                del target
+                frames.append(('shm', offset, image.shape))
+            else:
+                # No cabe en su slot: se envía copiado por el Pipe
+                frames.append(('inline', image, image.shape))
+        worker.connection.send((frames, threshold, shortest_edges))
+        _, results, timings = worker.connection.recv()
+        # Las etapas se midieron en el proceso de inferencia; se registran aquí
+        if timings:
+            record_timings(timings, len(images))
+        return [Detections(array, self.labels, threshold=threshold) for array in results]
+
+    def _restart(self, worker):
+        """
+        Relanza el proceso de un worker que dejó de responder
+        :return: True si el proceso nuevo ya está listo para recibir peticiones
+                 (si no, se marcará como libre cuando cargue su modelo)
+        """
+        if worker.process.is_alive():
+            worker.process.terminate()
+        worker.process.join(1.0)
+        self._spawn(worker)
+        available = self._wait_ready(worker)
+        self._update_state()
+        return available
+
+    def get_stats(self):
+        """
+        Obtiene el uso de cada proceso del pool
+        :return: Lista de diccionarios con peticiones y tiempo ocupado por proceso
+        """
+        return [{
+            'id': worker.id,
+            'alive': worker.process.is_alive() if worker.process else False,
+            'requests': worker.requests,
+            'busy_seconds': round(worker.busy_time, 2),
+            'cpus': sorted(self.cpu_sets[worker.id]) if self.cpu_sets[worker.id] else None
+        } for worker in self.workers]
+
+    def get_cache_stats(self):
+        """
+        Obtiene los contadores de la caché de resultados
+        :return: Diccionario de ResultCache.get_stats() o None si no hay caché
+        """
+        return self.result_cache.get_stats() if self.result_cache is not None else None
+
+    def get_history(self):
+        """
+        Obtiene el historial de detecciones
+        :return: Lista de detecciones recientes
+        """
+        return self.history.get_recent()
@@ -0,0 +1,228 @@
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# Descripción y tipo de las métricas conocidas (para la salida de Prometheus)
+DESCRIPTIONS = {
+    'pipeline_stage_seconds': ('summary', "Duración de cada etapa del pipeline"),
+    'inference_batch_seconds': ('summary', "Duración total de un lote de inferencia"),
+    'inference_wait_seconds': ('summary', "Tiempo que un frame espera en la cola de inferencia"),
+    'inference_batch_size': ('summary', "Frames por lote de inferencia"),
+    'frames_grabbed_total': ('counter', "Frames leídos de la cámara"),
+    'grab_errors_total': ('counter', "Lecturas fallidas de la cámara"),
+    'frames_published_total': ('counter', "Frames anotados publicados al stream"),
+    'frames_encoded_total': ('counter', "Frames codificados a JPEG"),
+    'detections_total': ('counter', "Frames analizados por el detector"),
+    'detection_errors_total': ('counter', "Errores del detector"),
+    'inference_queue_depth': ('gauge', "Frames esperando en la cola de inferencia"),
+    'inference_dropped_frames_total': ('counter', "Frames reemplazados en la cola antes de analizarse"),
+    'stream_clients': ('gauge', "Clientes conectados al stream de video"),
+    'stream_skipped_frames_total': ('counter', "Frames que los clientes del stream se saltaron por ir atrasados"),
+    'source_fps': ('gauge', "Frames por segundo entregados por la fuente de video"),
+    'source_skipped_frames_total': ('counter', "Frames descartados por la fuente sin decodificar"),
+    'source_reconnects_total': ('counter', "Reconexiones de las fuentes de red"),
+    'recorder_queue_depth': ('gauge', "Frames pendientes de escribir en los clips"),
+    'recorder_dropped_frames_total': ('counter', "Frames de clips descartados por tener la cola llena"),
+    'recorder_clips_total': ('counter', "Clips de eventos guardados"),
+    'detection_interval_seconds': ('gauge', "Segundos entre detecciones automáticas que fija el planificador"),
+    'inference_cpu_usage': ('gauge', "Fracción del tiempo que la inferencia estuvo ocupada en los últimos segundos"),
+    'inference_share': ('gauge', "Fracción de las detecciones que recibió cada cámara"),
+    'result_cache_hits_total': ('counter', "Frames resueltos con un resultado guardado, sin ejecutar el modelo"),
+    'result_cache_misses_total': ('counter', "Frames que no estaban en la caché de resultados"),
+    'result_cache_size': ('gauge', "Resultados guardados en la caché"),
+    'history_queue_depth': ('gauge', "Detecciones esperando a guardarse en el historial"),
+    'history_dropped_total': ('counter', "Detecciones descartadas por el historial"),
+}
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class RollingHistogram:
+    def __init__(self, window=1024):
+        """
+        Histograma de las últimas mediciones, para percentiles recientes
+        :param window: Número de mediciones que se conservan
+        """
+        self.samples = deque(maxlen=window)  # (instante, valor)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """
+        Registra una medición
+        :param value: Valor medido
+        """
+        self.samples.append((time.time(), value))
+        self.count += 1
+        self.sum += value
+
+    def quantiles(self, quantiles=QUANTILES):
+        """
+        Calcula percentiles sobre la ventana
+        :param quantiles: Cuantiles pedidos (entre 0.0 y 1.0)
+        :return: Diccionario {cuantil: valor} (vacío si no hay mediciones)
+        """
+        values = sorted(value for _, value in list(self.samples))
+        if not values:
+            return {}
+        return {q: values[min(len(values) - 1, int(q * len(values)))] for q in quantiles}
+
+    def rate(self):
+        """
+        Mediciones por segundo dentro de la ventana
+        :return: Frecuencia en Hz (0.0 si no hay suficientes mediciones)
+        """
+        samples = list(self.samples)
+        if len(samples) < 2:
+            return 0.0
+        elapsed = samples[-1][0] - samples[0][0]
+        return (len(samples) - 1) / elapsed if elapsed > 0 else 0.0
+
+
+class Metrics:
+    def __init__(self, window=1024):
+        """
+        Registro de métricas de rendimiento: histogramas, contadores y medidores.
+        Cada métrica se identifica por su nombre y sus etiquetas.
+        :param window: Mediciones que conserva cada histograma
+        """
+        self.window = window
+        self.lock = threading.Lock()
+        self.histograms = {}  # (nombre, etiquetas) -> RollingHistogram
+        self.counters = {}  # (nombre, etiquetas) -> valor
+        self.gauges = {}  # (nombre, etiquetas) -> valor
+        self.callbacks = {}  # (nombre, etiquetas) -> función que devuelve el valor al consultarlo
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def observe(self, name, value, **labels):
+        """
+        Registra una medición en un histograma
+        :param name: Nombre de la métrica
+        :param value: Valor medido (en segundos para las duraciones)
+        :param labels: Etiquetas de la métrica
+        """
+        key = self._key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = RollingHistogram(self.window)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Mide la duración de un bloque y la registra en un histograma
+        :param name: Nombre de la métrica
+        :param labels: Etiquetas de la métrica
+        """
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start_time, **labels)
+
+    def inc(self, name, value=1, **labels):
+        """
+        Incrementa un contador
+        :param name: Nombre de la métrica
+        :param value: Cantidad a sumar
+        :param labels: Etiquetas de la métrica
+        """
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        """
+        Fija el valor de un medidor
+        :param name: Nombre de la métrica
+        :param value: Valor actual
+        :param labels: Etiquetas de la métrica
+        """
+        with self.lock:
+            self.gauges[self._key(name, labels)] = value
+
+    def register_callback(self, name, function, **labels):
+        """
+        Registra una métrica cuyo valor se obtiene al consultarla (profundidad de colas, etc.)
+        :param name: Nombre de la métrica
+        :param function: Función sin argumentos que devuelve el valor actual
+        :param labels: Etiquetas de la métrica
+        """
+        with self.lock:
+            self.callbacks[self._key(name, labels)] = function
+
+    def _values(self):
+        """
+        Valores actuales de contadores, medidores y callbacks
+        :return: Diccionario (nombre, etiquetas) -> valor
+        """
+        with self.lock:
+            values = dict(self.counters)
+            values.update(self.gauges)
+            callbacks = dict(self.callbacks)
+        for key, function in callbacks.items():
+            try:
+                values[key] = function()
+            except Exception:
+                continue
+        return values
+
+    def summary(self):
+        """
+        Resumen legible de las métricas para /api/status
+        :return: Diccionario con percentiles en milisegundos, frecuencias y valores actuales
+        """
+        with self.lock:
+            histograms = list(self.histograms.items())
+        latency = {}
+        for (name, labels), histogram in sorted(histograms):
+            label = name + ''.join(f"[{value}]" for _, value in labels)
+            scale = 1000.0 if name.endswith('_seconds') else 1.0
+            entry = {f"p{int(q * 100)}": round(value * scale, 2)
+                     for q, value in histogram.quantiles().items()}
+            entry['count'] = histogram.count
+            entry['rate'] = round(histogram.rate(), 2)
+            latency[label] = entry
+        values = {name + ''.join(f"[{value}]" for _, value in labels): value
+                  for (name, labels), value in sorted(self._values().items())}
+        return {'latency_ms': latency, 'values': values}
+
+    def render_prometheus(self):
+        """
+        Exporta las métricas en el formato de texto de Prometheus
+        :return: Cadena con una línea por serie
+        """
+        def format_labels(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ''
+            return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}'
+
+        series = {}
+        with self.lock:
+            histograms = list(self.histograms.items())
+        for (name, labels), histogram in histograms:
+            lines = series.setdefault(name, [])
+            for q, value in histogram.quantiles().items():
+                lines.append(f"{name}{format_labels(labels, [('quantile', q)])} {value:.6f}")
+            lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum:.6f}")
+            lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+        for (name, labels), value in self._values().items():
+            series.setdefault(name, []).append(f"{name}{format_labels(labels)} {float(value)}")
+
+        output = []
+        for name in sorted(series):
+            kind, description = DESCRIPTIONS.get(name, ('untyped', name))
+            output.append(f"# HELP {name} {description}")
+            output.append(f"# TYPE {name} {kind}")
+            output.extend(sorted(series[name]))
+        return '\n'.join(output) + '\n'
+
+
+# Registro compartido por todos los módulos
+metrics = Metrics()
@@ -0,0 +1,123 @@
+import time
+import threading
+import cv2
+
+
+class MotionGate:
+    def __init__(self, threshold=0.02, pixel_threshold=25, size=(160, 120), refresh_interval=300):
+        """
+        Inicializa el filtro de movimiento que decide si vale la pena ejecutar el modelo
+        :param threshold: Fracción de píxeles (0.0-1.0) que deben cambiar para considerar que la escena cambió
+        :param pixel_threshold: Diferencia mínima de intensidad (0-255) para contar un píxel como cambiado
+        :param size: Tamaño (ancho, alto) al que se reduce el frame antes de compararlo
+        :param refresh_interval: Segundos tras los que se fuerza una detección aunque no haya cambios
+                                 (None para no forzarla nunca)
+        """
+        self.threshold = threshold
+        self.pixel_threshold = pixel_threshold
+        self.size = size
+        self.refresh_interval = refresh_interval
+        self.enabled = True
+        self.reference = None
+        self.reference_time = 0
+        self.last_change = 0.0
+        self.motion_region = None  # zona con cambios (x1, y1, x2, y2) en fracciones del frame
+        self.hits = 0
+        self.skips = 0
+        self.lock = threading.Lock()
+
+    def _prepare(self, frame):
+        """
+        Reduce el frame a escala de grises y baja resolución para compararlo
+        :param frame: Imagen de OpenCV (numpy array en formato BGR)
+        :return: Imagen en escala de grises suavizada
+        """
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def _set_reference(self, prepared):
+        """Guarda el frame con el que se hizo la última detección"""
+        self.reference = prepared
+        self.reference_time = time.time()
+
+    def should_detect(self, frame):
+        """
+        Determina si la escena cambió lo suficiente desde la última detección
+        :param frame: Imagen de OpenCV (numpy array en formato BGR)
+        :return: True si se debe ejecutar el detector, False si se puede reutilizar el último resultado
+        """
+        if frame is None:
+            return False
+
+        with self.lock:
+            if not self.enabled:
+                self.hits += 1
+                return True
+
+            prepared = self._prepare(frame)
+            if self.reference is None or self.reference.shape != prepared.shape:
+                self._set_reference(prepared)
+                self.hits += 1
+                return True
+
+            # Fracción de píxeles que cambiaron respecto al frame de referencia
+            diff = cv2.absdiff(prepared, self.reference)
+            _, mask = cv2.threshold(diff, self.pixel_threshold, 255, cv2.THRESH_BINARY)
+            changed = cv2.countNonZero(mask)
+            self.last_change = changed / float(mask.size)
+            self.motion_region = self._region(mask) if changed else None
+
+            expired = (self.refresh_interval is not None and
+                       time.time() - self.reference_time >= self.refresh_interval)
+            if self.last_change >= self.threshold or expired:
+                self._set_reference(prepared)
+                self.hits += 1
+                return True
+
+            self.skips += 1
+            return False
+
+    def _region(self, mask):
+        """
+        Rectángulo que contiene los píxeles que cambiaron
+        :param mask: Máscara binaria de cambios (tamaño reducido)
+        :return: Tupla (x1, y1, x2, y2) en fracciones del frame
+        """
+        x, y, w, h = cv2.boundingRect(mask)
+        height, width = mask.shape[:2]
+        return (x / width, y / height, (x + w) / width, (y + h) / height)
+
+    def get_motion_region(self):
+        """
+        Obtiene la zona donde hubo cambios en la última comparación
+        :return: Tupla (x1, y1, x2, y2) en fracciones del frame, o None si no hubo cambios
+        """
+        with self.lock:
+            return self.motion_region
+
+    def mark_detected(self, frame):
+        """
+        Registra un frame analizado por otra vía (p. ej. captura manual) como nueva referencia
+        :param frame: Imagen de OpenCV (numpy array en formato BGR)
+        """
+        if frame is None:
+            return
+        with self.lock:
+            self._set_reference(self._prepare(frame))
+
+    def get_stats(self):
+        """
+        Obtiene los contadores del filtro
+        :return: Diccionario con aciertos, frames omitidos y configuración
+        """
+        with self.lock:
+            total = self.hits + self.skips
+            return {
+                'enabled': self.enabled,
+                'threshold': self.threshold,
+                'hits': self.hits,
+                'skips': self.skips,
+                'skip_rate': self.skips / total if total else 0.0,
+                'last_change': self.last_change
+            }
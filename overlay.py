@@ -0,0 +1,88 @@
+import threading
+import weakref
+import cv2
+import numpy as np
+
+
+class OverlayRenderer:
+    def __init__(self, buffers=4):
+        """
+        Dibuja las cajas de detección sobre una copia del frame en buffers reutilizables.
+        Lo que depende sólo del resultado (coordenadas enteras, colores y textos) se calcula
+        una vez por resultado y se reutiliza en los frames siguientes mientras no cambie.
+        Un buffer sólo se vuelve a usar cuando ya nadie conserva el frame que se dibujó en él
+        (p. ej. cuando el difusor lo reemplazó y los clientes terminaron de codificarlo), así que
+        el frame devuelto es válido mientras se conserve.
+        :param buffers: Número máximo de buffers reutilizables (si todos están en uso, se reserva uno aparte)
+        """
+        self.max_buffers = max(2, buffers)
+        self.buffers = []  # [array, weakref del frame entregado desde él (o None)]
+        self.cached = None  # Detections cuyas operaciones de dibujo están en self.commands
+        self.commands = []
+        self.lock = threading.Lock()
+
+    def _build_commands(self, detections, track_ids=None):
+        """
+        Prepara las operaciones de dibujo de un resultado
+        :param detections: Detections con las cajas
+        :param track_ids: Lista opcional con el id de seguimiento de cada caja
+        :return: Lista de tuplas (punto1, punto2, color, texto, posición del texto)
+        """
+        if not len(detections):
+            return []
+        boxes = detections.boxes.astype(np.int32).tolist()
+        colors = detections.colors().tolist()
+        texts = [f"{label}: {score:.2f}" for label, score in zip(detections.labels, detections.scores.tolist())]
+        if track_ids is not None:
+            texts = [f"#{track_id} {text}" if track_id is not None else text
+                     for track_id, text in zip(track_ids, texts)]
+        return [((x1, y1), (x2, y2), tuple(color), text, (x1, y1 - 10))
+                for (x1, y1, x2, y2), color, text in zip(boxes, colors, texts)]
+
+    def _next_buffer(self, frame):
+        """
+        Buffer de salida libre del tamaño del frame (llamar con el lock tomado).
+        Se entrega una vista del buffer: mientras alguien la conserve, el buffer no se reutiliza
+        """
+        free = None
+        for entry in self.buffers:
+            buffer, handed = entry
+            if handed is not None and handed() is not None:
+                continue  # el frame anterior de este buffer sigue en uso
+            if buffer.shape == frame.shape and buffer.dtype == frame.dtype:
+                free = entry
+                break
+            if free is None:
+                free = entry  # libre pero de otro tamaño: se reemplaza si no hay uno mejor
+        if free is None:
+            free = [None, None]
+            if len(self.buffers) < self.max_buffers:
+                self.buffers.append(free)
+        if free[0] is None or free[0].shape != frame.shape or free[0].dtype != frame.dtype:
+            free[0] = np.empty_like(frame)
+        view = free[0].view()
+        free[1] = weakref.ref(view)
+        return view
+
+    def render(self, frame, detections, track_ids=None, cache=False):
+        """
+        Dibuja las detecciones sobre una copia del frame
+        :param frame: Imagen de OpenCV (no se modifica)
+        :param detections: Detections con las cajas a dibujar
+        :param track_ids: Lista opcional con el id de seguimiento de cada caja
+        :param cache: Si es True y detections es el mismo objeto que en la llamada anterior,
+                      se reutilizan las operaciones ya preparadas (los Detections no cambian)
+        :return: Frame anotado
+        """
+        with self.lock:
+            if not cache or detections is not self.cached:
+                self.commands = self._build_commands(detections, track_ids)
+                self.cached = detections if cache else None
+            commands = self.commands
+            buffer = self._next_buffer(frame)
+
+        np.copyto(buffer, frame)
+        for point1, point2, color, text, text_position in commands:
+            cv2.rectangle(buffer, point1, point2, color, 2)
+            cv2.putText(buffer, text, text_position, cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+        return buffer
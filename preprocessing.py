@@ -0,0 +1,101 @@
+import cv2
+import numpy as np
+import torch
+
+# Medias y desviaciones de ImageNet, las que usa DETR por defecto
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+
+class FramePreprocessor:
+    def __init__(self, shortest_edge=800, longest_edge=None, image_mean=IMAGENET_MEAN, image_std=IMAGENET_STD):
+        """
+        Preprocesamiento directo de frames BGR de OpenCV a tensores normalizados,
+        sin pasar por PIL ni por el procesador genérico de Hugging Face.
+        Los buffers se reservan una vez y se reutilizan mientras no cambie el tamaño.
+        No es seguro entre hilos: el tensor devuelto comparte memoria con los buffers.
+        :param shortest_edge: Tamaño del lado más corto tras redimensionar
+        :param longest_edge: Tamaño máximo del lado más largo (por defecto en la proporción 800:1333 de DETR)
+        :param image_mean: Media por canal RGB usada para normalizar
+        :param image_std: Desviación estándar por canal RGB usada para normalizar
+        """
+        self.shortest_edge = shortest_edge
+        self.longest_edge = longest_edge or int(round(shortest_edge * 1333 / 800))
+        # normalizado = pixel * scale + offset  (equivale a (pixel / 255 - mean) / std)
+        mean = np.asarray(image_mean, dtype=np.float32)
+        std = np.asarray(image_std, dtype=np.float32)
+        self.scale = (1.0 / (255.0 * std)).astype(np.float32)
+        self.offset = (-mean / std).astype(np.float32)
+        self.buffer_key = None
+        self.pixel_values = None
+        self.pixel_mask = None
+        self.resized = {}
+        self.max_resized_buffers = 16  # los recortes de ROI pueden tener muchos tamaños distintos
+
+    def output_size(self, height, width, shortest_edge=None):
+        """
+        Calcula el tamaño de inferencia respetando la proporción del frame
+        :param height: Alto del frame original
+        :param width: Ancho del frame original
+        :param shortest_edge: Lado más corto pedido para este frame (por defecto, el del preprocesador)
+        :return: Tupla (alto, ancho) redimensionada
+        """
+        # Mismo redondeo que el procesador de DETR para obtener tensores idénticos
+        short, long = min(height, width), max(height, width)
+        size = shortest_edge or self.shortest_edge
+        if long / short * size > self.longest_edge:
+            size = int(round(self.longest_edge * short / long))
+        if width <= height:
+            return max(1, int(size * height / width)), size
+        return size, max(1, int(size * width / height))
+
+    def _ensure_buffers(self, batch_size, height, width):
+        """Reserva los buffers de salida sólo si cambió el tamaño del lote"""
+        key = (batch_size, height, width)
+        if self.buffer_key != key:
+            self.pixel_values = np.zeros((batch_size, 3, height, width), dtype=np.float32)
+            self.pixel_mask = np.zeros((batch_size, height, width), dtype=np.int64)
+            self.buffer_key = key
+
+    def _resized_buffer(self, height, width):
+        """Obtiene (o reserva) el buffer intermedio para un frame redimensionado"""
+        buffer = self.resized.get((height, width))
+        if buffer is None:
+            if len(self.resized) >= self.max_resized_buffers:
+                self.resized.pop(next(iter(self.resized)))  # descartar el más antiguo
+            buffer = np.empty((height, width, 3), dtype=np.uint8)
+            self.resized[(height, width)] = buffer
+        return buffer
+
+    def __call__(self, frames, shortest_edges=None):
+        """
+        Convierte una lista de frames BGR en las entradas del modelo
+        :param frames: Lista de imágenes de OpenCV (numpy arrays en formato BGR)
+        :param shortest_edges: Lista opcional con el lado más corto de cada frame (None = el de siempre)
+        :return: Tupla (pixel_values, pixel_mask) como tensores de PyTorch
+        """
+        shortest_edges = shortest_edges or [None] * len(frames)
+        sizes = [self.output_size(*frame.shape[:2], shortest_edge=edge)
+                 for frame, edge in zip(frames, shortest_edges)]
+        max_height = max(height for height, _ in sizes)
+        max_width = max(width for _, width in sizes)
+        self._ensure_buffers(len(frames), max_height, max_width)
+
+        for i, (frame, (height, width)) in enumerate(zip(frames, sizes)):
+            resized = self._resized_buffer(height, width)
+            cv2.resize(frame, (width, height), dst=resized, interpolation=cv2.INTER_LINEAR)
+
+            # Normalizar escribiendo directamente en el buffer CHW; el cambio BGR→RGB
+            # se hace eligiendo el canal de origen, sin crear imágenes intermedias
+            for channel in range(3):
+                plane = self.pixel_values[i, channel, :height, :width]
+                np.multiply(resized[:, :, 2 - channel], self.scale[channel], out=plane, dtype=np.float32)
+                plane += self.offset[channel]
+
+            # Relleno a cero cuando los frames del lote tienen tamaños distintos
+            self.pixel_values[i, :, height:, :] = 0
+            self.pixel_values[i, :, :height, width:] = 0
+            self.pixel_mask[i] = 0
+            self.pixel_mask[i, :height, :width] = 1
+
+        return torch.from_numpy(self.pixel_values), torch.from_numpy(self.pixel_mask)
@@ -0,0 +1,335 @@
+import os
+import time
+import queue
+import threading
+import itertools
+from collections import deque
+from datetime import datetime
+import cv2
+import numpy as np
+
+# Formato de clip: (extensión, fourcc)
+CLIP_FORMATS = {
+    'avi': ('.avi', 'MJPG'),
+    'mp4': ('.mp4', 'mp4v')
+}
+
+
+class Clip:
+    def __init__(self, clip_id, camera, path, fps, pre_roll):
+        """
+        Clip en curso de una cámara
+        :param clip_id: Identificador del clip
+        :param camera: Identificador de la cámara
+        :param path: Ruta del archivo de video
+        :param fps: Frames por segundo del video
+        :param pre_roll: Lista de (instante, JPEG) anteriores a la aparición de la persona
+        """
+        self.id = clip_id
+        self.camera = camera
+        self.path = path
+        self.fps = fps
+        self.pre_roll = pre_roll
+        self.size = None
+        self.started = time.time()
+        self.ended = False  # lo marca el productor; el hilo de escritura cierra el archivo
+        self.closed = False
+
+
+class CameraRecording:
+    def __init__(self, pre_roll_frames):
+        """
+        Estado de grabación de una cámara
+        :param pre_roll_frames: Frames codificados que se conservan antes de un evento
+        """
+        self.ring = deque(maxlen=pre_roll_frames)
+        self.lock = threading.Lock()
+        self.clip = None
+        self.person = False
+        self.person_lost = 0.0  # instante en que dejó de verse la persona
+        self.next_frame = 0.0  # instante previsto del próximo frame grabado
+
+
+class EventRecorder:
+    def __init__(self, directory, encoder, fps=10, pre_roll=5.0, post_roll=5.0, max_clip_seconds=300,
+                 quota_mb=2048, clip_format='avi', max_queue=300):
+        """
+        Grabación de clips cuando aparecen personas.
+        Cada cámara guarda en memoria los últimos segundos ya codificados en JPEG (pre-roll);
+        al aparecer una persona se abre un clip que empieza con ellos y termina post_roll
+        segundos después de que deje de verse. Los archivos se escriben en un hilo propio
+        con una cola acotada, así que ni la captura ni la inferencia esperan al disco.
+        :param directory: Carpeta donde se guardan los clips
+        :param encoder: JpegEncoder con el que se codifican los frames del pre-roll
+        :param fps: Frames por segundo que se graban
+        :param pre_roll: Segundos anteriores a la aparición que se incluyen en el clip
+        :param post_roll: Segundos que se sigue grabando tras dejar de ver personas
+        :param max_clip_seconds: Duración máxima de un clip (después se empieza otro)
+        :param quota_mb: Espacio máximo de los clips; al superarlo se borran los más antiguos
+        :param clip_format: 'avi' (MJPEG) o 'mp4'
+        :param max_queue: Frames máximos pendientes de escribir; si se llena se descartan frames
+        """
+        if clip_format not in CLIP_FORMATS:
+            raise ValueError(f"Formato de clip desconocido: {clip_format} (opciones: {', '.join(CLIP_FORMATS)})")
+        self.directory = directory
+        self.encoder = encoder
+        self.fps = fps
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+        self.max_clip_seconds = max_clip_seconds
+        self.quota_bytes = int(quota_mb * 1024 * 1024)
+        self.extension, self.fourcc = CLIP_FORMATS[clip_format]
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.cameras = {}
+        self.cameras_lock = threading.Lock()
+        self.clip_ids = itertools.count(1)
+        self.writers = {}  # sólo los usa el hilo de escritura: {clip_id: (clip, VideoWriter)}
+        self.running = False
+        self.thread = None
+        self.dropped = 0
+        self.frames_written = 0
+        self.clips_written = 0
+        self.evicted = 0
+        self.disk_bytes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _camera(self, camera):
+        """Obtiene (o crea) el estado de grabación de una cámara"""
+        with self.cameras_lock:
+            state = self.cameras.get(camera)
+            if state is None:
+                state = CameraRecording(max(1, int(round(self.pre_roll * self.fps))))
+                self.cameras[camera] = state
+            return state
+
+    def start(self):
+        """Arranca el hilo de escritura"""
+        if self.running:
+            return
+        self.running = True
+        self.disk_bytes = sum(size for _, _, size in self._list_files())
+        self.thread = threading.Thread(target=self._writer_loop, name="clip-writer", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=5.0):
+        """
+        Cierra los clips en curso y detiene el hilo de escritura tras escribir lo pendiente
+        :param timeout: Tiempo máximo en segundos para esperar a que termine
+        """
+        with self.cameras_lock:
+            states = list(self.cameras.values())
+        for state in states:
+            with state.lock:
+                if state.clip is not None:
+                    self._end_clip(state)
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def add_frame(self, camera, frame):
+        """
+        Entrega un frame de la cámara (desde el bucle de captura; no bloquea).
+        Sólo se codifica un frame cada 1/fps segundos; la fuente debe entregar al menos fps
+        frames por segundo para que los clips se reproduzcan a velocidad real.
+        :param camera: Identificador de la cámara
+        :param frame: Imagen de OpenCV (numpy array en formato BGR)
+        """
+        state = self._camera(camera)
+        now = time.time()
+        period = 1.0 / self.fps
+        # Se acepta el frame más cercano a cada instante previsto (con media período de
+        # margen): con una fuente a fps justos, la variación entre frames no descarta la mitad
+        if now < state.next_frame - period / 2:
+            return
+        state.next_frame = max(state.next_frame + period, now + period)
+
+        jpeg = self.encoder.encode(frame)
+        if jpeg is None:
+            return
+
+        with state.lock:
+            state.ring.append((now, jpeg))
+            clip = state.clip
+            if clip is None:
+                return
+            if not state.person and now - state.person_lost >= self.post_roll:
+                self._end_clip(state)
+                return
+            if now - clip.started >= self.max_clip_seconds:
+                # Clip demasiado largo: se cierra y se continúa en uno nuevo
+                self._end_clip(state)
+                self._start_clip(state, camera, with_pre_roll=False)
+                clip = state.clip
+            # Dentro del lock, para que ningún frame quede detrás del fin del clip
+            self._enqueue(('frame', clip, jpeg))
+
+    def update(self, camera, has_person):
+        """
+        Informa del resultado de una detección (desde el hilo de inferencia; no bloquea)
+        :param camera: Identificador de la cámara
+        :param has_person: Si se detectaron personas
+        """
+        state = self._camera(camera)
+        with state.lock:
+            if has_person and not state.person and state.clip is None:
+                self._start_clip(state, camera)
+                print(f"🎬 Grabando clip de la cámara {camera}: {os.path.basename(state.clip.path)}")
+            elif not has_person and state.person:
+                state.person_lost = time.time()
+            state.person = has_person
+
+    def _start_clip(self, state, camera, with_pre_roll=True):
+        """Abre un clip nuevo con el pre-roll (llamar con state.lock tomado)"""
+        clip_id = next(self.clip_ids)
+        name = f"cam{camera}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{clip_id}{self.extension}"
+        pre_roll = list(state.ring) if with_pre_roll else []
+        state.clip = Clip(clip_id, camera, os.path.join(self.directory, name), self.fps, pre_roll)
+        self._enqueue(('open', state.clip, None))
+
+    def _end_clip(self, state):
+        """Marca el fin del clip en curso (llamar con state.lock tomado)"""
+        state.clip.ended = True
+        self._enqueue(('close', state.clip, None))
+        state.clip = None
+
+    def _enqueue(self, item):
+        """Encola un trabajo para el hilo de escritura, descartándolo si la cola está llena"""
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def _writer_loop(self):
+        """Bucle del hilo de escritura: escribe los frames y cierra los clips terminados"""
+        while self.running or not self.queue.empty():
+            try:
+                kind, clip, jpeg = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                # Sin trabajos pendientes: cerrar los clips cuyo fin pudo perderse con la cola llena
+                for clip, _ in list(self.writers.values()):
+                    if clip.ended:
+                        self._close(clip)
+                continue
+
+            try:
+                if kind == 'close':
+                    self._close(clip)
+                    continue
+                if clip.id not in self.writers:
+                    if clip.closed:
+                        continue  # ya se cerró al vaciarse la cola
+                    self._open(clip)
+                if kind == 'frame':
+                    self._write(clip, jpeg)
+            except (OSError, cv2.error) as e:
+                print(f"Error al grabar el clip {clip.path}: {e}")
+
+        for clip, _ in list(self.writers.values()):
+            self._close(clip)
+
+    def _open(self, clip):
+        """Crea el archivo del clip y escribe el pre-roll"""
+        self._enforce_quota()
+        self.writers[clip.id] = (clip, None)  # el VideoWriter se crea con el tamaño del primer frame
+        for _, jpeg in clip.pre_roll:
+            self._write(clip, jpeg)
+        clip.pre_roll = []
+
+    def _write(self, clip, jpeg):
+        """Decodifica un JPEG y lo añade al clip"""
+        frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            return
+        _, writer = self.writers[clip.id]
+        if writer is None:
+            height, width = frame.shape[:2]
+            writer = cv2.VideoWriter(clip.path, cv2.VideoWriter_fourcc(*self.fourcc), clip.fps, (width, height))
+            if not writer.isOpened():
+                raise OSError(f"no se pudo crear el archivo ({self.fourcc})")
+            self.writers[clip.id] = (clip, writer)
+            clip.size = (width, height)
+        elif (frame.shape[1], frame.shape[0]) != clip.size:
+            frame = cv2.resize(frame, clip.size)
+        writer.write(frame)
+        self.frames_written += 1
+
+    def _close(self, clip):
+        """Cierra el archivo de un clip y aplica la cuota de disco"""
+        clip.closed = True
+        _, writer = self.writers.pop(clip.id, (None, None))
+        if writer is None:
+            return
+        writer.release()
+        self.clips_written += 1
+        try:
+            self.disk_bytes += os.path.getsize(clip.path)
+        except OSError:
+            pass
+        self._enforce_quota()
+
+    def _list_files(self):
+        """
+        Clips guardados en la carpeta
+        :return: Lista de (instante de modificación, ruta, bytes), del más antiguo al más nuevo
+        """
+        files = []
+        try:
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and entry.name.endswith(tuple(ext for ext, _ in CLIP_FORMATS.values())):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, entry.path, stat.st_size))
+        except OSError:
+            pass
+        return sorted(files)
+
+    def _enforce_quota(self):
+        """Borra los clips más antiguos (nunca uno abierto ni el último) hasta quedar dentro de la cuota"""
+        if self.disk_bytes <= self.quota_bytes:
+            return
+        files = self._list_files()
+        open_paths = {clip.path for clip, _ in self.writers.values()}
+        total = sum(size for _, _, size in files)
+        for _, path, size in files[:-1]:
+            if total <= self.quota_bytes:
+                break
+            if path in open_paths:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+                self.evicted += 1
+            except OSError as e:
+                print(f"No se pudo borrar el clip {path}: {e}")
+        self.disk_bytes = total
+
+    def list_clips(self):
+        """
+        Clips guardados, del más reciente al más antiguo
+        :return: Lista de diccionarios con nombre, fecha y tamaño
+        """
+        return [{
+            'name': os.path.basename(path),
+            'time': datetime.fromtimestamp(mtime).isoformat(timespec='seconds'),
+            'size': size
+        } for mtime, path, size in reversed(self._list_files())]
+
+    def get_stats(self, camera=None):
+        """
+        Obtiene los contadores de grabación
+        :param camera: Si se indica, incluye si esa cámara está grabando
+        :return: Diccionario con clips y frames escritos, frames descartados, pendientes y espacio usado
+        """
+        stats = {
+            'clips': self.clips_written,
+            'frames': self.frames_written,
+            'dropped': self.dropped,
+            'pending': self.queue.qsize(),
+            'evicted': self.evicted,
+            'disk_mb': round(self.disk_bytes / (1024 * 1024), 1)
+        }
+        if camera is not None:
+            state = self._camera(camera)
+            with state.lock:
+                stats['recording'] = state.clip is not None
+        return stats
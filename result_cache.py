@@ -0,0 +1,134 @@
+import time
+import threading
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+
+def dhash(image, hash_size=16):
+    """
+    Hash perceptual por diferencias (dHash): compara cada píxel con su vecino de la derecha
+    en una versión diminuta del frame en escala de grises
+    :param image: Imagen de OpenCV (numpy array en formato BGR)
+    :param hash_size: Lado de la cuadrícula; el hash tiene hash_size * hash_size bits
+    :return: Hash como bytes
+    """
+    # Reducir primero (INTER_AREA promedia el ruido del sensor) y convertir a gris sólo la miniatura
+    small = cv2.resize(image, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    return np.packbits(small[:, 1:] > small[:, :-1]).tobytes()
+
+
+class ResultCache:
+    def __init__(self, max_size=256, ttl=30.0, hash_size=16):
+        """
+        Caché LRU de resultados del modelo indexada por el hash perceptual del frame.
+        Frames casi idénticos (escena quieta, imágenes de prueba repetidas) devuelven el
+        resultado guardado sin ejecutar el modelo. La clave incluye el tamaño del frame,
+        la resolución de inferencia y la confianza mínima de las candidatas guardadas.
+        Un hash más grande distingue cambios más pequeños (p. ej. una persona lejana);
+        ttl limita cuánto tiempo puede reutilizarse un resultado.
+        :param max_size: Resultados máximos guardados
+        :param ttl: Segundos que un resultado sigue siendo válido (None para no caducar)
+        :param hash_size: Lado de la cuadrícula del dHash
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hash_size = hash_size
+        self.entries = OrderedDict()  # {clave: (instante, resultado)}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def key(self, image, shortest_edge=None, min_score=None):
+        """
+        Calcula la clave de un frame
+        :param image: Imagen de OpenCV (numpy array en formato BGR)
+        :param shortest_edge: Lado más corto con el que se analiza la imagen
+        :param min_score: Confianza mínima de las detecciones guardadas
+        :return: Tupla hashable
+        """
+        return dhash(image, self.hash_size), image.shape[:2], shortest_edge, min_score
+
+    def get(self, key):
+        """
+        Busca un resultado
+        :param key: Clave devuelta por key()
+        :return: Resultado guardado o None si no está o caducó
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                stored, value = entry
+                if self.ttl is None or time.time() - stored < self.ttl:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """
+        Guarda un resultado, descartando el menos usado si la caché está llena
+        :param key: Clave devuelta por key()
+        :param value: Resultado (no debe modificarse después)
+        """
+        with self.lock:
+            self.entries[key] = (time.time(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, images, shortest_edges, min_score, compute):
+        """
+        Devuelve los resultados de un lote, ejecutando compute sólo para los frames que no están en caché
+        :param images: Lista de imágenes de OpenCV
+        :param shortest_edges: Lista con el lado más corto de cada imagen (o None)
+        :param min_score: Confianza mínima de las detecciones guardadas
+        :param compute: Función (imágenes, lados) -> lista de resultados para los frames que faltan
+        :return: Lista de resultados, uno por imagen
+        """
+        shortest_edges = shortest_edges or [None] * len(images)
+        keys = [self.key(image, edge, min_score) for image, edge in zip(images, shortest_edges)]
+        results = [self.get(key) for key in keys]
+        # Los frames repetidos dentro del mismo lote (p. ej. varias cámaras sobre la misma escena) se calculan una vez
+        missing = {}
+        for i, result in enumerate(results):
+            if result is None:
+                missing.setdefault(keys[i], []).append(i)
+        if missing:
+            first = [indices[0] for indices in missing.values()]
+            edges = [shortest_edges[i] for i in first]
+            computed = compute([images[i] for i in first], edges if any(edges) else None)
+            for (key, indices), value in zip(missing.items(), computed):
+                self.put(key, value)
+                for i in indices:
+                    results[i] = value
+        return results
+
+    def clear(self):
+        """Descarta todos los resultados guardados"""
+        with self.lock:
+            self.entries.clear()
+
+    def get_stats(self):
+        """
+        Obtiene los contadores de la caché
+        :return: Diccionario con aciertos, fallos, tasa de aciertos, tamaño y descartes
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
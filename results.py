@@ -0,0 +1,178 @@
+import numpy as np
+
+# Una fila por objeto detectado: caja [x1, y1, x2, y2] en píxeles, confianza y clase
+DETECTION_DTYPE = np.dtype([('box', np.float32, (4,)), ('score', np.float32), ('class_id', np.int32)])
+
+# Colores BGR de las cajas: verde para personas, naranja para el resto
+PERSON_COLOR = (0, 255, 0)
+OBJECT_COLOR = (0, 165, 255)
+
+
+class LabelTable:
+    def __init__(self, id2label):
+        """
+        Tabla de clases del modelo, calculada una sola vez: nombre, si es persona y color de cada clase
+        :param id2label: Diccionario {id de clase: nombre} (model.config.id2label)
+        """
+        size = max(id2label) + 1 if id2label else 0
+        self.names = np.array([id2label.get(i, f"LABEL_{i}") for i in range(size)], dtype=object)
+        self.person_mask = np.array([name.lower() == 'person' for name in self.names], dtype=bool)
+        self.colors = np.where(self.person_mask[:, None], PERSON_COLOR, OBJECT_COLOR).astype(np.int32)
+
+    def id2label(self):
+        """
+        Diccionario {id de clase: nombre} para reconstruir la tabla en otro proceso
+        :return: Diccionario
+        """
+        return dict(enumerate(self.names.tolist()))
+
+
+class Detections:
+    def __init__(self, array=None, labels=None, candidates=None, threshold=None):
+        """
+        Resultado de una detección como array estructurado (DETECTION_DTYPE).
+        Las cajas, confianzas y clases son vistas del array; los nombres se obtienen de la
+        tabla de clases sólo cuando se piden. No se modifica después de crearse.
+        Conserva además todas las candidatas que devolvió el modelo (por encima de un umbral
+        bajo), para poder aplicar otro umbral de confianza sin repetir la detección.
+        :param array: Array estructurado con las detecciones (None para ninguna)
+        :param labels: LabelTable del modelo
+        :param candidates: Array con todas las candidatas (por defecto, las propias detecciones)
+        :param threshold: Umbral con el que se filtraron las candidatas (None si no se filtraron)
+        """
+        self.array = array if array is not None else np.empty(0, dtype=DETECTION_DTYPE)
+        self.table = labels
+        self.candidates = candidates if candidates is not None else self.array
+        self.threshold = threshold
+        self._label_names = None
+
+    def __len__(self):
+        return len(self.array)
+
+    @property
+    def boxes(self):
+        """Cajas (N, 4) en píxeles del frame"""
+        return self.array['box']
+
+    @property
+    def scores(self):
+        """Confianzas (N,)"""
+        return self.array['score']
+
+    @property
+    def class_ids(self):
+        """Ids de clase (N,)"""
+        return self.array['class_id']
+
+    @property
+    def person_mask(self):
+        """Máscara booleana (N,) con las detecciones que son personas"""
+        if self.table is None or not len(self.array):
+            return np.zeros(len(self.array), dtype=bool)
+        return self.table.person_mask[self.class_ids]
+
+    @property
+    def has_person(self):
+        return bool(self.person_mask.any())
+
+    @property
+    def person_count(self):
+        return int(self.person_mask.sum())
+
+    @property
+    def labels(self):
+        """Nombres de las clases detectadas (lista, calculada la primera vez que se pide)"""
+        if self._label_names is None:
+            if self.table is None or not len(self.array):
+                self._label_names = []
+            else:
+                self._label_names = self.table.names[self.class_ids].tolist()
+        return self._label_names
+
+    def unique_labels(self):
+        """
+        Nombres de las clases detectadas, sin repetir
+        :return: Lista de nombres
+        """
+        if self.table is None or not len(self.array):
+            return []
+        return self.table.names[np.unique(self.class_ids)].tolist()
+
+    def colors(self):
+        """
+        Color BGR de cada caja
+        :return: Array (N, 3) de enteros
+        """
+        if self.table is None or not len(self.array):
+            return np.empty((0, 3), dtype=np.int32)
+        return self.table.colors[self.class_ids]
+
+    def with_threshold(self, threshold):
+        """
+        Vuelve a filtrar las candidatas con otro umbral de confianza, sin ejecutar el modelo
+        (por debajo del umbral con que se guardaron las candidatas no aparecen más detecciones)
+        :param threshold: Confianza mínima (None para quedarse con todas las candidatas)
+        :return: Nuevo Detections con las mismas candidatas
+        """
+        if threshold is None:
+            return Detections(self.candidates, self.table, self.candidates)
+        selected = self.candidates[self.candidates['score'] > threshold]
+        return Detections(selected, self.table, self.candidates, threshold)
+
+    def offset(self, dx, dy):
+        """
+        Desplaza todas las cajas, incluidas las candidatas (p. ej. de un recorte al frame completo)
+        :param dx: Desplazamiento horizontal en píxeles
+        :param dy: Desplazamiento vertical en píxeles
+        :return: Nuevo Detections (o el mismo si no hay desplazamiento)
+        """
+        if not dx and not dy:
+            return self
+        candidates = self.candidates.copy()
+        candidates['box'] += np.array([dx, dy, dx, dy], dtype=np.float32)
+        return Detections(candidates, self.table).with_threshold(self.threshold)
+
+    def to_objects(self):
+        """
+        Objetos detectados tal como los recibe la interfaz
+        :return: Lista de diccionarios con 'label' y 'score'
+        """
+        return [{'label': label, 'score': score} for label, score in zip(self.labels, self.scores.tolist())]
+
+
+def post_process(logits, pred_boxes, target_sizes, threshold, labels):
+    """
+    Convierte la salida de DETR de todo el lote en Detections, con operaciones vectorizadas
+    (mismo resultado que post_process_object_detection del procesador de Hugging Face)
+    :param logits: Array (B, Q, clases + 1) con los logits de cada consulta
+    :param pred_boxes: Array (B, Q, 4) con las cajas (cx, cy, w, h) relativas a la imagen
+    :param target_sizes: Lista de (alto, ancho) de cada imagen
+    :param threshold: Confianza mínima
+    :param labels: LabelTable del modelo
+    :return: Lista de Detections, una por imagen
+    """
+    logits = np.asarray(logits, dtype=np.float32)
+    pred_boxes = np.asarray(pred_boxes, dtype=np.float32)
+
+    # Softmax sobre las clases, sin la última ("sin objeto")
+    exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    probs = exp[..., :-1] / exp.sum(axis=-1, keepdims=True)
+    class_ids = probs.argmax(axis=-1)
+    scores = np.take_along_axis(probs, class_ids[..., None], axis=-1)[..., 0]
+
+    # (cx, cy, w, h) relativos → (x1, y1, x2, y2) en píxeles de cada imagen
+    centers, sizes = pred_boxes[..., :2], pred_boxes[..., 2:] / 2
+    corners = np.concatenate([centers - sizes, centers + sizes], axis=-1)
+    scale = np.array([[w, h, w, h] for h, w in target_sizes], dtype=np.float32)[:, None, :]
+    corners *= scale
+
+    keep = scores > threshold
+    results = []
+    for i in range(len(target_sizes)):
+        selected = keep[i]
+        array = np.empty(int(selected.sum()), dtype=DETECTION_DTYPE)
+        array['box'] = corners[i][selected]
+        array['score'] = scores[i][selected]
+        array['class_id'] = class_ids[i][selected]
+        results.append(Detections(array, labels, threshold=threshold))
+    return results
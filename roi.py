@@ -0,0 +1,180 @@
+import time
+import threading
+import cv2
+import numpy as np
+
+ROI_MODES = ('off', 'static', 'dynamic')
+
+
+class RegionSelector:
+    def __init__(self, polygons=None, mode='dynamic', margin=0.5, full_frame_interval=10.0,
+                 max_fraction=0.6, min_edge=160, align=32):
+        """
+        Elige la parte del frame sobre la que se ejecuta el modelo.
+        Las zonas estáticas (polígonos) limitan siempre el análisis; en el modo dinámico,
+        además, se recorta alrededor de las últimas detecciones y de la zona con movimiento,
+        con una pasada sobre el frame completo cada cierto tiempo para encontrar objetos nuevos.
+        El recorte se analiza con la misma densidad de píxeles que el frame completo, así que
+        el cómputo baja en proporción al área analizada.
+        :param polygons: Lista de polígonos [(x, y), ...] en píxeles o en fracciones del frame (0.0-1.0)
+        :param mode: 'off' (frame completo), 'static' (sólo polígonos) o 'dynamic'
+        :param margin: Margen alrededor de la zona de interés, como fracción de su tamaño
+        :param full_frame_interval: Segundos máximos entre pasadas sobre el frame completo (modo dinámico)
+        :param max_fraction: Si el recorte supera esta fracción del área, se analiza el frame completo
+        :param min_edge: Lado más corto mínimo (en píxeles) de la entrada del modelo para un recorte
+        :param align: Los recortes se alinean a múltiplos de estos píxeles para reutilizar buffers
+        """
+        if mode not in ROI_MODES:
+            raise ValueError(f"Modo de ROI desconocido: {mode} (opciones: {', '.join(ROI_MODES)})")
+        self.polygons = [np.asarray(polygon, dtype=np.float32) for polygon in (polygons or [])]
+        self.mode = mode
+        self.margin = margin
+        self.full_frame_interval = full_frame_interval
+        self.max_fraction = max_fraction
+        self.min_edge = min_edge
+        self.align = align
+        self.last_full_frame = 0.0
+        self.mask_key = None
+        self.mask = None
+        self.full_passes = 0
+        self.roi_passes = 0
+        self.analyzed_fraction = 0.0  # suma de las fracciones de área analizadas
+        self.lock = threading.Lock()
+
+    def _polygons_for(self, height, width):
+        """
+        Convierte los polígonos a píxeles del frame
+        :return: Lista de arrays int32 de puntos (x, y)
+        """
+        result = []
+        for polygon in self.polygons:
+            points = polygon
+            if points.size and points.max() <= 1.0:
+                points = points * np.array([width, height], dtype=np.float32)
+            result.append(np.round(points).astype(np.int32))
+        return result
+
+    def _static_region(self, height, width):
+        """
+        Rectángulo que contiene todos los polígonos
+        :return: Tupla (x1, y1, x2, y2) o None si no hay polígonos
+        """
+        if not self.polygons:
+            return None
+        points = np.concatenate(self._polygons_for(height, width))
+        x1, y1 = points.min(axis=0)
+        x2, y2 = points.max(axis=0)
+        return (max(0, int(x1)), max(0, int(y1)), min(width, int(x2) + 1), min(height, int(y2) + 1))
+
+    def _static_mask(self, height, width):
+        """Máscara (reutilizada mientras no cambie el tamaño del frame) con los polígonos a 255"""
+        if self.mask_key != (height, width):
+            self.mask = np.zeros((height, width), dtype=np.uint8)
+            cv2.fillPoly(self.mask, self._polygons_for(height, width), 255)
+            self.mask_key = (height, width)
+        return self.mask
+
+    def _dynamic_region(self, height, width, boxes, motion_region):
+        """
+        Rectángulo alrededor de las últimas detecciones y de la zona con movimiento
+        :param boxes: Array (N, 4) o lista de cajas [x1, y1, x2, y2] de la última detección
+        :param motion_region: Zona con movimiento (x1, y1, x2, y2) en fracciones del frame, o None
+        :return: Tupla (x1, y1, x2, y2) o None si no hay nada que seguir
+        """
+        rects = np.asarray(boxes if boxes is not None else [], dtype=np.float32).reshape(-1, 4)
+        if motion_region is not None:
+            mx1, my1, mx2, my2 = motion_region
+            motion = np.array([[mx1 * width, my1 * height, mx2 * width, my2 * height]], dtype=np.float32)
+            rects = np.concatenate([rects, motion])
+        if not len(rects):
+            return None
+        x1, y1 = rects[:, 0].min(), rects[:, 1].min()
+        x2, y2 = rects[:, 2].max(), rects[:, 3].max()
+        pad_x = (x2 - x1) * self.margin / 2 + self.align
+        pad_y = (y2 - y1) * self.margin / 2 + self.align
+        return (max(0, int(x1 - pad_x)), max(0, int(y1 - pad_y)),
+                min(width, int(x2 + pad_x)), min(height, int(y2 + pad_y)))
+
+    def _align(self, region, height, width):
+        """Redondea el recorte hacia fuera a múltiplos de self.align"""
+        x1, y1, x2, y2 = region
+        a = self.align
+        x1, y1 = (x1 // a) * a, (y1 // a) * a
+        x2, y2 = min(width, -(-x2 // a) * a), min(height, -(-y2 // a) * a)
+        return x1, y1, x2, y2
+
+    def prepare(self, frame, boxes=None, motion_region=None, inference_size=800):
+        """
+        Prepara la imagen que se analizará en lugar del frame completo
+        :param frame: Imagen de OpenCV (numpy array en formato BGR)
+        :param boxes: Cajas (N, 4) de la última detección de esta cámara (modo dinámico)
+        :param motion_region: Zona con movimiento en fracciones del frame (modo dinámico)
+        :param inference_size: Lado más corto con el que se analiza el frame completo
+        :return: Tupla (imagen, (dx, dy), lado más corto para el modelo o None para el de siempre)
+        """
+        height, width = frame.shape[:2]
+        if self.mode == 'off':
+            return frame, (0, 0), None
+
+        with self.lock:
+            static = self._static_region(height, width)
+            if static is not None:
+                static = self._align(static, height, width)
+            region = static
+            now = time.time()
+            if self.mode == 'dynamic' and now - self.last_full_frame < self.full_frame_interval:
+                dynamic = self._dynamic_region(height, width, boxes, motion_region)
+                if dynamic is not None and static is not None:
+                    # Sólo interesa la parte de la zona dinámica que cae dentro de los polígonos
+                    dynamic = (max(dynamic[0], static[0]), max(dynamic[1], static[1]),
+                               min(dynamic[2], static[2]), min(dynamic[3], static[3]))
+                    if dynamic[2] <= dynamic[0] or dynamic[3] <= dynamic[1]:
+                        dynamic = None
+                if dynamic is not None:
+                    region = dynamic
+
+            if region is not None:
+                region = self._align(region, height, width)
+                x1, y1, x2, y2 = region
+                fraction = (x2 - x1) * (y2 - y1) / float(width * height)
+                if fraction > self.max_fraction and static is None:
+                    region = None  # casi todo el frame: no vale la pena recortar
+
+            if region is None:
+                self.last_full_frame = now
+                self.full_passes += 1
+                self.analyzed_fraction += 1.0
+                return frame, (0, 0), None
+            if region == static:
+                self.last_full_frame = now  # la zona estática completa cuenta como pasada completa
+            self.roi_passes += 1
+            self.analyzed_fraction += fraction
+
+        x1, y1, x2, y2 = region
+        crop = frame[y1:y2, x1:x2]
+        if self.polygons:
+            # Tapar lo que queda fuera de los polígonos para que el modelo no lo vea
+            mask = self._static_mask(height, width)[y1:y2, x1:x2]
+            crop = cv2.bitwise_and(crop, crop, mask=mask)
+
+        # Misma densidad de píxeles que el frame completo: el lado corto escala con el recorte
+        short_frame = min(height, width)
+        short_crop = min(y2 - y1, x2 - x1)
+        edge = int(round(inference_size * short_crop / short_frame / 16.0)) * 16
+        edge = max(self.min_edge, min(inference_size, edge))
+        return crop, (x1, y1), edge
+
+    def get_stats(self):
+        """
+        Obtiene los contadores del selector
+        :return: Diccionario con el modo, pasadas completas, pasadas recortadas y área media analizada
+        """
+        with self.lock:
+            total = self.full_passes + self.roi_passes
+            return {
+                'mode': self.mode,
+                'polygons': len(self.polygons),
+                'full_passes': self.full_passes,
+                'roi_passes': self.roi_passes,
+                'mean_area': round(self.analyzed_fraction / total, 3) if total else 1.0
+            }
@@ -0,0 +1,75 @@
+import time
+import threading
+from collections import namedtuple
+
+# Resultado publicado de una cámara. Los objetos para la interfaz se preparan una sola vez,
+# al publicarlo, y todas las lecturas comparten la misma lista (no debe modificarse)
+ResultSnapshot = namedtuple('ResultSnapshot',
+                            ['version', 'detections', 'suggestion', 'has_person', 'objects', 'timestamp'])
+
+# Configuración común a todas las cámaras
+Settings = namedtuple('Settings', ['version', 'confidence', 'show_boxes', 'cpu_budget'])
+
+# Configuración propia de una cámara
+CameraSettings = namedtuple('CameraSettings', ['version', 'show_boxes', 'priority'])
+
+
+def result_snapshot(detections, suggestion):
+    """
+    Crea la instantánea de un resultado (la versión la asigna SnapshotCell al publicarla)
+    :param detections: Detections del resultado
+    :param suggestion: Sugerencia mostrada al usuario
+    :return: ResultSnapshot
+    """
+    return ResultSnapshot(0, detections, suggestion, detections.has_person, detections.to_objects(), time.time())
+
+
+class SnapshotCell:
+    def __init__(self, initial):
+        """
+        Referencia a una instantánea inmutable (namedtuple con un campo 'version') que se
+        reemplaza entera en cada cambio. Los lectores sólo leen la referencia: no toman
+        ningún lock y nunca ven un estado a medias. Los escritores se turnan para que cada
+        versión nueva parta de la anterior y los números de versión no se repitan, así que
+        comparar la versión basta para saber si algo cambió.
+        :param initial: Primera instantánea
+        """
+        self.current = initial
+        self.write_lock = threading.Lock()
+
+    def get(self):
+        """
+        Obtiene la instantánea actual
+        :return: namedtuple publicado más recientemente
+        """
+        return self.current
+
+    @property
+    def version(self):
+        return self.current.version
+
+    def publish(self, snapshot):
+        """
+        Publica una instantánea nueva
+        :param snapshot: Instantánea (su versión se reemplaza por la siguiente)
+        :return: Instantánea publicada
+        """
+        return self.update(lambda _: snapshot)
+
+    def replace(self, **changes):
+        """
+        Publica una copia de la instantánea actual con algunos campos cambiados
+        :return: Instantánea publicada
+        """
+        return self.update(lambda current: current._replace(**changes))
+
+    def update(self, function):
+        """
+        Publica la instantánea que devuelve function a partir de la actual
+        :param function: Función que recibe la instantánea actual y devuelve la nueva
+        :return: Instantánea publicada
+        """
+        with self.write_lock:
+            snapshot = function(self.current)._replace(version=self.current.version + 1)
+            self.current = snapshot
+            return snapshot
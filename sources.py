@@ -0,0 +1,389 @@
+import os
+import math
+import time
+import threading
+from collections import OrderedDict, deque
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+STREAM_PREFIXES = ('rtsp://', 'rtsps://', 'rtmp://', 'http://', 'https://')
+
+
+class FrameSource:
+    kind = 'base'
+    live = False  # las fuentes en vivo marcan su propio ritmo; las grabadas se reproducen a su fps
+
+    def __init__(self, target_fps=None):
+        """
+        Fuente de frames con contabilidad de fps.
+        Si target_fps es menor que el fps de la fuente, los frames sobrantes se descartan
+        sin decodificarlos (grab() sin retrieve()).
+        :param target_fps: Frames por segundo que necesita el consumidor (None = todos)
+        """
+        self.target_fps = target_fps
+        self.frames_read = 0
+        self.frames_skipped = 0
+        self.errors = 0
+        self.reconnects = 0
+        self.info = "No inicializada"
+        self.width = 0
+        self.height = 0
+        self.fps = 0.0
+        self.read_times = deque(maxlen=60)
+        self.next_frame_time = 0.0
+        self.closed = threading.Event()
+
+    def open(self):
+        """
+        Abre la fuente
+        :return: True si se abrió correctamente
+        """
+        raise NotImplementedError
+
+    def _read(self, buffer=None, skip=0):
+        """
+        Lee el siguiente frame descartando antes los indicados
+        :param buffer: Array opcional donde escribir el frame
+        :param skip: Frames a descartar sin decodificar
+        :return: Tupla (éxito, imagen)
+        """
+        raise NotImplementedError
+
+    def interrupt(self):
+        """Despierta cualquier espera de ritmo o de reconexión (para poder detener el hilo lector)"""
+        self.closed.set()
+
+    def release(self):
+        """Libera la fuente"""
+        self.closed.set()
+
+    def set_target_fps(self, fps):
+        """
+        Cambia los frames por segundo que necesita el consumidor
+        :param fps: Frames por segundo (None = todos los de la fuente)
+        """
+        self.target_fps = fps
+
+    def _pace(self, frames):
+        """
+        Espera lo necesario para entregar los frames al ritmo de la fuente
+        :param frames: Frames de la fuente que avanzó esta lectura (descartados + entregado)
+        """
+        if not self.fps:
+            return
+        now = time.time()
+        # Si el consumidor se atrasó no se recupera el tiempo perdido entregando ráfagas
+        self.next_frame_time = max(self.next_frame_time + frames / self.fps, now)
+        if self.next_frame_time > now:
+            self.closed.wait(self.next_frame_time - now)
+
+    def _frames_to_skip(self):
+        """Frames que se descartan antes de cada lectura para no superar target_fps"""
+        if not self.target_fps or not self.fps or self.fps <= self.target_fps:
+            return 0
+        return max(0, int(round(self.fps / self.target_fps)) - 1)
+
+    def read(self, buffer=None):
+        """
+        Lee un frame
+        :param buffer: Array opcional donde escribir el frame para evitar reservar memoria
+        :return: Tupla (éxito, imagen); sin buffer, la imagen puede compartirse con la fuente
+                 (p. ej. la caché de una carpeta de imágenes) y no se debe modificar
+        """
+        skip = self._frames_to_skip()
+        ok, image = self._read(buffer, skip)
+        if ok and image is not None:
+            self.frames_read += 1
+            self.frames_skipped += skip
+            self.read_times.append(time.time())
+        else:
+            self.errors += 1
+        return ok, image
+
+    def measured_fps(self):
+        """
+        Frames por segundo entregados realmente
+        :return: fps medidos sobre las últimas lecturas
+        """
+        times = list(self.read_times)
+        if len(times) < 2 or times[-1] <= times[0]:
+            return 0.0
+        return (len(times) - 1) / (times[-1] - times[0])
+
+    def get_stats(self):
+        """
+        Obtiene la contabilidad de la fuente
+        :return: Diccionario con tipo, fps nominal, pedido y medido, frames leídos, descartados y errores
+        """
+        return {
+            'kind': self.kind,
+            'info': self.info,
+            'source_fps': round(self.fps, 2),
+            'target_fps': self.target_fps,
+            'fps': round(self.measured_fps(), 2),
+            'frames': self.frames_read,
+            'skipped': self.frames_skipped,
+            'errors': self.errors,
+            'reconnects': self.reconnects
+        }
+
+
+class CaptureSource(FrameSource):
+    def __init__(self, spec, target_fps=None, hw_accel=True):
+        """
+        Fuente basada en cv2.VideoCapture
+        :param spec: Índice del dispositivo, ruta de video o URL
+        :param target_fps: Frames por segundo que necesita el consumidor
+        :param hw_accel: Si es True, pide decodificación por hardware cuando OpenCV lo permite
+        """
+        super().__init__(target_fps)
+        self.spec = spec
+        self.hw_accel = hw_accel
+        self.cap = None
+
+    def _create_capture(self):
+        """Crea el VideoCapture, con aceleración por hardware si está disponible"""
+        if self.hw_accel and isinstance(self.spec, str) and hasattr(cv2, 'CAP_PROP_HW_ACCELERATION'):
+            try:
+                cap = cv2.VideoCapture(self.spec, cv2.CAP_FFMPEG,
+                                       [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY])
+                if cap.isOpened():
+                    return cap
+                cap.release()
+            except cv2.error:
+                pass
+        return cv2.VideoCapture(self.spec)
+
+    def open(self):
+        """
+        Abre la fuente y lee sus propiedades
+        :return: True si se abrió correctamente
+        """
+        self._release_capture()
+        self.closed.clear()
+        self.cap = self._create_capture()
+        if not self.cap.isOpened():
+            self._release_capture()
+            self.info = f"Error: No se pudo abrir {self.spec}"
+            return False
+        self.width = self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)
+        self.height = self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 0.0
+        self.info = f"{self.kind} {self.spec}: {self.width:.0f}x{self.height:.0f} @ {self.fps:.1f}fps"
+        return True
+
+    def _grab_and_retrieve(self, buffer, skip):
+        """Descarta skip frames con grab() y decodifica el siguiente"""
+        for _ in range(skip):
+            if not self.cap.grab():
+                return False, None
+        if buffer is not None:
+            return self.cap.read(buffer)
+        return self.cap.read()
+
+    def _read(self, buffer=None, skip=0):
+        if self.cap is None and not self.open():
+            return False, None
+        return self._grab_and_retrieve(buffer, skip)
+
+    def _release_capture(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+    def release(self):
+        super().release()
+        self._release_capture()
+
+
+class DeviceSource(CaptureSource):
+    kind = 'device'
+    live = True
+
+    def __init__(self, index, target_fps=None):
+        """
+        Cámara local
+        :param index: Índice del dispositivo (0 para la cámara integrada)
+        :param target_fps: Frames por segundo que necesita el consumidor
+        """
+        super().__init__(index, target_fps, hw_accel=False)
+
+
+class VideoFileSource(CaptureSource):
+    kind = 'file'
+
+    def __init__(self, path, target_fps=None, loop=True, realtime=True, hw_accel=True):
+        """
+        Video grabado, reproducido a su velocidad natural
+        :param path: Ruta del archivo
+        :param target_fps: Frames por segundo que necesita el consumidor
+        :param loop: Si es True, vuelve al principio al terminar
+        :param realtime: Si es True, entrega los frames al ritmo del video (False = lo más rápido posible)
+        :param hw_accel: Si es True, pide decodificación por hardware cuando OpenCV lo permite
+        """
+        super().__init__(path, target_fps, hw_accel)
+        self.loop = loop
+        self.realtime = realtime
+
+    def _read(self, buffer=None, skip=0):
+        if self.cap is None and not self.open():
+            return False, None
+
+        ok, image = self._grab_and_retrieve(buffer, skip)
+        if not ok and self.loop:
+            # Fin del video: volver al principio
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, image = self._grab_and_retrieve(buffer, 0)
+
+        if ok and self.realtime:
+            self._pace(skip + 1)
+        return ok, image
+
+
+class StreamSource(CaptureSource):
+    kind = 'stream'
+    live = True
+
+    def __init__(self, url, target_fps=None, hw_accel=True, min_backoff=1.0, max_backoff=30.0, realtime=False):
+        """
+        Cámara IP o stream de red (RTSP/HTTP) con reconexión automática
+        :param url: URL del stream (también sirve una ruta de archivo para pruebas)
+        :param target_fps: Frames por segundo que necesita el consumidor
+        :param hw_accel: Si es True, pide decodificación por hardware cuando OpenCV lo permite
+        :param min_backoff: Segundos de espera tras el primer fallo
+        :param max_backoff: Segundos máximos de espera entre reintentos
+        :param realtime: Si es True, entrega los frames al fps nominal (para simular una cámara con un archivo)
+        """
+        super().__init__(url, target_fps, hw_accel)
+        self.realtime = realtime
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.backoff = min_backoff
+
+    def open(self):
+        opened = super().open()
+        if opened:
+            # Con el buffer mínimo del decodificador los frames llegan con menos retraso
+            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return opened
+
+    def _read(self, buffer=None, skip=0):
+        if self.cap is not None:
+            ok, image = self._grab_and_retrieve(buffer, skip)
+            if ok:
+                self.backoff = self.min_backoff
+                if self.realtime:
+                    self._pace(skip + 1)
+                return ok, image
+            print(f"Se perdió la conexión con {self.spec}")
+
+        # Reconectar con espera exponencial (interrumpible con release())
+        self._release_capture()
+        if self.closed.wait(self.backoff):
+            return False, None
+        self.backoff = min(self.backoff * 2, self.max_backoff)
+        self.reconnects += 1
+        if self.open():
+            print(f"Reconectado a {self.spec}")
+        return False, None
+
+
+class ImageDirectorySource(FrameSource):
+    kind = 'images'
+
+    def __init__(self, directory, fps=30, cache_size=8, placeholder=None):
+        """
+        Carpeta de imágenes que se leen a medida que se necesitan (no se cargan todas en memoria)
+        :param directory: Ruta de la carpeta
+        :param fps: Frames por segundo a los que se entregan las imágenes (0 = sin límite)
+        :param cache_size: Imágenes decodificadas que se conservan para no leerlas de nuevo
+        :param placeholder: Imagen que se entrega si la carpeta no tiene imágenes
+        """
+        super().__init__()
+        self.directory = directory
+        self.fps = float(fps or 0)
+        self.files = []
+        self.index = 0
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.placeholder = placeholder
+
+    def open(self):
+        """
+        Lista los nombres de las imágenes de la carpeta (sin leerlas)
+        :return: True si hay imágenes (o una imagen de reemplazo)
+        """
+        self.closed.clear()
+        try:
+            self.files = sorted(entry.path for entry in os.scandir(self.directory)
+                                if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS))
+        except OSError:
+            self.files = []
+        self.info = f"{len(self.files)} imágenes en {self.directory}"
+        return bool(self.files) or self.placeholder is not None
+
+    def _load(self, path):
+        """Lee una imagen, usando la caché si ya se leyó antes"""
+        image = self.cache.get(path)
+        if image is not None:
+            self.cache.move_to_end(path)
+            return image
+        image = cv2.imread(path)
+        if image is not None:
+            self.cache[path] = image
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return image
+
+    def _stride(self, skip):
+        """
+        Imágenes que se avanza después de entregar una habiendo descartado skip frames.
+        Si el paso compartiera un divisor con el número de imágenes, las vueltas a la carpeta
+        repetirían siempre las mismas (p. ej. 2 imágenes saltando 1): se usa el paso más
+        cercano que recorre todas
+        :param skip: Frames descartados en esta lectura
+        :return: Paso entre 1 y el número de imágenes
+        """
+        count = len(self.files)
+        stride = (skip + 1) % count or count
+        while count > 1 and math.gcd(stride, count) != 1:
+            stride += 1
+        return stride
+
+    def _read(self, buffer=None, skip=0):
+        if self.files:
+            # Los frames descartados sólo avanzan el índice: no se leen del disco
+            path = self.files[self.index]
+            self.index = (self.index + self._stride(skip)) % len(self.files)
+            image = self._load(path)
+        else:
+            image = self.placeholder
+        if image is None:
+            return False, None
+
+        self._pace(skip + 1)
+
+        if buffer is not None and buffer.shape == image.shape:
+            np.copyto(buffer, image)
+            return True, buffer
+        # Sin buffer se entrega la imagen de la caché: los frames no se modifican después de leerlos
+        return True, image
+
+
+def open_source(spec, target_fps=None, fps=30, realtime=True):
+    """
+    Crea la fuente adecuada para una especificación
+    :param spec: Índice de cámara, URL (rtsp://, http://...), ruta de video o carpeta de imágenes
+    :param target_fps: Frames por segundo que necesita el consumidor
+    :param fps: Ritmo de entrega de las carpetas de imágenes
+    :param realtime: Si es False, los videos se leen lo más rápido posible (p. ej. para benchmarks)
+    :return: Instancia de FrameSource (sin abrir)
+    """
+    if isinstance(spec, int) or (isinstance(spec, str) and spec.isdigit()):
+        return DeviceSource(int(spec), target_fps)
+    if spec.lower().startswith(STREAM_PREFIXES):
+        return StreamSource(spec, target_fps)
+    if os.path.isdir(spec):
+        return ImageDirectorySource(spec, fps=fps)
+    return VideoFileSource(spec, target_fps, realtime=realtime)
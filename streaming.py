@@ -0,0 +1,334 @@
+import time
+import asyncio
+import threading
+import itertools
+from collections import deque
+
+from encoder import JpegEncoder
+
+
+class StreamClient:
+    def __init__(self, client_id, window=30):
+        """
+        Estadísticas de un cliente del stream
+        :param client_id: Identificador del cliente
+        :param window: Número de frames usados para medir fps, bytes/s y frames perdidos
+        """
+        self.id = client_id
+        self.level = 0
+        self.frames = 0
+        self.bytes = 0
+        self.skipped = 0
+        self.connected_at = time.time()
+        self.window = deque(maxlen=window)  # (instante, bytes, frames saltados)
+
+    def record(self, size, skipped):
+        """
+        Registra un frame enviado al cliente
+        :param size: Bytes enviados
+        :param skipped: Frames que el cliente se saltó por ir atrasado
+        """
+        self.frames += 1
+        self.bytes += size
+        self.skipped += skipped
+        self.window.append((time.time(), size, skipped))
+
+    def window_skip_rate(self):
+        """
+        Fracción de frames perdidos dentro de la ventana
+        :return: Valor entre 0.0 y 1.0
+        """
+        sent = len(self.window)
+        skipped = sum(entry[2] for entry in self.window)
+        total = sent + skipped
+        return skipped / total if total else 0.0
+
+    def get_stats(self, levels):
+        """
+        Obtiene las estadísticas del cliente
+        :param levels: Lista de niveles (calidad, escala) del difusor
+        :return: Diccionario con fps, bytes/s y nivel de calidad actuales
+        """
+        fps = 0.0
+        bytes_per_second = 0.0
+        window = list(self.window)  # copia: el hilo del cliente sigue agregando entradas
+        if len(window) >= 2:
+            elapsed = window[-1][0] - window[0][0]
+            if elapsed > 0:
+                fps = (len(window) - 1) / elapsed
+                bytes_per_second = sum(entry[1] for entry in window[1:]) / elapsed
+        quality, scale = levels[self.level]
+        return {
+            'id': self.id,
+            'fps': round(fps, 2),
+            'bytes_per_second': round(bytes_per_second),
+            'quality': quality,
+            'scale': scale,
+            'frames': self.frames,
+            'skipped': self.skipped,
+            'connected_seconds': round(time.time() - self.connected_at, 1)
+        }
+
+
+class AsyncNotifier:
+    def __init__(self):
+        """
+        Despierta a las corrutinas que esperan en uno o varios event loops desde otros hilos.
+        Cada aviso cuesta una sola llamada por event loop, sin importar cuántas corrutinas esperen.
+        """
+        self.lock = threading.Lock()
+        self.events = {}  # event loop -> asyncio.Event de la espera actual
+
+    def current(self):
+        """
+        Obtiene el evento de la espera actual del event loop en ejecución
+        (llamar desde una corrutina, antes de comprobar si hay datos nuevos)
+        :return: asyncio.Event que se activará con el próximo aviso
+        """
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            event = self.events.get(loop)
+            if event is None:
+                event = self.events[loop] = asyncio.Event()
+            return event
+
+    def notify(self):
+        """Avisa a todos los event loops registrados (se puede llamar desde cualquier hilo)"""
+        with self.lock:
+            loops = list(self.events)
+        for loop in loops:
+            try:
+                loop.call_soon_threadsafe(self._fire, loop)
+            except RuntimeError:
+                # El event loop ya se cerró
+                with self.lock:
+                    self.events.pop(loop, None)
+
+    def _fire(self, loop):
+        """Activa el evento actual del event loop y prepara uno nuevo para la siguiente espera"""
+        with self.lock:
+            event = self.events.pop(loop, None)
+        if event is not None:
+            event.set()
+
+
+class FrameBroadcaster:
+    def __init__(self, encoder=None, adaptive=True, adapt_window=15):
+        """
+        Inicializa el difusor de frames.
+        Un único productor publica cada frame anotado y cualquier número de suscriptores
+        lo recibe; los clientes lentos saltan directamente al más reciente. Cada frame se
+        codifica como mucho una vez por nivel de calidad, sin importar cuántos clientes haya.
+        :param encoder: JpegEncoder usado para codificar (por defecto, uno con calidad 80)
+        :param adaptive: Si es True, baja la calidad/resolución de los clientes que se atrasan
+        :param adapt_window: Frames observados antes de cambiar el nivel de un cliente
+        """
+        self.encoder = encoder or JpegEncoder()
+        self.adaptive = adaptive
+        self.adapt_window = adapt_window
+        self.condition = threading.Condition()
+        self.sequence = 0
+        self.frame = None
+        self.subscribers = 0
+        self.clients = {}
+        self.client_ids = itertools.count(1)
+        # Caché de codificación del frame actual: {(secuencia, nivel): bytes}
+        self.encode_lock = threading.Lock()
+        self.encoded = {}
+        self.levels = self._build_levels()
+        # Avisos para los suscriptores asíncronos (servidor ASGI)
+        self.async_notifier = AsyncNotifier()
+
+    def _build_levels(self):
+        """
+        Niveles de calidad del modo adaptativo, del mejor al más liviano
+        :return: Lista de tuplas (calidad, escala)
+        """
+        quality, scale = self.encoder.quality, self.encoder.scale
+        return [
+            (quality, scale),
+            (max(quality - 20, 30), scale * 0.75),
+            (max(quality - 35, 20), scale * 0.5)
+        ]
+
+    def publish(self, frame):
+        """
+        Publica un nuevo frame para todos los suscriptores
+        :param frame: Frame anotado, listo para codificar. Se guarda sin copiar y se codifica más
+                      tarde, en el hilo de cada cliente: no debe volver a modificarse
+        :return: Número de secuencia asignado al frame
+        """
+        with self.condition:
+            self.sequence += 1
+            self.frame = frame
+            self.condition.notify_all()
+            sequence = self.sequence
+        self.async_notifier.notify()
+        return sequence
+
+    def has_subscribers(self):
+        """
+        Indica si hay algún cliente recibiendo el stream
+        :return: True si hay al menos un suscriptor
+        """
+        with self.condition:
+            return self.subscribers > 0
+
+    def wait_for_frame(self, last_sequence, timeout=None):
+        """
+        Espera un frame más nuevo que el indicado
+        :param last_sequence: Último número de secuencia recibido por el cliente
+        :param timeout: Tiempo máximo de espera en segundos
+        :return: Tupla (secuencia, frame) o (last_sequence, None) si no llegó nada
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.sequence > last_sequence, timeout)
+            if self.sequence > last_sequence and self.frame is not None:
+                return self.sequence, self.frame
+            return last_sequence, None
+
+    def latest_frame(self, last_sequence):
+        """
+        Obtiene el frame actual sin esperar, si es más nuevo que el indicado
+        :param last_sequence: Último número de secuencia recibido por el cliente
+        :return: Tupla (secuencia, frame) o (last_sequence, None) si no hay uno más nuevo
+        """
+        with self.condition:
+            if self.sequence > last_sequence and self.frame is not None:
+                return self.sequence, self.frame
+            return last_sequence, None
+
+    def cached_jpeg(self, sequence, level=0):
+        """
+        Obtiene el JPEG de un frame sólo si ya está codificado
+        :param sequence: Número de secuencia del frame
+        :param level: Nivel de calidad (índice de self.levels)
+        :return: Bytes JPEG o None si todavía no se codificó
+        """
+        with self.encode_lock:
+            return self.encoded.get((sequence, level))
+
+    def get_jpeg(self, sequence, frame, level=0):
+        """
+        Obtiene el JPEG de un frame, codificándolo sólo la primera vez que se pide
+        :param sequence: Número de secuencia del frame
+        :param frame: Frame anotado correspondiente a la secuencia
+        :param level: Nivel de calidad (índice de self.levels)
+        :return: Bytes JPEG o None si falla la codificación
+        """
+        key = (sequence, level)
+        with self.encode_lock:
+            frame_bytes = self.encoded.get(key)
+            if frame_bytes is None:
+                quality, scale = self.levels[level]
+                frame_bytes = self.encoder.encode(frame, quality=quality, scale=scale)
+                # Sólo se conservan las codificaciones de la secuencia más reciente
+                self.encoded = {k: v for k, v in self.encoded.items() if k[0] >= sequence}
+                self.encoded[key] = frame_bytes
+            return frame_bytes
+
+    def _adapt(self, client):
+        """Sube o baja el nivel de calidad de un cliente según los frames que pierde"""
+        if len(client.window) < self.adapt_window:
+            return
+        skip_rate = client.window_skip_rate()
+        if skip_rate > 0.3 and client.level < len(self.levels) - 1:
+            client.level += 1
+            client.window.clear()
+        elif skip_rate == 0.0 and client.level > 0:
+            client.level -= 1
+            client.window.clear()
+
+    def get_client_stats(self):
+        """
+        Obtiene las estadísticas de todos los clientes conectados
+        :return: Lista de diccionarios, uno por cliente
+        """
+        with self.condition:
+            clients = list(self.clients.values())
+        return [client.get_stats(self.levels) for client in clients]
+
+    def _register(self):
+        """
+        Registra un cliente nuevo
+        :return: StreamClient del cliente
+        """
+        client = StreamClient(next(self.client_ids))
+        with self.condition:
+            self.subscribers += 1
+            self.clients[client.id] = client
+        return client
+
+    def _unregister(self, client):
+        """Da de baja a un cliente desconectado"""
+        with self.condition:
+            self.subscribers -= 1
+            self.clients.pop(client.id, None)
+
+    def _deliver(self, client, frame_bytes, sequence, last_sequence):
+        """
+        Registra el envío de un frame y ajusta la calidad del cliente
+        :param client: StreamClient que recibe el frame
+        :param frame_bytes: Bytes JPEG enviados
+        :param sequence: Secuencia del frame enviado
+        :param last_sequence: Secuencia del frame anterior que recibió el cliente
+        """
+        skipped = sequence - last_sequence - 1 if last_sequence else 0
+        client.record(len(frame_bytes), skipped)
+        if self.adaptive:
+            self._adapt(client)
+
+    def subscribe(self, timeout=1.0):
+        """
+        Generador que entrega los frames codificados a un cliente
+        :param timeout: Tiempo de espera entre comprobaciones cuando no llegan frames
+        :return: Generador de bytes JPEG
+        """
+        client = self._register()
+        try:
+            last_sequence = 0
+            while True:
+                sequence, frame = self.wait_for_frame(last_sequence, timeout)
+                if frame is None:
+                    continue
+                frame_bytes = self.get_jpeg(sequence, frame, client.level)
+                previous, last_sequence = last_sequence, sequence
+                if frame_bytes is None:
+                    continue
+                self._deliver(client, frame_bytes, sequence, previous)
+                yield frame_bytes
+        finally:
+            self._unregister(client)
+
+    async def subscribe_async(self, timeout=1.0):
+        """
+        Versión asíncrona de subscribe para servidores ASGI: la espera no ocupa ningún hilo
+        y la codificación, cuando ningún otro cliente la hizo antes, se ejecuta en un executor
+        :param timeout: Tiempo de espera entre comprobaciones cuando no llegan frames
+        :return: Generador asíncrono de bytes JPEG
+        """
+        loop = asyncio.get_running_loop()
+        client = self._register()
+        try:
+            last_sequence = 0
+            while True:
+                # Tomar el evento antes de comprobar para no perder un aviso intermedio
+                event = self.async_notifier.current()
+                sequence, frame = self.latest_frame(last_sequence)
+                if frame is None:
+                    try:
+                        await asyncio.wait_for(event.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                level = client.level
+                frame_bytes = self.cached_jpeg(sequence, level)
+                if frame_bytes is None:
+                    frame_bytes = await loop.run_in_executor(None, self.get_jpeg, sequence, frame, level)
+                previous, last_sequence = last_sequence, sequence
+                if frame_bytes is None:
+                    continue
+                self._deliver(client, frame_bytes, sequence, previous)
+                yield frame_bytes
+        finally:
+            self._unregister(client)
@@ -0,0 +1,35 @@
+import cv2
+import numpy as np
+import pytest
+from sources import ImageDirectorySource
+
+
+def make_directory(path, count):
+    """Crea una carpeta con count imágenes de un solo color (el color identifica la imagen)"""
+    for value in range(count):
+        cv2.imwrite(str(path / f"{value:02d}.png"), np.full((4, 4, 3), value * 10, dtype=np.uint8))
+    source = ImageDirectorySource(str(path), fps=0)
+    assert source.open()
+    return source
+
+
+def read_values(source, reads, skip):
+    """Lee reads frames descartando skip antes de cada uno y devuelve el color de cada frame"""
+    values = []
+    for _ in range(reads):
+        ok, image = source._read(skip=skip)
+        assert ok
+        values.append(int(image[0, 0, 0]) // 10)
+    return values
+
+
+@pytest.mark.parametrize('count, skip', [(1, 0), (1, 3), (2, 0), (2, 1), (2, 2), (3, 2), (4, 1), (4, 3), (6, 2)])
+def test_small_directory_cycle_covers_every_image(tmp_path, count, skip):
+    source = make_directory(tmp_path, count)
+    assert set(read_values(source, count * 3, skip)) == set(range(count))
+
+
+def test_skip_advances_past_discarded_images(tmp_path):
+    source = make_directory(tmp_path, 5)
+    assert read_values(source, 5, 1) == [0, 2, 4, 1, 3]
+    assert read_values(source, 5, 0) == [0, 1, 2, 3, 4]
@@ -0,0 +1,253 @@
+import time
+import threading
+import itertools
+import cv2
+import numpy as np
+from results import Detections, DETECTION_DTYPE
+
+
+def _opencv_tracker_factory():
+    """
+    Busca un tracker rápido de OpenCV (KCF o CSRT, incluidos en opencv-contrib)
+    :return: Función que crea un tracker, o None si no hay ninguno disponible
+    """
+    for module in (cv2, getattr(cv2, 'legacy', None)):
+        if module is None:
+            continue
+        for name in ('TrackerKCF_create', 'TrackerCSRT_create'):
+            factory = getattr(module, name, None)
+            if factory is not None:
+                return factory
+    return None
+
+
+def iou(box_a, box_b):
+    """
+    Calcula la intersección sobre unión de dos cajas [x1, y1, x2, y2]
+    :return: Valor entre 0.0 y 1.0
+    """
+    x1 = max(box_a[0], box_b[0])
+    y1 = max(box_a[1], box_b[1])
+    x2 = min(box_a[2], box_b[2])
+    y2 = min(box_a[3], box_b[3])
+    intersection = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    area_a = max(0.0, box_a[2] - box_a[0]) * max(0.0, box_a[3] - box_a[1])
+    area_b = max(0.0, box_b[2] - box_b[0]) * max(0.0, box_b[3] - box_b[1])
+    union = area_a + area_b - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+class Track:
+    def __init__(self, track_id, box, label, class_id, score, timestamp):
+        """
+        Objeto seguido entre frames
+        :param track_id: Identificador estable del objeto
+        :param box: Caja [x1, y1, x2, y2] de la última detección
+        :param label: Etiqueta de la detección
+        :param class_id: Id de clase de la detección
+        :param score: Confianza de la detección
+        :param timestamp: Momento (time.time()) de la detección
+        """
+        self.id = track_id
+        self.label = label
+        self.class_id = class_id
+        self.score = score
+        self.detected_box = list(box)
+        self.box = list(box)
+        self.detected_time = timestamp
+        self.velocity = (0.0, 0.0)
+        self.cv_tracker = None
+        self.missed = 0
+
+
+class ObjectTracker:
+    def __init__(self, iou_threshold=0.3, max_missed=1, max_extrapolation=1.0, use_opencv=True):
+        """
+        Sigue las detecciones entre ejecuciones del modelo para mover las cajas en cada frame
+        :param iou_threshold: IoU mínimo para asociar una detección nueva con un objeto existente
+        :param max_missed: Detecciones consecutivas sin encontrar un objeto antes de descartarlo
+        :param max_extrapolation: Segundos máximos que se extrapola el movimiento sin tracker de OpenCV
+        :param use_opencv: Si es True, usa trackers KCF/CSRT de OpenCV cuando están disponibles
+        """
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.max_extrapolation = max_extrapolation
+        self.factory = _opencv_tracker_factory() if use_opencv else None
+        self.tracks = []
+        self.labels = None  # LabelTable de la última detección
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def _seed(self, track, frame):
+        """Inicializa el tracker de OpenCV de un objeto sobre el frame de la detección"""
+        track.cv_tracker = None
+        if self.factory is None or frame is None:
+            return
+        x1, y1, x2, y2 = track.detected_box
+        width, height = int(x2 - x1), int(y2 - y1)
+        if width < 2 or height < 2:
+            return
+        try:
+            cv_tracker = self.factory()
+            cv_tracker.init(frame, (int(x1), int(y1), width, height))
+            track.cv_tracker = cv_tracker
+        except cv2.error:
+            track.cv_tracker = None
+
+    def update(self, detections, frame=None, timestamp=None):
+        """
+        Incorpora una nueva detección del modelo, conservando los identificadores de los objetos ya seguidos
+        :param detections: Detections del modelo
+        :param frame: Frame sobre el que se hizo la detección (para los trackers de OpenCV)
+        :param timestamp: Momento de la detección (por defecto, ahora)
+        """
+        timestamp = timestamp or time.time()
+        boxes = detections.boxes.tolist()
+        labels = detections.labels
+        scores = detections.scores.tolist()
+        class_ids = detections.class_ids.tolist()
+        with self.lock:
+            self.labels = detections.table
+            # Asociación voraz por IoU, de mayor a menor, sólo entre objetos de la misma etiqueta
+            candidates = []
+            for t, track in enumerate(self.tracks):
+                for d, (box, label) in enumerate(zip(boxes, labels)):
+                    if track.label != label:
+                        continue
+                    overlap = iou(track.box, box)
+                    if overlap >= self.iou_threshold:
+                        candidates.append((overlap, t, d))
+            candidates.sort(reverse=True)
+
+            matched_tracks, matched_detections = set(), set()
+            for _, t, d in candidates:
+                if t in matched_tracks or d in matched_detections:
+                    continue
+                matched_tracks.add(t)
+                matched_detections.add(d)
+                track = self.tracks[t]
+                elapsed = timestamp - track.detected_time
+                if elapsed > 0:
+                    old_cx = (track.detected_box[0] + track.detected_box[2]) / 2
+                    old_cy = (track.detected_box[1] + track.detected_box[3]) / 2
+                    new_cx = (boxes[d][0] + boxes[d][2]) / 2
+                    new_cy = (boxes[d][1] + boxes[d][3]) / 2
+                    track.velocity = ((new_cx - old_cx) / elapsed, (new_cy - old_cy) / elapsed)
+                track.detected_box = list(boxes[d])
+                track.box = list(boxes[d])
+                track.detected_time = timestamp
+                track.score = scores[d]
+                track.missed = 0
+                self._seed(track, frame)
+
+            # Objetos que no aparecieron en esta detección
+            survivors = []
+            for t, track in enumerate(self.tracks):
+                if t not in matched_tracks:
+                    track.missed += 1
+                    if track.missed > self.max_missed:
+                        continue
+                survivors.append(track)
+
+            # Detecciones nuevas reciben un identificador nuevo
+            for d, (box, label, class_id, score) in enumerate(zip(boxes, labels, class_ids, scores)):
+                if d in matched_detections:
+                    continue
+                track = Track(next(self.ids), box, label, class_id, score, timestamp)
+                self._seed(track, frame)
+                survivors.append(track)
+
+            self.tracks = survivors
+
+    def refilter(self, detections):
+        """
+        Ajusta los objetos seguidos a un nuevo umbral de confianza sin ejecutar el modelo:
+        se descartan los que quedan por debajo y se añaden los que ahora lo superan
+        (quietos en su última posición hasta la próxima detección)
+        :param detections: Detections de la última detección, filtradas con el nuevo umbral
+        """
+        timestamp = time.time()
+        threshold = detections.threshold
+        boxes = detections.boxes.tolist()
+        labels = detections.labels
+        scores = detections.scores.tolist()
+        class_ids = detections.class_ids.tolist()
+        with self.lock:
+            if detections.table is not None:
+                self.labels = detections.table
+            if threshold is not None:
+                self.tracks = [track for track in self.tracks if track.score > threshold]
+            for box, label, class_id, score in zip(boxes, labels, class_ids, scores):
+                if any(track.label == label and iou(track.detected_box, box) >= self.iou_threshold
+                       for track in self.tracks):
+                    continue
+                self.tracks.append(Track(next(self.ids), box, label, class_id, score, timestamp))
+
+    def step(self, frame):
+        """
+        Actualiza la posición de los objetos en un frame nuevo sin ejecutar el modelo
+        :param frame: Imagen de OpenCV (numpy array en formato BGR)
+        """
+        now = time.time()
+        with self.lock:
+            if not self.tracks or frame is None:
+                return
+            height, width = frame.shape[:2]
+            for track in self.tracks:
+                if track.cv_tracker is not None:
+                    ok, (x, y, w, h) = track.cv_tracker.update(frame)
+                    if ok:
+                        track.box = [float(x), float(y), float(x + w), float(y + h)]
+                        continue
+                    # El tracker perdió el objeto: seguir con la extrapolación
+                    track.cv_tracker = None
+
+                # Extrapolación lineal a partir de la velocidad entre las dos últimas detecciones
+                elapsed = min(now - track.detected_time, self.max_extrapolation)
+                dx, dy = track.velocity[0] * elapsed, track.velocity[1] * elapsed
+                x1, y1, x2, y2 = track.detected_box
+                track.box = [
+                    min(max(x1 + dx, 0.0), width),
+                    min(max(y1 + dy, 0.0), height),
+                    min(max(x2 + dx, 0.0), width),
+                    min(max(y2 + dy, 0.0), height)
+                ]
+
+    def reset(self):
+        """Descarta todos los objetos seguidos"""
+        with self.lock:
+            self.tracks = []
+
+    def get_tracks(self):
+        """
+        Obtiene los objetos seguidos actualmente
+        :return: Lista de diccionarios con id, etiqueta, caja y confianza
+        """
+        with self.lock:
+            return [{
+                'id': track.id,
+                'label': track.label,
+                'box': list(track.box),
+                'score': track.score
+            } for track in self.tracks]
+
+    def get_detections(self):
+        """
+        Obtiene la posición actual de los objetos seguidos en el mismo formato que el modelo
+        :return: Tupla (Detections, lista de ids de seguimiento)
+        """
+        with self.lock:
+            array = np.empty(len(self.tracks), dtype=DETECTION_DTYPE)
+            if self.tracks:
+                array['box'] = [track.box for track in self.tracks]
+                array['score'] = [track.score for track in self.tracks]
+                array['class_id'] = [track.class_id for track in self.tracks]
+            return Detections(array, self.labels), [track.id for track in self.tracks]
+
+    def person_count(self):
+        """
+        Cuenta las personas seguidas actualmente
+        :return: Número de objetos con etiqueta 'person'
+        """
+        with self.lock:
+            return sum(1 for track in self.tracks if track.label.lower() == 'person')